@@ -0,0 +1,102 @@
+import logging
+
+# The columns of assembly_summary.txt when it has no header line
+DEFAULT_COLUMNS = [
+    'assembly_accession', 'bioproject', 'biosample', 'wgs_master',
+    'refseq_category', 'taxid', 'species_taxid', 'organism_name',
+    'infraspecific_name', 'isolate', 'version_status', 'assembly_level',
+    'release_type', 'genome_rep', 'seq_rel_date', 'asm_name', 'submitter',
+    'gbrs_paired_asm', 'paired_asm_comp', 'ftp_path',
+    'excluded_from_refseq', 'relation_to_type_material']
+
+
+class AssemblySummary():
+    """Read the assemblies of an NCBI assembly_summary.txt that pass filters
+
+    The file is read one line at a time and the columns are found by
+    the header line, so memory use does not grow with the file. A filter
+    maps a column either to the list of values accepted or to a range
+    given by min and/or max, both included. Values are compared as
+    numbers when both sides are numbers, as text otherwise; dates are in
+    the YYYY/MM/DD form of NCBI and compare as text. For example:
+        refseq_category: ["reference genome", "representative genome"]
+        seq_rel_date: {min: "2015/01/01"}
+        genome_size: {max: 10000000}
+    """
+
+    def __init__(self, filters=None):
+        """Initialize the object
+
+        Args:
+            filters (dict): column name to accepted values or range
+        """
+        self.filters = []
+        for column, condition in (filters or {}).items():
+            if isinstance(condition, dict):
+                unknown = set(condition) - set(['min', 'max'])
+                if unknown:
+                    raise ValueError('Unknown bounds {} of filter {}'
+                                     .format(sorted(unknown), column))
+                self.filters.append((column, None, condition.get('min'),
+                                     condition.get('max')))
+            else:
+                if not isinstance(condition, list):
+                    condition = [condition]
+                values = set(str(value) for value in condition)
+                self.filters.append((column, values, None, None))
+
+    @staticmethod
+    def compare(value, bound):
+        """-1, 0 or 1 as value is below, at or above bound"""
+        try:
+            value, bound = float(value), float(bound)
+        except ValueError:
+            value, bound = value, str(bound)
+        return (value > bound) - (value < bound)
+
+    def match(self, entry):
+        """Whether an assembly passes all the filters"""
+        for column, values, low, high in self.filters:
+            value = entry[column]
+            if values is not None:
+                if value not in values:
+                    return False
+                continue
+            if value in ('', 'na'):
+                return False
+            if low is not None and self.compare(value, low) < 0:
+                return False
+            if high is not None and self.compare(value, high) > 0:
+                return False
+        return True
+
+    def read(self, assembly_file):
+        """Yield the assemblies that pass the filters
+
+        Return:
+            A generator of dictionaries of column name to value
+        """
+        columns = DEFAULT_COLUMNS
+        checked = False
+        with open(assembly_file, 'r') as fp:
+            for line in fp:
+                if line.startswith('#'):
+                    names = line.lstrip('#').strip().split('\t')
+                    if 'assembly_accession' in names:
+                        columns = names
+                    continue
+                if not checked:
+                    missing = [f[0] for f in self.filters
+                               if f[0] not in columns]
+                    if missing:
+                        raise ValueError('No column {} in {}'
+                                         .format(missing, assembly_file))
+                    checked = True
+                line_items = line.rstrip('\n').split('\t')
+                if len(line_items) < len(columns):
+                    logging.warning('Skipping a short line of {}'
+                                    .format(assembly_file))
+                    continue
+                entry = dict(zip(columns, line_items))
+                if self.match(entry):
+                    yield entry
@@ -0,0 +1,237 @@
+import os
+import asyncio
+import logging
+from hashlib import md5
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AsyncDownloader():
+    """Download many files at once on an asyncio event loop
+
+    download_a_file keeps the contract of NcbiData.download_a_file: the
+    file is streamed to file_name.part, renamed once complete and its
+    mode set to file_mode. At most max_requests files are fetched at
+    once by as many workers taking them from a queue, and at most
+    max_per_host of them from the same host. The event loop only waits
+    on the network: writing, hashing and checking files run on a pool
+    of io_workers threads.
+    aiohttp is imported only when the asyncio backend is selected.
+    """
+
+    def __init__(self, chunk_size, file_mode, max_requests=200,
+                 max_per_host=50, login_url=None, login_data=None,
+                 io_workers=4):
+        """Initialize the object
+
+        Args:
+            chunk_size (int): the size of the chunks written to disk
+            file_mode (int): the mode of the downloaded files
+            max_requests (int): requests in flight over all hosts
+            max_per_host (int): requests in flight to a single host
+            login_url (string): posted login_data once per session
+            login_data (dict): the account used to login
+            io_workers (int): threads writing and checking the files
+        """
+        self.chunk_size = chunk_size
+        self.file_mode = file_mode
+        self.max_requests = max(max_requests, 1)
+        self.max_per_host = max_per_host
+        self.login_url = login_url
+        self.login_data = login_data
+        self.io_workers = max(io_workers, 1)
+        self.loop = None
+        self.session = None
+        self.executor = None
+
+    def run(self, coroutine):
+        """Run a coroutine on the event loop of the downloader"""
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+        return self.loop.run_until_complete(coroutine)
+
+    def close(self):
+        """Close the session, the event loop and the io threads"""
+        if self.loop is None:
+            return
+        if self.session is not None:
+            self.run(self.session.close())
+            self.session = None
+        self.loop.close()
+        self.loop = None
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    async def run_blocking(self, function, *args):
+        """Run a function that blocks on disk or CPU on an io thread"""
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.io_workers)
+        return await self.loop.run_in_executor(self.executor, function,
+                                               *args)
+
+    async def get_session(self):
+        """Create the session on first use and login if required"""
+        if self.session is None:
+            import aiohttp
+            connector = aiohttp.TCPConnector(
+                            limit=self.max_requests,
+                            limit_per_host=self.max_per_host)
+            # Files are written as served; .gz files must stay zipped
+            self.session = aiohttp.ClientSession(
+                            connector=connector, auto_decompress=False,
+                            headers={'Accept-Encoding': 'identity'})
+            if self.login_url:
+                try:
+                    async with self.session.post(self.login_url,
+                                                 data=self.login_data):
+                        pass
+                except Exception as e:
+                    logging.error('Error connecting to login_url {}: {}'
+                                  .format(self.login_url, e))
+        return self.session
+
+    def download_files(self, file_list, compute_md5=False, check=None):
+        """Download files concurrently
+
+        Args:
+            file_list (list): (file name, file address) pairs
+            compute_md5 (bool): hash the files while they are written
+            check (function): called on an io thread with the file name,
+                the file address and the result of download_a_file once
+                a file is downloaded; its return value is the result of
+                the file
+        Return:
+            The results of the files in the order of file_list
+        """
+        if not file_list:
+            return []
+        return self.run(self.download_all(file_list, compute_md5, check))
+
+    def fetch_texts(self, urls):
+        """Fetch small text files, such as md5 files, into memory
+
+        Return:
+            The contents in the order of urls; None for a failed fetch
+        """
+        if not urls:
+            return []
+        return self.run(self.fetch_all(urls))
+
+    async def download_all(self, file_list, compute_md5, check):
+        session = await self.get_session()
+        return await self.run_queue(
+                    [partial(self.download_checked, session, file_name,
+                             file_address, compute_md5, check)
+                     for file_name, file_address in file_list])
+
+    async def fetch_all(self, urls):
+        session = await self.get_session()
+        return await self.run_queue(
+                    [partial(self.fetch_text, session, url) for url in urls])
+
+    # Only max_requests coroutines exist at a time, however many files
+    # are queued
+    async def run_queue(self, jobs):
+        """Run coroutine functions by max_requests workers
+
+        Args:
+            jobs (list): functions called without arguments, returning
+                a coroutine
+        Return:
+            The results of the coroutines in the order of jobs
+        """
+        results = [None] * len(jobs)
+        queue = asyncio.Queue()
+        for i in range(len(jobs)):
+            queue.put_nowait(i)
+        await asyncio.gather(
+            *[self.queue_worker(queue, jobs, results)
+              for i in range(min(self.max_requests, len(jobs)))])
+        return results
+
+    async def queue_worker(self, queue, jobs, results):
+        """Run the jobs taken from queue until it is empty"""
+        while not queue.empty():
+            i = queue.get_nowait()
+            results[i] = await jobs[i]()
+
+    async def download_checked(self, session, file_name, file_address,
+                               compute_md5, check):
+        """Download a file, then pass it to check on an io thread"""
+        result = await self.download_a_file(session, file_name,
+                                            file_address, compute_md5)
+        if check is None:
+            return result
+        try:
+            return await self.run_blocking(check, file_name, file_address,
+                                           result)
+        except Exception as e:
+            logging.exception('Failed to check {}: {}'.format(file_name, e))
+            return False
+
+    async def fetch_text(self, session, url):
+        """Get the content of a text file; None if it failed"""
+        try:
+            async with session.get(url) as res:
+                res.raise_for_status()
+                return await res.text(encoding='utf-8')
+        except Exception as e:
+            logging.error('Failed to fetch {}: {}'.format(url, e))
+            return None
+
+    @staticmethod
+    def write_chunk(output, chunk, md5_hash):
+        output.write(chunk)
+        if md5_hash is not None:
+            md5_hash.update(chunk)
+
+    def finish_file(self, part_name, file_name):
+        os.replace(part_name, file_name)
+        os.chmod(file_name, self.file_mode)
+
+    @staticmethod
+    def remove_part(part_name):
+        if os.path.isfile(part_name):
+            os.remove(part_name)
+
+    async def download_a_file(self, session, file_name, file_address,
+                              compute_md5=False):
+        """Download a file by aiohttp
+
+        Args:
+            session (object): aiohttp session
+            file_name (string): the name of the file downloaded
+            file_address (string): the link to the file needed to be download
+            compute_md5 (bool): hash the file while it is written
+        Return:
+            False if the download failed; otherwise the md5 code of the
+            file if compute_md5 is set, True if not
+        """
+        part_name = file_name + '.part'
+        md5_hash = md5() if compute_md5 else None
+        try:
+            async with session.get(file_address) as res:
+                res.raise_for_status()
+                total_size = 0
+                output = await self.run_blocking(open, part_name, 'wb')
+                try:
+                    async for chunk in res.content.iter_chunked(
+                            self.chunk_size):
+                        await self.run_blocking(self.write_chunk, output,
+                                                chunk, md5_hash)
+                        total_size += len(chunk)
+                finally:
+                    await self.run_blocking(output.close)
+                expected = res.headers.get('Content-Length')
+                if expected is not None and int(expected) != total_size:
+                    raise IOError('got {} of {} bytes'
+                                  .format(total_size, expected))
+            await self.run_blocking(self.finish_file, part_name, file_name)
+        except Exception as e:
+            logging.error('Failed to download {}: {}'.format(file_name, e))
+            await self.run_blocking(self.remove_part, part_name)
+            return False
+        if md5_hash is not None:
+            return md5_hash.hexdigest()
+        return True
@@ -1,15 +1,133 @@
 import yaml
 import os
+import re
 import shutil
 import logging.config
 import datetime
 import tarfile
 import gzip
 import zipfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from distutils.dir_util import copy_tree
 from pathlib import Path
 from hashlib import md5
 from datetime import timedelta
 from site import abs_paths
+from brdm.DownloadCache import DownloadCache
+from brdm.DownloadState import DownloadState
+from brdm.SessionPool import SessionPool
+
+# Size of the blocks read when copying or hashing a file
+# (default of checksum_buffer_size)
+CHUNK_SIZE = 1024 * 1024
+# With atomic_swap, every update is a folder in GENERATIONS_FOLDER and
+# CURRENT_LINK points to the one in use
+GENERATIONS_FOLDER = 'generations'
+CURRENT_LINK = 'current'
+# md5 and README files are always small: they are not worth the HEAD
+# request of a segmented download
+SMALL_FILE_RE = re.compile(r'\.md5$|md5checksums\.txt$|readme', re.I)
+
+
+# The files of a new generation are hard links to those in use until
+# replaced; a file is extracted as a new file, never written into
+def extract_tar(tar, path='.'):
+    """Extract the members of an open tar file into path
+
+    An existing file is removed before its member is extracted, so that
+    the other links to it keep their content. Archives may be extracted
+    before their md5 code is checked, so only files and folders within
+    path are extracted; links, devices and members leading out of path
+    are refused.
+    Return:
+        The members extracted
+    Raise:
+        ValueError if a member is refused
+    """
+    root = os.path.realpath(path)
+    members = []
+    for member in tar:
+        if not (member.isfile() or member.isdir()):
+            raise ValueError('Refusing to extract {}: not a file or a folder'
+                             .format(member.name))
+        target = os.path.realpath(os.path.join(root, member.name))
+        if os.path.commonpath([root, target]) != root:
+            raise ValueError('Refusing to extract {}: outside of {}'
+                             .format(member.name, root))
+        if member.isfile() and os.path.isfile(target):
+            os.remove(target)
+        if hasattr(tarfile, 'data_filter'):
+            tar.extract(member, path=path, filter='data')
+        else:
+            tar.extract(member, path=path)
+        members.append(member)
+    return members
+
+
+class HashingReader():
+    """A file-like wrapper hashing and counting the bytes read through it"""
+
+    def __init__(self, stream, md5_hash):
+        """Initialize the object"""
+        self.stream = stream
+        self.md5_hash = md5_hash
+        self.size = 0
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.md5_hash.update(data)
+        self.size += len(data)
+        return data
+
+    def drain(self):
+        """Read what is left of the stream, such as the tar padding"""
+        while self.read(CHUNK_SIZE):
+            pass
+
+
+class RangeHasher():
+    """Hash a file written as concurrent byte ranges, in file order
+
+    A chunk written at the next offset to hash is hashed from memory;
+    chunks written further on are recorded and read back from the file
+    once the bytes before them are hashed, while they are still in the
+    page cache, so the file is not read again from disk once complete.
+    """
+
+    def __init__(self, fd, md5_hash):
+        """Initialize the object
+
+        Args:
+            fd (int): the file descriptor the ranges are written to
+            md5_hash (object): a hashlib md5 object
+        """
+        self.fd = fd
+        self.md5_hash = md5_hash
+        self.position = 0
+        # Start to end of the chunks written past position
+        self.written = {}
+        self.lock = threading.Lock()
+
+    def update(self, chunk, start):
+        """Record a chunk just written at offset start"""
+        with self.lock:
+            if start == self.position:
+                self.md5_hash.update(chunk)
+                self.position += len(chunk)
+            else:
+                self.written[start] = start + len(chunk)
+            while self.position in self.written:
+                end = self.written.pop(self.position)
+                while self.position < end:
+                    data = os.pread(self.fd,
+                                    min(CHUNK_SIZE, end - self.position),
+                                    self.position)
+                    if not data:
+                        raise IOError('Failed to read back offset {}'
+                                      .format(self.position))
+                    self.md5_hash.update(data)
+                    self.position += len(data)
 
 
 class BaseRefData():
@@ -23,6 +141,30 @@ class BaseRefData():
         self.sleep_time = self.config['sleep_time']
         self.folder_mode = int(self.config['folder_mode'], 8)
         self.file_mode = int(self.config['file_mode'], 8)
+        # Every checksum thread owns one buffer of checksum_buffer_size,
+        # which caps the memory used to hash files
+        self.checksum_workers = self.config.get('checksum_workers', 4)
+        self.checksum_buffer_size = \
+            self.config.get('checksum_buffer_size', CHUNK_SIZE)
+        self.checksum_buffers = threading.local()
+        # Skip an update when none of its downloads changed upstream
+        self.conditional_update = self.config.get('conditional_update', False)
+        self.download_cache = None
+        # Progress of an unfinished update, kept in the temp folder
+        self.download_state_file = \
+            self.config.get('download_state_file', '.download_state.sqlite')
+        self.download_state = None
+        # Promote updates by flipping a symlink instead of copying
+        self.atomic_swap = self.config.get('atomic_swap', False)
+        self.keep_generations = self.config.get('keep_generations', 2)
+        # Connections kept open to each host by the shared session pool
+        self.http_pool_size = self.config.get('http_pool_size', 10)
+        # Large files are fetched as download_segments byte ranges at once,
+        # each of at least min_segment_size bytes; data sources may
+        # override both in their own section
+        self.download_segments = self.config.get('download_segments', 1)
+        self.min_segment_size = \
+            self.config.get('min_segment_size', 64 * CHUNK_SIZE)
         logging.config.dictConfig(self.config['logging'])
         try:
             self.destination_dir = os.path.abspath(self.config['root_folder'])
@@ -77,6 +219,8 @@ class BaseRefData():
         if filename_in.endswith('.gz') and not filename_in.endswith('tar.gz'):
             try:
                 filename_out = filename_in[:-3]
+                if os.path.isfile(filename_out):
+                    os.remove(filename_out)
                 with gzip.open(filename_in, 'rb') as f_in, \
                         open(filename_out, 'wb') as f_out:
                     shutil.copyfileobj(f_in, f_out)
@@ -89,7 +233,7 @@ class BaseRefData():
         if filename_in.endswith('tar.gz'):
             try:
                 with tarfile.open(filename_in, 'r:gz') as tar:
-                    tar.extractall()
+                    extract_tar(tar)
                 self.delete_file(filename_in)
             except Exception as e:
                 logging.exception('Failed to exctract file {}. Error: {}'
@@ -117,8 +261,13 @@ class BaseRefData():
                               .format(full_file_name, e))
 
     def write_readme(self, download_url, downloaded_files,
-                     download_failed_files=[], comment='', execution_time=0):
-        """Write information to application read me file"""
+                     download_failed_files=[], comment='', execution_time=0,
+                     sections=None):
+        """Write information to application read me file
+
+        sections is a list of (title, lines) written after the lists of
+        files; every title ends with a colon like the titles of the lists.
+        """
         file_name = self.config['readme_file']
         try:
             with open(file_name, 'w') as f:
@@ -140,6 +289,10 @@ class BaseRefData():
                     f.write('List of files that failed to be downloaded: \n')
                     for file in download_failed_files:
                         f.write('{}\n'.format(file))
+                for title, lines in sections or []:
+                    f.write('{}: \n'.format(title))
+                    for line in lines:
+                        f.write('{}\n'.format(line))
             os.chmod(file_name, self.file_mode)
         except Exception as e:
             logging.exception('Failed to write_readme. Error: {}'
@@ -150,20 +303,254 @@ class BaseRefData():
                      .format(file_name))
         return True
 
-    def check_md5(self, file_name, md5_check):
-        """Checksum md5"""
+    # Copy a stream into an opened file, optionally hashing what is written
+    def write_stream(self, stream, output, md5_hash=None):
+        """Copy a file-like stream into output in chunks
+
+        Args:
+            stream (object): a file-like object opened for reading bytes
+            output (object): a file opened for writing bytes
+            md5_hash (object): a hashlib md5 object updated with every chunk
+        """
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            output.write(chunk)
+            if md5_hash is not None:
+                md5_hash.update(chunk)
+
+    def read_segment_config(self, section):
+        """Override the segmented download settings by a config section"""
+        self.download_segments = \
+            section.get('download_segments', self.download_segments)
+        self.min_segment_size = \
+            section.get('min_segment_size', self.min_segment_size)
+
+    def segments_wanted(self, file_name):
+        """Whether a new download of file_name may be fetched in segments"""
+        return self.download_segments > 1 and \
+            not SMALL_FILE_RE.search(os.path.basename(file_name))
+
+    # Fetch a large file over several connections at once
+    def download_segmented(self, file_address, part_name, session_requests,
+                           md5_hash=None):
+        """Download a file as concurrent byte ranges
+
+        The file is split into at most download_segments ranges of at
+        least min_segment_size bytes if the server accepts ranges. Each
+        range is written at its own offset of the preallocated part_name
+        and hashed in file order as it arrives, see RangeHasher.
+        Args:
+            file_address (string): the link to the file needed to be download
+            part_name (string): the file the content is written to
+            session_requests (object): requests session
+            md5_hash (object): a hashlib md5 object updated with the file
+        Return:
+            The response to the HEAD request if the file was downloaded
+            in segments; None if it is too small or ranges are not
+            supported. An exception is raised if a segment failed, and
+            part_name is removed.
+        """
+        headers = {'Accept-Encoding': 'identity'}
+        res = session_requests.head(file_address, headers=headers,
+                                    allow_redirects=True)
+        size = res.headers.get('Content-Length')
+        if res.status_code != 200 or size is None or \
+                res.headers.get('Accept-Ranges') != 'bytes':
+            return None
+        size = int(size)
+        segments = min(self.download_segments,
+                       size // max(self.min_segment_size, 1))
+        if segments < 2:
+            return None
+        segment_size = -(-size // segments)
+        ranges = [(start, min(start + segment_size, size) - 1)
+                  for start in range(0, size, segment_size)]
+        logging.info('Downloading {} in {} segments'
+                     .format(file_address, len(ranges)))
+        fd = os.open(part_name, os.O_RDWR | os.O_CREAT | os.O_TRUNC,
+                     self.file_mode)
+        hasher = RangeHasher(fd, md5_hash) if md5_hash is not None else None
+        try:
+            if hasattr(os, 'posix_fallocate'):
+                os.posix_fallocate(fd, 0, size)
+            else:
+                os.ftruncate(fd, size)
+            with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+                futures = [executor.submit(self.download_range, file_address,
+                                           session_requests, fd, start, end,
+                                           hasher)
+                           for start, end in ranges]
+                for future in futures:
+                    future.result()
+        except Exception:
+            os.close(fd)
+            os.remove(part_name)
+            raise
+        os.close(fd)
+        return res
+
+    def download_range(self, file_address, session_requests, fd, start, end,
+                       hasher=None):
+        """Write the bytes start to end of a file at the same offsets of fd
+
+        Every chunk written is passed to hasher, a RangeHasher, if given.
+        """
+        headers = {'Accept-Encoding': 'identity',
+                   'Range': 'bytes={}-{}'.format(start, end)}
+        res = session_requests.get(file_address, stream=True,
+                                   headers=headers)
+        try:
+            content_range = res.headers.get('Content-Range', '')
+            if res.status_code != 206 or not content_range.startswith(
+                    'bytes {}-{}/'.format(start, end)):
+                raise IOError('Range {}-{} of {} not served: {}'
+                              .format(start, end, file_address,
+                                      res.status_code))
+            position = start
+            for chunk in res.iter_content(chunk_size=CHUNK_SIZE):
+                if chunk:
+                    os.pwrite(fd, chunk, position)
+                    if hasher is not None:
+                        hasher.update(chunk, position)
+                    position += len(chunk)
+            if position != end + 1:
+                raise IOError('Incomplete range {}-{} of {}: {} bytes'
+                              .format(start, end, file_address,
+                                      position - start))
+        finally:
+            res.close()
+
+    def hash_file(self, file_name, md5_hash=None):
+        """Feed the content of a file into an md5 object chunk by chunk
+
+        The file is read into a buffer that is allocated once per thread,
+        so hashing uses checksum_buffer_size bytes whatever the file size.
+        Args:
+            file_name (string): the file to be hashed
+            md5_hash (object): a hashlib md5 object; a new one if not given
+        Return:
+            The md5 object
+        """
+        if md5_hash is None:
+            md5_hash = md5()
+        buffer = getattr(self.checksum_buffers, 'buffer', None)
+        if buffer is None:
+            buffer = bytearray(self.checksum_buffer_size)
+            self.checksum_buffers.buffer = buffer
+        view = memoryview(buffer)
+        with open(file_name, 'rb', buffering=0) as file_data:
+            while True:
+                size = file_data.readinto(buffer)
+                if not size:
+                    break
+                md5_hash.update(view[:size])
+        return md5_hash
+
+    def check_md5(self, file_name, md5_check, md5_real=None):
+        """Checksum md5
+
+        Args:
+            file_name (string): the file to be checked
+            md5_check (string): the expected md5 code
+            md5_real (string): the md5 code computed while downloading
+                the file; the file is read only if it is not given
+        Return:
+            True if the md5 codes match; otherwise False
+        """
         if not md5_check:
             logging.error('Empty md5_code. Failed to check md5')
             return False
+        if md5_real:
+            return md5_check == md5_real
         try:
-            with open(file_name, 'rb') as file_data:
-                md5_real = md5(file_data.read()).hexdigest()
+            md5_real = self.hash_file(file_name).hexdigest()
         except Exception as e:
             logging.exception('Failed to check_md5. Error: {}'
                               .format(file_name, e))
             return False
         return md5_check == md5_real
 
+    # Verify many files at once; hashlib releases the GIL while hashing
+    def check_md5_batch(self, md5_list):
+        """Checksum md5 of many files on a pool of threads
+
+        Args:
+            md5_list (list): pairs of (file_name, md5_code)
+        Return:
+            A list of the files that failed the check
+        """
+        md5_list = list(md5_list)
+        failed = []
+        with ThreadPoolExecutor(
+                max_workers=self.checksum_workers) as executor:
+            results = executor.map(
+                lambda item: self.check_md5(item[0], item[1]), md5_list)
+            for (file_name, md5_code), md5_ok in zip(md5_list, results):
+                if not md5_ok:
+                    failed.append(file_name)
+        return failed
+
+    def get_session(self, url):
+        """The process-wide session for the host of url"""
+        return SessionPool.get_session(url, self.http_pool_size)
+
+    # The download cache is kept in the backup folder of the data source
+    # so that it survives the clean up of the destination folder
+    def get_download_cache(self):
+        """The download cache of the data source, loaded on first use"""
+        if self.download_cache is None:
+            cache_file = os.path.join(
+                self.backup_dir,
+                self.config.get('download_cache_file', '.download_cache.json'))
+            self.download_cache = DownloadCache(cache_file)
+        return self.download_cache
+
+    def record_download(self, file_address, response, size=None):
+        """Record the validators of a download if the cache is in use
+
+        With conditional_update, update() loads the cache before checking
+        for changes, so that the downloads of a first update are recorded.
+        """
+        if self.download_cache is not None:
+            self.download_cache.record(file_address, response.headers, size)
+
+    # Conditional requests for all the files of an update
+    def inputs_unchanged(self, urls, session_requests):
+        """Check whether the files to download changed since the last update
+
+        A HEAD request with If-None-Match/If-Modified-Since is sent for
+        each url; the data are unchanged only if every url is unchanged
+        and the last update left its README+ in the destination folder.
+        Args:
+            urls (list): the links to the files of the data source
+            session_requests (object): requests session
+        Return:
+            True if nothing changed; otherwise False
+        """
+        readme_file = os.path.join(self.live_dir(),
+                                   self.config['readme_file'])
+        if not os.path.isfile(readme_file):
+            return False
+        cache = self.get_download_cache()
+        try:
+            for url in urls:
+                headers = cache.conditional_headers(url)
+                if headers is None:
+                    return False
+                res = session_requests.head(url, headers=headers,
+                                            allow_redirects=True)
+                if not cache.is_unchanged(url, res):
+                    logging.info('{} changed since the last update'
+                                 .format(url))
+                    return False
+        except Exception as e:
+            logging.warning('Failed to check the files for changes: {}'
+                            .format(e))
+            return False
+        return True
+
     # All backup dirs are named as date: yyyy-mm-dd.
     # They will be placed in appropriate sub-folder
     def create_backup_dir(self):
@@ -182,14 +569,26 @@ class BaseRefData():
 
     # Create an intermediate dir for holding updated new data
     # The data will be move to destination dir if download successful
+    # Partial downloads (*.part) of an earlier run are kept for resuming
     def create_tmp_dir(self, destination_path):
         """Create an intermediate dir for holding new data"""
         try:
             # temp_dir = tempfile.mkdtemp(dir = self.destination_dir )
             temp_dir = os.path.join(destination_path, 'temp')
-            if os.path.exists(temp_dir):
-                shutil.rmtree(temp_dir)
-            os.makedirs(temp_dir)
+            if not os.path.exists(temp_dir):
+                os.makedirs(temp_dir)
+            state_file = os.path.join(temp_dir, self.download_state_file)
+            if os.path.isfile(state_file):
+                logging.info('Resuming the unfinished update in {}'
+                             .format(temp_dir))
+                os.chdir(temp_dir)
+                return temp_dir
+            for f in os.listdir(temp_dir):
+                full_name = os.path.join(temp_dir, f)
+                if os.path.isdir(full_name):
+                    shutil.rmtree(full_name)
+                elif not f.endswith('.part'):
+                    os.remove(full_name)
             os.chdir(temp_dir)
         except Exception as e:
             logging.error('Failed to create the temp_dir: {}, error{}'
@@ -197,13 +596,46 @@ class BaseRefData():
             return False
         return temp_dir
 
+    # The state of an update is kept until its files are promoted, so
+    # that a run killed on the way resumes with the files it had
+    def open_download_state(self, temp_dir):
+        """Open the download state of the update in temp_dir"""
+        self.download_state = DownloadState(
+            os.path.join(temp_dir, self.download_state_file))
+        planned, verified, extracted = self.download_state.progress()
+        if planned:
+            logging.info('Download state: {} files planned, {} verified, '
+                         '{} extracted'.format(planned, verified, extracted))
+        return self.download_state
+
+    def close_download_state(self):
+        """Close the download state; its file stays with the update"""
+        if self.download_state is not None:
+            self.download_state.close()
+            self.download_state = None
+
+    # A promotion that fails leaves the update in temp_dir with its
+    # state, so the state file is removed only once the update is live
+    def finish_download_state(self):
+        """Remove the download state of an update that was promoted"""
+        self.close_download_state()
+        state_file = os.path.join(self.live_dir(), self.download_state_file)
+        try:
+            if os.path.isfile(state_file):
+                os.remove(state_file)
+        except Exception as e:
+            logging.error('Failed to remove download state {}: {}'
+                          .format(state_file, e))
+            return False
+        return True
+
     # Clean old files in the destination dir; Temp folder CANNOT be removed
     def clean_destination_dir(self, destination_path):
         """Remove old files in destination directory"""
         try:
             os.chdir(destination_path)
             for f in os.listdir('.'):
-                if os.path.isfile(f):
+                if os.path.isfile(f) or os.path.islink(f):
                     os.remove(f)
                 if os.path.isdir(f) and f != 'temp':
                     shutil.rmtree(f)
@@ -213,6 +645,167 @@ class BaseRefData():
             return False
         return True
 
+    def live_dir(self):
+        """The folder holding the data in use"""
+        current = os.path.join(self.destination_dir, CURRENT_LINK)
+        if self.atomic_swap and os.path.isdir(current):
+            return current
+        return self.destination_dir
+
+    # Put the data of an update in place of the data in use
+    def promote(self, temp_dir, prepare=None):
+        """Replace the live data by the content of temp_dir
+
+        With atomic_swap, temp_dir is renamed into a new generation that
+        goes live by replacing the current symlink, so readers see either
+        the old data or the new data and nothing is copied. Otherwise the
+        destination folder is emptied and temp_dir is copied into it.
+        Args:
+            temp_dir (string): the intermediate folder
+            prepare (function): called with the folder of the new data,
+                before it goes live with atomic_swap or after it is
+                copied without; returns True on success
+        Return:
+            True if the new data are in place; otherwise False
+        """
+        if not self.atomic_swap:
+            clean_ok = self.clean_destination_dir(self.destination_dir)
+            if not clean_ok:
+                return False
+            try:
+                copy_tree(temp_dir, self.destination_dir)
+                shutil.rmtree(temp_dir)
+            except Exception as e:
+                logging.error('Failed to move files from temp_dir to \
+                \ndestination folder, error{}'.format(e))
+                return False
+            return prepare is None or prepare(self.destination_dir)
+        generation_dir = self.stage_generation(temp_dir)
+        if not generation_dir:
+            return False
+        if prepare is not None and not prepare(generation_dir):
+            logging.error('Failed to prepare {}; the current data are kept'
+                          .format(generation_dir))
+            # Out of the generations, so that a rollback never reaches it
+            try:
+                os.rename(generation_dir, temp_dir)
+            except Exception as e:
+                logging.error('Failed to move {} back to {}: {}'
+                              .format(generation_dir, temp_dir, e))
+            return False
+        if not self.activate_generation(generation_dir):
+            return False
+        self.prune_generations()
+        return True
+
+    def list_generations(self):
+        """The generation folders, oldest first"""
+        generations = os.path.join(self.destination_dir, GENERATIONS_FOLDER)
+        if not os.path.isdir(generations):
+            return []
+        return sorted(os.path.normpath(os.path.join(generations, f))
+                      for f in os.listdir(generations)
+                      if os.path.isdir(os.path.join(generations, f)))
+
+    def current_generation(self):
+        """The generation current points to; None if there is none"""
+        current = os.path.join(self.destination_dir, CURRENT_LINK)
+        if not os.path.islink(current):
+            return None
+        return os.path.normpath(
+            os.path.join(self.destination_dir, os.readlink(current)))
+
+    def stage_generation(self, temp_dir):
+        """Rename the intermediate folder into a new generation"""
+        generations = os.path.join(self.destination_dir, GENERATIONS_FOLDER)
+        # Names sort in the order the generations are created
+        generation_dir = os.path.join(
+            generations,
+            datetime.datetime.now().strftime('%Y-%m-%d_%H%M%S_%f'))
+        try:
+            if not os.path.exists(generations):
+                os.makedirs(generations, mode=self.folder_mode)
+            os.chdir(self.destination_dir)
+            os.rename(temp_dir, generation_dir)
+            os.chmod(generation_dir, self.folder_mode)
+        except Exception as e:
+            logging.error('Failed to stage {} as a new generation: {}'
+                          .format(temp_dir, e))
+            return False
+        return generation_dir
+
+    def activate_generation(self, generation_dir):
+        """Point the current symlink to a generation in one rename"""
+        current = os.path.join(self.destination_dir, CURRENT_LINK)
+        new_link = current + '.new'
+        try:
+            if os.path.lexists(new_link):
+                os.remove(new_link)
+            os.symlink(os.path.relpath(generation_dir, self.destination_dir),
+                       new_link)
+            os.replace(new_link, current)
+        except Exception as e:
+            logging.error('Failed to make {} current: {}'
+                          .format(generation_dir, e))
+            return False
+        logging.info('Current data: {}'.format(generation_dir))
+        return True
+
+    def prune_generations(self):
+        """Remove generations older than the keep_generations last ones
+
+        Generations newer than the current one, left by an update that
+        failed before going live, are kept.
+        """
+        current = self.current_generation()
+        generations = self.list_generations()
+        if current not in generations:
+            return
+        older = generations[:generations.index(current)]
+        keep = max(self.keep_generations - 1, 0)
+        for generation_dir in older[:max(len(older) - keep, 0)]:
+            try:
+                shutil.rmtree(generation_dir)
+                logging.info('Removed generation {}'.format(generation_dir))
+            except Exception as e:
+                logging.error('Failed to remove generation {}: {}'
+                              .format(generation_dir, e))
+
+    def rollback_generation(self):
+        """Make the generation before the current one current again"""
+        current = self.current_generation()
+        generations = self.list_generations()
+        if current not in generations or generations.index(current) == 0:
+            logging.error('No previous generation to roll back to')
+            return False
+        return self.activate_generation(
+            generations[generations.index(current) - 1])
+
+    # Files extracted while downloading go live only once checksummed
+    def move_extracted(self, staging_dir, target_dir):
+        """Move the content of a staging folder into target_dir
+
+        Args:
+            staging_dir (string): the folder an archive was extracted to
+            target_dir (string): the folder the files belong in
+        Return:
+            True if the files are moved; otherwise False
+        """
+        try:
+            for f in os.listdir(staging_dir):
+                target = os.path.join(target_dir, f)
+                if os.path.isdir(target) and not os.path.islink(target):
+                    shutil.rmtree(target)
+                os.replace(os.path.join(staging_dir, f), target)
+                if os.path.isfile(target):
+                    os.chmod(target, self.file_mode)
+            os.rmdir(staging_dir)
+        except Exception as e:
+            logging.error('Failed to move extracted files of {}: {}'
+                          .format(staging_dir, e))
+            return False
+        return True
+
     # Check the gap between two dates; used by restore method to select
     # the right version of the database
     def count_gap_two_dates(self, target_date, date):
@@ -0,0 +1,192 @@
+import os
+import gzip
+import zlib
+import struct
+import bisect
+
+# Uncompressed bytes per block, as written by bgzip
+BLOCK_SIZE = 0xff00
+# A block, header and footer included, may not exceed 64 KiB
+MAX_BLOCK_SIZE = 0x10000
+# gzip header with the BC extra field holding the block size
+BLOCK_HEADER = struct.Struct('<4BI2BH2BHH')
+BLOCK_FOOTER = struct.Struct('<2I')
+# The empty block bgzip writes at the end of a file
+EOF_BLOCK = bytes.fromhex('1f8b08040000000000ff0600424302001b00030000000000'
+                          '00000000')
+
+
+class BgzfWriter():
+    """Write a BGZF file: a series of gzip members of at most 64 KiB
+
+    Every member can be decompressed on its own, so a reader can seek
+    to any block listed in the .gzi index. The file is still a valid
+    gzip file for tools that read it from the start.
+    """
+
+    def __init__(self, file_name, compress_level=6):
+        """Initialize the object"""
+        self.output = open(file_name, 'wb')
+        self.compress_level = compress_level
+        self.buffer = bytearray()
+        # (compressed offset, uncompressed offset) of every block
+        self.blocks = []
+        self.compressed_offset = 0
+        self.uncompressed_offset = 0
+
+    def write(self, data):
+        self.buffer.extend(data)
+        while len(self.buffer) >= BLOCK_SIZE:
+            self.write_block(bytes(self.buffer[:BLOCK_SIZE]))
+            del self.buffer[:BLOCK_SIZE]
+
+    def write_block(self, data):
+        compressor = zlib.compressobj(self.compress_level, zlib.DEFLATED,
+                                      -15)
+        cdata = compressor.compress(data) + compressor.flush()
+        block_size = BLOCK_HEADER.size + len(cdata) + BLOCK_FOOTER.size
+        if block_size > MAX_BLOCK_SIZE:
+            # Incompressible data; split the block in two
+            half = len(data) // 2
+            self.write_block(data[:half])
+            self.write_block(data[half:])
+            return
+        self.blocks.append((self.compressed_offset, self.uncompressed_offset))
+        self.output.write(BLOCK_HEADER.pack(31, 139, 8, 4, 0, 0, 255, 6,
+                                            66, 67, 2, block_size - 1))
+        self.output.write(cdata)
+        self.output.write(BLOCK_FOOTER.pack(zlib.crc32(data) & 0xffffffff,
+                                            len(data)))
+        self.compressed_offset += block_size
+        self.uncompressed_offset += len(data)
+
+    def close(self):
+        """Write the last block and the end-of-file marker"""
+        if self.buffer:
+            self.write_block(bytes(self.buffer))
+            self.buffer = bytearray()
+        self.output.write(EOF_BLOCK)
+        self.output.close()
+
+    def write_gzi(self, gzi_name):
+        """Write the block offsets in the .gzi format of bgzip
+
+        The first block, at offset 0 of both files, is implied.
+        """
+        entries = self.blocks[1:]
+        with open(gzi_name, 'wb') as f:
+            f.write(struct.pack('<Q', len(entries)))
+            for compressed, uncompressed in entries:
+                f.write(struct.pack('<2Q', compressed, uncompressed))
+
+
+class BgzfFasta():
+    """Keep FASTA files block compressed with .fai and .gzi indexes
+
+    The indexes are those written by samtools faidx and bgzip, so the
+    records can be read at random by those tools or by read().
+    """
+
+    @staticmethod
+    def convert(source, target):
+        """Recompress a FASTA file into BGZF and index it
+
+        Args:
+            source (string): a FASTA file, gzipped or not
+            target (string): the BGZF file; target.fai and target.gzi
+                are written next to it. It may be the same as source.
+                On error, the temporary target.bgzf is removed.
+        Return:
+            The number of records indexed
+        """
+        tmp_name = target + '.bgzf'
+        opener = gzip.open if source.endswith('.gz') else open
+        writer = BgzfWriter(tmp_name)
+        records = []
+        record = None
+        position = 0
+        try:
+            try:
+                with opener(source, 'rb') as f:
+                    for line in f:
+                        writer.write(line)
+                        if line.startswith(b'>'):
+                            name = line[1:].split(None, 1)[0].decode()
+                            record = [name, 0, position + len(line), None,
+                                      None]
+                            records.append(record)
+                        elif record is not None:
+                            bases = len(line.rstrip(b'\r\n'))
+                            if record[3] is None:
+                                record[3] = bases
+                                record[4] = len(line)
+                            record[1] += bases
+                        position += len(line)
+            finally:
+                writer.close()
+            with open(target + '.fai', 'w') as fai:
+                for name, length, offset, line_bases, line_width in records:
+                    fai.write('{}\t{}\t{}\t{}\t{}\n'.format(
+                        name, length, offset, line_bases or 0,
+                        line_width or 0))
+            writer.write_gzi(target + '.gzi')
+            os.replace(tmp_name, target)
+        except Exception:
+            # No partial BGZF file is left next to the target
+            if os.path.exists(tmp_name):
+                os.remove(tmp_name)
+            raise
+        return len(records)
+
+    @staticmethod
+    def read_gzi(gzi_name):
+        """The (compressed, uncompressed) offsets of all the blocks"""
+        with open(gzi_name, 'rb') as f:
+            count = struct.unpack('<Q', f.read(8))[0]
+            offsets = [(0, 0)]
+            for i in range(count):
+                offsets.append(struct.unpack('<2Q', f.read(16)))
+        return offsets
+
+    @staticmethod
+    def read(file_name, offset, size):
+        """Read size uncompressed bytes from offset of a BGZF file
+
+        Only the blocks covering the range are decompressed.
+        """
+        blocks = BgzfFasta.read_gzi(file_name + '.gzi')
+        index = bisect.bisect_right([b[1] for b in blocks], offset) - 1
+        compressed, uncompressed = blocks[index]
+        result = bytearray()
+        skip = offset - uncompressed
+        with open(file_name, 'rb') as f:
+            f.seek(compressed)
+            while len(result) < skip + size:
+                header = f.read(BLOCK_HEADER.size)
+                if len(header) < BLOCK_HEADER.size:
+                    break
+                block_size = BLOCK_HEADER.unpack(header)[-1] + 1
+                cdata = f.read(block_size - BLOCK_HEADER.size
+                               - BLOCK_FOOTER.size)
+                f.read(BLOCK_FOOTER.size)
+                result.extend(zlib.decompress(cdata, -15))
+        return bytes(result[skip:skip + size])
+
+    @staticmethod
+    def fetch(file_name, name):
+        """Read the sequence of a record, without line breaks"""
+        with open(file_name + '.fai', 'r') as fai:
+            for line in fai:
+                items = line.rstrip('\n').split('\t')
+                if items[0] == name:
+                    length, offset, line_bases, line_width = \
+                        [int(i) for i in items[1:]]
+                    break
+            else:
+                return None
+        if length == 0:
+            return b''
+        lines = (length - 1) // line_bases
+        size = lines * line_width + length - lines * line_bases
+        data = BgzfFasta.read(file_name, offset, size)
+        return b''.join(data.split()) if line_width > line_bases else data
@@ -0,0 +1,97 @@
+import os
+import json
+import logging
+
+
+class DownloadCache():
+    """On-disk record of the ETag, Last-Modified and size of downloads
+
+    Entries recorded during an update are kept pending and only written
+    to the cache file by save(), so that a failed update is not taken
+    as up to date by the next run.
+    """
+
+    def __init__(self, cache_file):
+        """Initialize the object"""
+        self.cache_file = cache_file
+        self.entries = self.load()
+        self.pending = {}
+
+    def load(self):
+        """Load the cache file; empty if it does not exist"""
+        if not os.path.isfile(self.cache_file):
+            return {}
+        try:
+            with open(self.cache_file, 'r') as f:
+                return json.load(f)
+        except Exception as e:
+            logging.warning('Ignoring unreadable download cache {}: {}'
+                            .format(self.cache_file, e))
+            return {}
+
+    def save(self):
+        """Write the pending entries into the cache file"""
+        self.entries.update(self.pending)
+        self.pending = {}
+        tmp_file = self.cache_file + '.tmp'
+        try:
+            with open(tmp_file, 'w') as f:
+                json.dump(self.entries, f, indent=1, sort_keys=True)
+            os.replace(tmp_file, self.cache_file)
+        except Exception as e:
+            logging.exception('Failed to save download cache {}: {}'
+                              .format(self.cache_file, e))
+            return False
+        return True
+
+    def record(self, url, headers, size=None):
+        """Keep the validators of a finished download of url
+
+        Args:
+            url (string): the link to the downloaded file
+            headers (dict): the headers of the response
+            size (int): the size of the file; Content-Length if not given
+        """
+        if size is None:
+            size = headers.get('Content-Length')
+        self.pending[url] = {
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'size': int(size) if size is not None else None
+            }
+
+    def conditional_headers(self, url):
+        """Headers of a conditional request for url; None if never seen"""
+        entry = self.entries.get(url)
+        if entry is None:
+            return None
+        headers = {'Accept-Encoding': 'identity'}
+        if entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def is_unchanged(self, url, response):
+        """Whether the response to a conditional request shows no change
+
+        Besides a 304, a 200 carrying the recorded ETag or Last-Modified
+        counts as unchanged, for servers that ignore conditional headers.
+        Without any validator the size is compared.
+        """
+        entry = self.entries.get(url)
+        if entry is None:
+            return False
+        if response.status_code == 304:
+            return True
+        if response.status_code != 200:
+            return False
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if entry['etag'] or etag:
+            return entry['etag'] == etag
+        if entry['last_modified'] or last_modified:
+            return entry['last_modified'] == last_modified
+        size = response.headers.get('Content-Length')
+        return entry['size'] is not None and size is not None \
+            and entry['size'] == int(size)
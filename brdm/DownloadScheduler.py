@@ -0,0 +1,79 @@
+import logging
+from collections import deque, OrderedDict
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class DownloadScheduler():
+    """Run transfers on a pool of threads, the largest first
+
+    At most max_workers transfers run at once, and at most max_per_host
+    of them against the same host. Transfers of unknown size are started
+    first, then the others by decreasing size, so that the slowest ones
+    do not make up the tail of the run.
+    """
+
+    def __init__(self, max_workers, max_per_host=None):
+        """Initialize the object
+
+        Args:
+            max_workers (int): transfers in flight over all hosts
+            max_per_host (int): transfers in flight to a single host;
+                max_workers if not given
+        """
+        self.max_workers = max(max_workers, 1)
+        self.max_per_host = max_per_host or self.max_workers
+
+    @staticmethod
+    def host(url):
+        """The host of a url"""
+        return urlsplit(url).netloc
+
+    def order(self, jobs):
+        """Indexes of the jobs in the order they are started"""
+        return sorted(range(len(jobs)),
+                      key=lambda i: (jobs[i][0] is not None,
+                                     -(jobs[i][0] or 0)))
+
+    def run(self, jobs):
+        """Run jobs concurrently
+
+        Args:
+            jobs (list): (size, url, function, args) tuples; function is
+                called with args and size may be None
+        Return:
+            The results of the functions in the order of jobs; False for
+            a function that raised an exception
+        """
+        results = [False] * len(jobs)
+        # A queue per host, each in the order the jobs are started; a
+        # completion only looks at the heads of the queues
+        queues = OrderedDict()
+        for i in self.order(jobs):
+            queues.setdefault(self.host(jobs[i][1]), deque()).append(i)
+        running = {}
+        per_host = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while queues or running:
+                for host in list(queues):
+                    if len(running) == self.max_workers:
+                        break
+                    queue = queues[host]
+                    while queue and len(running) < self.max_workers and \
+                            per_host.get(host, 0) < self.max_per_host:
+                        i = queue.popleft()
+                        per_host[host] = per_host.get(host, 0) + 1
+                        running[executor.submit(jobs[i][2],
+                                                *jobs[i][3])] = i
+                    if not queue:
+                        del queues[host]
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    i = running.pop(future)
+                    per_host[self.host(jobs[i][1])] -= 1
+                    try:
+                        results[i] = future.result()
+                    except Exception as e:
+                        logging.exception('Failed to run the transfer of {}:'
+                                          ' {}'.format(jobs[i][1], e))
+        return results
@@ -0,0 +1,100 @@
+import os
+import sqlite3
+import logging
+import threading
+
+
+class DownloadState():
+    """SQLite record of the files of an unfinished update
+
+    Every planned file is kept with the bytes received, its md5 code
+    and whether it was verified and extracted. The database lives in
+    the intermediate folder and is removed once the update is promoted,
+    so its presence means the folder holds an update to resume.
+    """
+
+    def __init__(self, db_file):
+        """Open the database, creating it if it does not exist"""
+        self.db_file = db_file
+        self.lock = threading.Lock()
+        # Parallel download workers share the connection under the lock
+        self.connection = sqlite3.connect(db_file, check_same_thread=False)
+        with self.connection:
+            self.connection.execute('PRAGMA synchronous = NORMAL')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS files ('
+                'url TEXT PRIMARY KEY, '
+                'file_group TEXT, '
+                'file_name TEXT, '
+                'bytes INTEGER DEFAULT 0, '
+                'md5 TEXT, '
+                'verified INTEGER DEFAULT 0, '
+                'extracted INTEGER DEFAULT 0)')
+
+    def execute(self, sql, parameters=()):
+        """Run a statement in its own transaction"""
+        with self.lock, self.connection:
+            return self.connection.execute(sql, parameters).fetchall()
+
+    def plan(self, file_group, files):
+        """Record the files to download; known files are left as they are
+
+        Args:
+            file_group (string): the set the files belong to
+            files (list): (link to the file, file name) pairs
+        """
+        with self.lock, self.connection:
+            self.connection.executemany(
+                'INSERT OR IGNORE INTO files (url, file_group, file_name) '
+                'VALUES (?, ?, ?)',
+                [(url, file_group, file_name) for url, file_name in files])
+
+    def record(self, url, size, md5_code=None, verified=False,
+               extracted=False):
+        """Record how far a file got
+
+        Args:
+            url (string): the link to the file
+            size (int): the number of bytes received
+            md5_code (string): the md5 code of the file
+            verified (bool): the file passed its checksum
+            extracted (bool): the file was unzipped
+        """
+        self.execute('UPDATE files SET bytes = ?, md5 = ?, verified = ?, '
+                     'extracted = ? WHERE url = ?',
+                     (size, md5_code, int(verified), int(extracted), url))
+
+    def completed(self, file_group=None, extracted=False):
+        """The verified files, optionally only those also extracted
+
+        Return:
+            A dictionary of link to md5 code
+        """
+        sql = 'SELECT url, md5 FROM files WHERE verified = 1'
+        parameters = ()
+        if extracted:
+            sql += ' AND extracted = 1'
+        if file_group is not None:
+            sql += ' AND file_group = ?'
+            parameters = (file_group,)
+        return dict(self.execute(sql, parameters))
+
+    def progress(self):
+        """Number of planned, verified and extracted files"""
+        return self.execute('SELECT COUNT(*), COALESCE(SUM(verified), 0), '
+                            'COALESCE(SUM(extracted), 0) FROM files')[0]
+
+    def close(self):
+        """Close the database"""
+        self.connection.close()
+
+    def remove(self):
+        """Close and delete the database"""
+        self.close()
+        try:
+            os.remove(self.db_file)
+        except Exception as e:
+            logging.error('Failed to remove download state {}: {}'
+                          .format(self.db_file, e))
+            return False
+        return True
@@ -3,8 +3,7 @@ import shutil
 import tempfile
 import logging
 import time
-import requests
-import requests_ftp
+from hashlib import md5
 from distutils.dir_util import copy_tree
 from brdm.BaseRefData import BaseRefData
 from brdm.RefDataInterface import RefDataInterface
@@ -38,6 +37,14 @@ class GreenGeneData(BaseRefData, RefDataInterface):
     def update(self):
         """Update greengene database"""
         logging.info('Executing greengene update')
+        if self.conditional_update:
+            self.get_download_cache()
+            session_requests = self.get_session(self.download_url)
+            unchanged = self.inputs_unchanged(self.get_input_urls(),
+                                              session_requests)
+            if unchanged:
+                logging.info('Greengene data unchanged since the last update')
+                return True
         # Download files into the intermediate folder
         temp_dir = self.create_tmp_dir(self.destination_dir)
         if not temp_dir:
@@ -67,8 +74,19 @@ class GreenGeneData(BaseRefData, RefDataInterface):
         if not format_ok:
             logging.error('Failed to format data')
             return False
+        if self.conditional_update:
+            self.get_download_cache().save()
         return True
 
+    def get_input_urls(self):
+        """The links to all the files downloaded by an update"""
+        urls = [os.path.join(self.download_url, self.info_file_name)]
+        for file_name in self.download_file:
+            file_url = os.path.join(self.download_url, file_name)
+            urls.append(file_url)
+            urls.append(file_url + '.md5')
+        return urls
+
     def download(self, test=False):
         """Download all the files"""
         logging.info('Executing greengene download')
@@ -103,12 +121,14 @@ class GreenGeneData(BaseRefData, RefDataInterface):
                 attempt += 1
                 try:
                     file_url = os.path.join(self.download_url, file_name)
-                    file_success = self.download_a_file(file_name, file_url)
+                    file_md5 = self.download_a_file(file_name, file_url,
+                                                    compute_md5=True)
                     md5_url = file_url+'.md5'
                     md5_name = file_name+'.md5'
                     md5_success = self.download_a_file(md5_name, md5_url)
-                    if file_success and md5_success:
-                        checksum_success = self.checksum(md5_name, file_name)
+                    if file_md5 and md5_success:
+                        checksum_success = self.checksum(md5_name, file_name,
+                                                         file_md5)
                     if checksum_success:
                         completed = self.unzip_file(file_name)
                 except Exception as e:
@@ -131,7 +151,12 @@ class GreenGeneData(BaseRefData, RefDataInterface):
                           )
         return True
 
-    def checksum(self, md5_file, file_name):
+    def checksum(self, md5_file, file_name, md5_real=None):
+        """Check the downloaded file against its md5 file
+
+        md5_real is the md5 code computed while downloading the file;
+        if it is given the file is not read again.
+        """
         try:
             if file_name == 'gg_13_5.fasta.gz':
                 with open(file_name+'.md5', 'r') as f:
@@ -146,24 +171,30 @@ class GreenGeneData(BaseRefData, RefDataInterface):
         except Exception as e:
             logging.exception('Could not read Md5 code {}.'.format(md5_file))
             return False
-        if not self.check_md5(file_name, md5_str):
+        if not self.check_md5(file_name, md5_str, md5_real):
             logging.warning('MD5 check did not pass.')
             return False
         return True
 
     # Download a file with provided file name and file address(link)
-    def download_a_file(self, file_name, file_address):
-        """Download a specific file"""
-        requests_ftp.monkeypatch_session()
-        session_requests = requests.Session()
+    def download_a_file(self, file_name, file_address, compute_md5=False):
+        """Download a specific file
+
+        Return False if the download failed; otherwise the md5 code of
+        the file if compute_md5 is set, True if not.
+        """
+        session_requests = self.get_session(file_address)
+        md5_hash = md5() if compute_md5 else None
         try:
             res = session_requests.get(file_address, stream=True)
             with open(file_name, 'wb') as output:
-                shutil.copyfileobj(res.raw, output)
-            session_requests.close()
+                self.write_stream(res.raw, output, md5_hash)
+            self.record_download(file_address, res)
         except Exception as e:
             logging.exception('Failed to download {}.'.format(file_name))
             return False
+        if md5_hash is not None:
+            return md5_hash.hexdigest()
         return True
 
     # backup readme and readme+ file
@@ -0,0 +1,106 @@
+import os
+import json
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+
+
+class Md5Cache():
+    """Parsed md5 files of NCBI assembly folders, kept across updates
+
+    The md5 codes of every assembly folder are stored by the link to the
+    folder in an SQLite file, with the most recently used folders also
+    kept in memory. Assembly folders are versioned, so their md5 files
+    hardly ever change; a folder whose md5 code did not match is
+    discarded and fetched again.
+    """
+
+    def __init__(self, cache_file, capacity=4096):
+        """Open the cache, creating it if it does not exist
+
+        Args:
+            cache_file (string): the SQLite file of the cache
+            capacity (int): the number of folders kept in memory
+        """
+        self.cache_file = cache_file
+        self.capacity = capacity
+        self.recent = OrderedDict()
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(cache_file,
+                                          check_same_thread=False)
+        with self.connection:
+            self.connection.execute('PRAGMA synchronous = NORMAL')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS md5 ('
+                'folder_url TEXT PRIMARY KEY, '
+                'checksums TEXT)')
+
+    @staticmethod
+    def parse(md5_text):
+        """Read the contents of an md5 file
+
+        Return:
+            A dictionary of file name to md5 code
+        """
+        checksums = {}
+        for line in md5_text.splitlines():
+            line_items = line.split('  ', 1)
+            if len(line_items) > 1:
+                file_name = os.path.basename(line_items[1].strip())
+                checksums[file_name] = line_items[0].strip()
+        return checksums
+
+    def remember(self, folder_url, checksums):
+        """Keep checksums in memory, dropping the least recently used"""
+        self.recent[folder_url] = checksums
+        self.recent.move_to_end(folder_url)
+        while len(self.recent) > self.capacity:
+            self.recent.popitem(last=False)
+
+    def get(self, folder_url):
+        """The md5 codes of a folder; None if it is not cached"""
+        with self.lock:
+            checksums = self.recent.get(folder_url)
+            if checksums is not None:
+                self.recent.move_to_end(folder_url)
+                return checksums
+            row = self.connection.execute(
+                'SELECT checksums FROM md5 WHERE folder_url = ?',
+                (folder_url,)).fetchone()
+            if row is None:
+                return None
+            checksums = json.loads(row[0])
+            self.remember(folder_url, checksums)
+            return checksums
+
+    def put(self, folder_url, checksums):
+        """Cache the md5 codes of a folder"""
+        with self.lock, self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO md5 (folder_url, checksums) '
+                'VALUES (?, ?)', (folder_url, json.dumps(checksums)))
+            self.remember(folder_url, checksums)
+
+    def discard(self, folder_url):
+        """Forget the md5 codes of a folder"""
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM md5 WHERE folder_url = ?',
+                                    (folder_url,))
+            self.recent.pop(folder_url, None)
+
+    def missing(self, folder_urls):
+        """The folders of folder_urls that are not cached, in order"""
+        result = []
+        for folder_url in OrderedDict.fromkeys(folder_urls):
+            if self.get(folder_url) is None:
+                result.append(folder_url)
+        return result
+
+    def close(self):
+        """Close the cache file"""
+        try:
+            self.connection.close()
+        except Exception as e:
+            logging.error('Failed to close md5 cache {}: {}'
+                          .format(self.cache_file, e))
@@ -6,11 +6,41 @@ import re
 import logging.config
 import tarfile
 import time
-from distutils.dir_util import copy_tree
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from bs4 import BeautifulSoup
+from brdm.BaseRefData import extract_tar
 from brdm.NcbiData import NcbiData
 from brdm.RefDataInterface import RefDataInterface
 
+# Files every nrnt volume ships with, not tied to one volume: the alias
+# files listing the volumes and the taxonomy of the databases
+SHARED_FILE_RE = re.compile(r'(nr|nt)\.[np]al$|taxdb\.|taxonomy4blast\.')
+
+
+# Runs in a worker process of NcbiBlastData.unzip; it is defined at
+# module level so that it can be sent to the worker
+def extract_volume(file_path, file_mode):
+    """Extract a nrnt volume next to its archive, then delete the archive
+
+    Args:
+        file_path (string): the absolute path to the nr.NN.tar.gz file
+        file_mode (int): the mode of the extracted files
+    Return:
+        None if the volume is extracted; otherwise the error message
+    """
+    folder = os.path.dirname(file_path)
+    try:
+        with tarfile.open(file_path, 'r:gz') as tar:
+            members = extract_tar(tar, folder)
+        for member in members:
+            if member.isfile():
+                os.chmod(os.path.join(folder, member.name), file_mode)
+        os.remove(file_path)
+    except Exception as e:
+        return str(e)
+    return None
+
 
 class NcbiBlastData(NcbiData, RefDataInterface):
 
@@ -20,6 +50,22 @@ class NcbiBlastData(NcbiData, RefDataInterface):
         self.download_folder = \
             self.config['ncbi']['blast_db']['download_folder']
         self.info_file_name = self.config['ncbi']['blast_db']['info_file_name']
+        self.max_parallel_downloads = \
+            self.config['ncbi']['blast_db'].get('max_parallel_downloads', 1)
+        self.incremental = \
+            self.config['ncbi']['blast_db'].get('incremental', False)
+        self.manifest_file = \
+            self.config['ncbi']['blast_db'].get('manifest_file', 'volumes.md5')
+        self.read_segment_config(self.config['ncbi']['blast_db'])
+        self.unzip_workers = \
+            self.config['ncbi']['blast_db'].get('unzip_workers', 1)
+        self.stream_extract = \
+            self.config['ncbi']['blast_db'].get('stream_extract', False)
+        # md5 code of every verified or unchanged volume, keyed by name
+        self.volume_md5 = {}
+        # Deployed volumes that are replaced or withdrawn by an
+        # incremental update
+        self.stale_volumes = []
         try:
             self.destination_dir = os.path.join(
                         super(NcbiBlastData, self).destination_dir,
@@ -45,7 +91,9 @@ class NcbiBlastData(NcbiData, RefDataInterface):
             logging.error('Failed to create the temp_dir: {}, error{}'
                           .format(temp_dir, e))
             return False
-        success = self.download(download_file_number=file_number)
+        self.open_download_state(temp_dir)
+        success = self.download(download_file_number=file_number,
+                                incremental=self.incremental)
         if not success:
             logging.error('Failed to download nrnt files.')
             return False
@@ -62,22 +110,107 @@ class NcbiBlastData(NcbiData, RefDataInterface):
         if not backup_success:
             logging.error('Failed to backup readme files.')
             return False
-        # Delete all data from the destination folder
-        clean_ok = self.clean_destination_dir(self.destination_dir)
-        if not clean_ok:
-            logging.error('Failed to remove old files in destination folder')
-            return False
-        # Copy data from intermediate folder to destination folder
-        # Delete intermediate folder
+        self.close_download_state()
+        if self.incremental:
+            promote_ok = self.promote_incremental(temp_dir)
+        else:
+            # Replace all data of the destination folder
+            promote_ok = self.promote(temp_dir)
+        if promote_ok:
+            self.finish_download_state()
+        return promote_ok
+
+    # Replace only the stale volumes in the destination folder;
+    # unchanged volumes stay where they are
+    def promote_incremental(self, temp_dir):
+        """Move the volumes of an incremental update into place
+
+        Files of the replaced and withdrawn volumes (archives or
+        extracted files) are removed from the destination folder, then
+        the new files are moved in from the intermediate folder. The
+        shared files, such as nt.nal and taxdb.*, are replaced as well
+        when new volumes are downloaded, since the copies in use may
+        list withdrawn volumes. With atomic_swap the files of the
+        unchanged volumes are hard linked into the new generation
+        instead.
+        Args:
+            temp_dir (string): the intermediate folder
+        Return:
+            True if the destination folder is updated; otherwise False
+        """
+        stale_prefixes = tuple(self.volume_prefix(f)
+                               for f in self.stale_volumes)
+        new_volumes = [f for f in self.stale_volumes if f in self.volume_md5]
+        if self.stale_volumes and not new_volumes:
+            logging.warning('Volumes were withdrawn but none downloaded; the'
+                            ' shared files in use, such as the alias files,'
+                            ' are kept and may still list them')
+        if self.atomic_swap:
+            link_ok = self.link_unchanged_files(temp_dir, stale_prefixes,
+                                                not new_volumes)
+            return link_ok and self.promote(temp_dir)
         try:
-            copy_tree(temp_dir, self.destination_dir)
+            for f in os.listdir(self.destination_dir):
+                full_name = os.path.join(self.destination_dir, f)
+                if not os.path.isfile(full_name):
+                    continue
+                if (stale_prefixes and f.startswith(stale_prefixes)) or \
+                        (new_volumes and self.is_shared_file(f)):
+                    os.remove(full_name)
+            for f in os.listdir(temp_dir):
+                os.replace(os.path.join(temp_dir, f),
+                           os.path.join(self.destination_dir, f))
+            os.chdir(self.destination_dir)
             shutil.rmtree(temp_dir)
         except Exception as e:
-            logging.error('Failed to copy file from temp to destination {}'
+            logging.error('Failed to move files from temp to destination {}'
                           .format(e))
             return False
+        logging.info('Replaced {} volumes in {}'
+                     .format(len(self.stale_volumes), self.destination_dir))
+        return True
+
+    def link_unchanged_files(self, temp_dir, stale_prefixes,
+                             link_shared=True):
+        """Hard link the files in use that are still valid into temp_dir
+
+        Args:
+            temp_dir (string): the intermediate folder
+            stale_prefixes (tuple): prefixes of the replaced and
+                withdrawn volumes, which are not linked
+            link_shared (bool): link the shared files, such as nt.nal
+        Return:
+            True if the files are linked; otherwise False
+        """
+        live_dir = self.live_dir()
+        linked = 0
+        try:
+            for f in os.listdir(live_dir):
+                full_name = os.path.join(live_dir, f)
+                if not os.path.isfile(full_name) or \
+                        (stale_prefixes and f.startswith(stale_prefixes)) \
+                        or (not link_shared and self.is_shared_file(f)) \
+                        or os.path.exists(os.path.join(temp_dir, f)):
+                    continue
+                os.link(full_name, os.path.join(temp_dir, f))
+                linked += 1
+        except Exception as e:
+            logging.error('Failed to link unchanged files into {}: {}'
+                          .format(temp_dir, e))
+            return False
+        logging.info('Linked {} unchanged files into the new generation'
+                     .format(linked))
         return True
 
+    def is_shared_file(self, file_name):
+        """Whether a file comes with every volume rather than one"""
+        return SHARED_FILE_RE.match(file_name) is not None
+
+    # nr.00.tar.gz -> nr.00. ; matches the archive and the extracted files
+    def volume_prefix(self, file_name):
+        """The prefix shared by all files of a nrnt volume"""
+        return file_name[:-len('tar.gz')]
+
     # Backup readme and readme+ file
     def backup(self):
         """Backup readme and README+ files"""
@@ -106,9 +239,36 @@ class NcbiBlastData(NcbiData, RefDataInterface):
 
     # Unzip all of nrnt files
     def unzip(self):
-        """Unzip all the nrnt files"""
+        """Unzip all the nrnt files
+
+        With atomic_swap the files are extracted in a staging folder that
+        goes live as a new generation; the current one is not modified.
+        """
+        if not self.atomic_swap or self.current_generation() is None:
+            try:
+                os.chdir(self.live_dir())
+            except Exception as e:
+                logging.error('Failed to enter {}: {}'
+                              .format(self.live_dir(), e))
+                return False
+            return self.unzip_folder()
+        staging_dir = self.stage_unzip()
+        if not staging_dir:
+            return False
+        if not self.unzip_folder():
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            return False
+        return self.promote(staging_dir)
+
+    def unzip_folder(self):
+        """Unzip the files of the current folder"""
         try:
             zipped_files = [f for f in os.listdir('.') if os.path.isfile(f)]
+            if self.unzip_workers > 1:
+                if not self.unzip_parallel(zipped_files):
+                    return False
+                zipped_files = [f for f in zipped_files
+                                if not f.endswith('tar.gz')]
             for file in zipped_files:
                 unzipped = self.unzip_file(file)
                 if not unzipped:
@@ -123,6 +283,65 @@ class NcbiBlastData(NcbiData, RefDataInterface):
             return False
         return True
 
+    def stage_unzip(self):
+        """Hard link the current files into a staging folder to unzip
+
+        Extracting replaces the linked files instead of writing into
+        them, see extract_tar, so the current generation is not modified.
+        Return:
+            The staging folder, which is also made the working directory;
+            False if it could not be prepared
+        """
+        try:
+            staging_dir = tempfile.mkdtemp(prefix='unzip_',
+                                           dir=self.destination_dir)
+            if not self.link_unchanged_files(staging_dir, ()):
+                shutil.rmtree(staging_dir)
+                return False
+            os.chdir(staging_dir)
+        except Exception as e:
+            logging.error('Failed to stage the files to unzip: {}'.format(e))
+            return False
+        return staging_dir
+
+    # The volumes are independent; extract them in worker processes
+    def unzip_parallel(self, file_list):
+        """Extract the nrnt volumes of the current folder concurrently
+
+        A volume that fails is reported and left in place; the other
+        volumes are extracted regardless.
+        Args:
+            file_list (list): files of the current folder; the tar.gz
+                files among them are extracted
+        Return:
+            True if all the volumes are extracted; otherwise False
+        """
+        folder = os.getcwd()
+        archives = [f for f in file_list if f.endswith('tar.gz')]
+        failed = []
+        with ProcessPoolExecutor(max_workers=self.unzip_workers) as executor:
+            futures = {executor.submit(extract_volume,
+                                       os.path.join(folder, f),
+                                       self.file_mode): f
+                       for f in archives}
+            for future in as_completed(futures):
+                file = futures[future]
+                try:
+                    error = future.result()
+                except Exception as e:
+                    error = str(e)
+                if error:
+                    failed.append(file)
+                    logging.error('Failed to unzip {}: {}'.format(file, error))
+                else:
+                    logging.info('Unzipped {}'.format(file))
+        if failed:
+            logging.error('Failed to unzip {} of {} volumes: {}'
+                          .format(len(failed), len(archives),
+                                  ', '.join(sorted(failed))))
+            return False
+        return True
+
     # Parse the webpage of ncbi blast to get the list of nrnt files
     def get_all_file(self, url):
         """Parse the webpage of ncbi blast to get the list of nrnt files
@@ -151,8 +370,17 @@ class NcbiBlastData(NcbiData, RefDataInterface):
         return result
 
     # Download read me and all the nrnt files
-    def download(self, download_file_number=0):
-        """Download readme and all the nrnt files"""
+    def download(self, download_file_number=0, incremental=False):
+        """Download readme and all the nrnt files
+
+        Args:
+            download_file_number (int): the number of volumes to download;
+                0 for all of them
+            incremental (bool): download only the volumes whose md5 on
+                NCBI differs from the manifest in the destination folder
+        Return:
+            True if the volumes are downloaded and verified; otherwise False
+        """
         download_start_time = time.time()
         max_download_attempts = self.download_retry_num
         folder_url = os.path.join(self.login_url, self.download_folder)
@@ -177,76 +405,380 @@ class NcbiBlastData(NcbiData, RefDataInterface):
             return False
         # Get the list of nrnt files
         all_file = self.get_all_file(folder_url)
-        downloaded_file = []
+        self.volume_md5 = {}
+        self.stale_volumes = []
         if len(all_file) == 0:
             logging.error('Failed to get the file list to download')
             return False
-        if download_file_number == 0:
-            download_file_number = len(all_file)
+        comment = 'nr and nt blast datasets downloaded from NCBI.'
+        remote_file = all_file
+        if incremental:
+            if download_file_number > 0:
+                all_file = all_file[:download_file_number]
+            file_list = self.get_changed_volumes(folder_url, all_file,
+                                                 remote_file)
+            if file_list is False:
+                return False
+            download_file_number = len(file_list)
+            comment = 'nr and nt blast datasets downloaded from NCBI. ' \
+                + 'Incremental update: {} volumes downloaded, {} unchanged.' \
+                .format(len(file_list), len(all_file) - len(file_list))
+        else:
+            file_list = all_file
+            if download_file_number == 0:
+                download_file_number = len(file_list)
         # Download nrnt files
+        downloaded_file = self.download_volumes(folder_url, file_list,
+                                                download_file_number)
+        if len(downloaded_file) < download_file_number:
+            logging.error('Failed. downloaded {} out of {} files'
+                          .format(len(downloaded_file), download_file_number))
+            return False
+
+        files_download_failed = []
+        # The volumes downloaded and, in an incremental update, those
+        # carried forward
+        volumes = [f for f in remote_file if f in self.volume_md5]
+        manifest_success = self.write_manifest(volumes)
+        if not manifest_success:
+            return False
+        # Write application's README+ file
+        self.write_readme(download_url='{}'.format(folder_url),
+                          downloaded_files=volumes,
+                          download_failed_files=files_download_failed,
+                          comment=comment,
+                          execution_time=(time.time() - download_start_time))
+        return True
+
+    # Download and verify a list of nrnt volumes, with retries
+    def download_volumes(self, folder_url, file_list, download_file_number):
+        """Download nrnt volumes until download_file_number are verified
+
+        Args:
+            folder_url (string): the link to ncbi blast database
+            file_list (list): names of the nrnt volumes to download
+            download_file_number (int): the number of volumes required
+        Return:
+            A list of the verified volumes, in the order of file_list
+        """
+        max_download_attempts = self.download_retry_num
+        downloaded_file = self.resumed_volumes(folder_url, file_list,
+                                               download_file_number)
         attempt = 0
         while attempt < max_download_attempts and \
                 len(downloaded_file) < download_file_number:
             try:
-                session_requests, connected = self.https_connect()
                 attempt += 1
-                for file in all_file:
-                    if file not in downloaded_file:
-                        download_success = False
-                        file_success = False
-                        md5_success = False
-                        file_name_nrnt = file
-                        file_url_nrnt = os.path.join(
-                                            folder_url, file_name_nrnt)
-                        file_name_md5 = file+'.md5'
-                        file_url_md5 = os.path.join(folder_url, file_name_md5)
-                        file_success = self.download_a_file(
-                            file_name_nrnt, file_url_nrnt, session_requests)
-                        if file_success:
-                            md5_success = self.download_a_file(
-                                file_name_md5, file_url_md5, session_requests)
-                        if md5_success:
-                            download_success = self.checksum(file_name_md5,
-                                                             file_name_nrnt)
-                        if download_success:
-                            downloaded_file.append(file)
-                    if len(downloaded_file) == download_file_number:
-                        break
-                session_requests.close()
-
+                if self.max_parallel_downloads > 1:
+                    self.download_parallel(folder_url, file_list,
+                                           downloaded_file,
+                                           download_file_number)
+                else:
+                    session_requests, connected = self.https_connect()
+                    for file in file_list:
+                        if file not in downloaded_file:
+                            download_success = self.download_a_volume(
+                                    folder_url, file, session_requests)
+                            if download_success:
+                                downloaded_file.append(file)
+                        if len(downloaded_file) == download_file_number:
+                            break
+                    session_requests.close()
             except Exception as e:
                 logging.exception('Errors in downloading nrnt files, \
                 \nretry... {}'.format(e))
                 time.sleep(self.sleep_time)
+        # Workers finish out of order; list the volumes in NCBI order
+        downloaded_file.sort(key=file_list.index)
+        return downloaded_file
 
-        if len(downloaded_file) < download_file_number:
-            logging.error('Failed. downloaded {} out of {} files'
-                          .format(len(downloaded_file), download_file_number))
+    def resumed_volumes(self, folder_url, file_list, download_file_number):
+        """Volumes verified by an interrupted run of this update
+
+        The volumes are planned in the download state; those verified
+        before and still in the intermediate folder are not downloaded
+        again. The archives kept are verified again against the md5
+        files on NCBI, which may have changed since the interrupted run.
+        Args:
+            folder_url (string): the link to ncbi blast database
+            file_list (list): names of the nrnt volumes to download
+            download_file_number (int): the number of volumes required
+        Return:
+            A list of the volumes already verified
+        """
+        state = self.download_state
+        if state is None:
+            return []
+        state.plan('', [(os.path.join(folder_url, f), f) for f in file_list])
+        verified = state.completed()
+        extracted = state.completed(extracted=True)
+        result = []
+        for file in file_list:
+            if len(result) == download_file_number:
+                break
+            file_url = os.path.join(folder_url, file)
+            if verified.get(file_url) and \
+                    (os.path.isfile(file) or file_url in extracted):
+                result.append(file)
+        archives = [f for f in result
+                    if os.path.join(folder_url, f) not in extracted]
+        failed = self.verify(folder_url, archives) if archives else []
+        for file in failed:
+            logging.warning('Downloading {} again: it could not be verified'
+                            ' against its md5 file on NCBI'.format(file))
+            result.remove(file)
+        for file in result:
+            self.volume_md5[file] = verified[os.path.join(folder_url, file)]
+        if result:
+            logging.info('Resuming with {} volumes already verified'
+                         .format(len(result)))
+        return result
+
+    # Compare the md5 files on NCBI with the manifest of the deployed volumes
+    def get_changed_volumes(self, folder_url, all_file, remote_file):
+        """Get the nrnt volumes that are new or changed on NCBI
+
+        Unchanged volumes are recorded in volume_md5; deployed volumes
+        that are changed or no longer on NCBI are recorded in
+        stale_volumes.
+        Args:
+            folder_url (string): the link to ncbi blast database
+            all_file (list): names of the nrnt volumes to be checked
+            remote_file (list): names of all the nrnt volumes on NCBI;
+                deployed volumes that are not checked are kept as they are
+        Return:
+            A list of the volumes to download; False on failure
+        """
+        remote_md5 = self.fetch_md5_codes(folder_url, all_file)
+        if len(remote_md5) < len(all_file):
+            logging.error('Failed to get the md5 files of {} volumes'
+                          .format(len(all_file) - len(remote_md5)))
             return False
+        live_dir = self.live_dir()
+        deployed_md5 = self.read_manifest(
+            os.path.join(live_dir, self.manifest_file))
+        deployed_files = [f for f in os.listdir(live_dir)
+                          if os.path.isfile(os.path.join(live_dir, f))]
+        changed = []
+        for file in all_file:
+            prefix = self.volume_prefix(file)
+            in_place = any(f.startswith(prefix) for f in deployed_files)
+            if in_place and deployed_md5.get(file) == remote_md5[file]:
+                self.volume_md5[file] = remote_md5[file]
+            else:
+                changed.append(file)
+        for file in remote_file:
+            if file not in all_file and file in deployed_md5:
+                self.volume_md5[file] = deployed_md5[file]
+        withdrawn = [f for f in deployed_md5 if f not in remote_file]
+        self.stale_volumes = changed + withdrawn
+        logging.info('Incremental update: {} volumes changed, {} unchanged, '
+                     '{} withdrawn'.format(len(changed),
+                                           len(all_file) - len(changed),
+                                           len(withdrawn)))
+        return changed
 
-        files_download_failed = []
-        # Write application's README+ file
-        comment = 'nr and nt blast datasets downloaded from NCBI.'
-        self.write_readme(download_url='{}'.format(folder_url),
-                          downloaded_files=downloaded_file,
-                          download_failed_files=files_download_failed,
-                          comment=comment,
-                          execution_time=(time.time() - download_start_time))
+    # Download the md5 file of each nrnt volume
+    def fetch_md5_codes(self, folder_url, file_list):
+        """Download the md5 codes of nrnt volumes
+
+        Args:
+            folder_url (string): the link to ncbi blast database
+            file_list (list): names of the nrnt volumes
+        Return:
+            A dictionary of volume name to md5 code; volumes whose md5
+            file could not be downloaded are left out
+        """
+        md5_codes = {}
+        session_requests, connected = self.https_connect()
+        for file in file_list:
+            file_name_md5 = file + '.md5'
+            file_url_md5 = os.path.join(folder_url, file_name_md5)
+            try:
+                md5_success = self.download_a_file(
+                    file_name_md5, file_url_md5, session_requests)
+                if md5_success:
+                    md5_codes[file] = self.read_md5_code(file_name_md5)
+            except Exception as e:
+                logging.exception('Could not read MD5 file {}: {}'
+                                  .format(file_name_md5, e))
+        session_requests.close()
+        return md5_codes
+
+    # The manifest lists the md5 code of every deployed volume,
+    # in the format of the NCBI md5 files
+    def read_manifest(self, manifest_name):
+        """Read a manifest of volumes; empty if there is none"""
+        manifest = {}
+        if not os.path.isfile(manifest_name):
+            return manifest
+        try:
+            with open(manifest_name, 'r') as f:
+                for line in f:
+                    line_items = line.split()
+                    if len(line_items) == 2:
+                        manifest[line_items[1]] = line_items[0]
+        except Exception as e:
+            logging.exception('Failed to read manifest {}: {}'
+                              .format(manifest_name, e))
+            return {}
+        return manifest
+
+    def write_manifest(self, file_list):
+        """Write the md5 codes of file_list into the manifest file"""
+        try:
+            with open(self.manifest_file, 'w') as f:
+                for file in file_list:
+                    f.write('{}  {}\n'.format(self.volume_md5[file], file))
+            os.chmod(self.manifest_file, self.file_mode)
+        except Exception as e:
+            logging.exception('Failed to write manifest {}: {}'
+                              .format(self.manifest_file, e))
+            return False
         return True
 
+    # Download, checksum a nrnt volume
+    def download_a_volume(self, folder_url, file_name, session_requests):
+        """Download a nrnt volume and its md5 file, then checksum it
+
+        Args:
+            folder_url (string): the link to ncbi blast database
+            file_name (string): the name of the nrnt volume
+            session_requests (object): requests session
+        With stream_extract the volume is extracted while it downloads
+        and its files are kept only if the checksum matches.
+        Return:
+            True if the volume is downloaded and verified; otherwise False
+        """
+        file_url = os.path.join(folder_url, file_name)
+        file_name_md5 = file_name + '.md5'
+        file_url_md5 = os.path.join(folder_url, file_name_md5)
+        staging_dir = '.' + file_name + '.extract'
+        if self.stream_extract:
+            file_md5 = self.download_and_extract(
+                file_name, file_url, session_requests, staging_dir)
+        else:
+            file_md5 = self.download_a_file(
+                file_name, file_url, session_requests, compute_md5=True)
+        if not file_md5:
+            return False
+        md5_code = None
+        md5_success = self.download_a_file(
+            file_name_md5, file_url_md5, session_requests)
+        if md5_success:
+            try:
+                md5_code = self.read_md5_code(file_name_md5)
+            except Exception as e:
+                logging.exception('Could not read MD5 file {}. \
+                \nTry to download the file again'.format(file_name))
+        if not md5_code or not self.check_md5(file_name, md5_code, file_md5):
+            logging.error('Failed in checksum. Download the file again.')
+            if self.stream_extract:
+                shutil.rmtree(staging_dir, ignore_errors=True)
+            return False
+        if self.stream_extract:
+            if not self.move_extracted(staging_dir, '.'):
+                return False
+            size = None
+        else:
+            size = os.path.getsize(file_name)
+        self.volume_md5[file_name] = md5_code
+        if self.download_state is not None:
+            self.download_state.record(file_url, size, md5_code,
+                                       verified=True,
+                                       extracted=self.stream_extract)
+        return True
+
+    # Download nrnt volumes with a pool of workers, each worker
+    # fetches and checksums one volume on its own session
+    def download_parallel(self, folder_url, all_file, downloaded_file,
+                          download_file_number):
+        """Download nrnt volumes concurrently
+
+        Volumes are handed out in the order of all_file; a failed volume
+        is replaced by the next one until download_file_number volumes
+        have been verified, the same as the sequential download.
+        Args:
+            folder_url (string): the link to ncbi blast database
+            all_file (list): names of all the nrnt volumes
+            downloaded_file (list): verified volumes; updated in place
+            download_file_number (int): the number of volumes required
+        """
+        pending = [f for f in all_file if f not in downloaded_file]
+        running = {}
+        with ThreadPoolExecutor(
+                max_workers=self.max_parallel_downloads) as executor:
+            while True:
+                while pending and len(running) < self.max_parallel_downloads \
+                        and len(downloaded_file) + len(running) \
+                        < download_file_number:
+                    file = pending.pop(0)
+                    future = executor.submit(
+                            self.download_volume_worker, folder_url, file)
+                    running[future] = file
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    file = running.pop(future)
+                    if future.result():
+                        downloaded_file.append(file)
+                    else:
+                        logging.warning('Failed to download {}'.format(file))
+
+    def download_volume_worker(self, folder_url, file_name):
+        """Download a nrnt volume on a session of its own"""
+        try:
+            session_requests, connected = self.https_connect()
+            success = self.download_a_volume(
+                    folder_url, file_name, session_requests)
+            session_requests.close()
+        except Exception as e:
+            logging.exception('Errors in downloading {}: {}'
+                              .format(file_name, e))
+            time.sleep(self.sleep_time)
+            return False
+        return success
+
+    # Verify nrnt volumes in the current folder against NCBI md5 files
+    def verify(self, folder_url, file_list):
+        """Verify local nrnt volumes against the md5 files on NCBI
+
+        Only the small md5 files are downloaded; the volumes are hashed
+        in parallel by check_md5_batch.
+        Args:
+            folder_url (string): the link to ncbi blast database
+            file_list (list): names of the nrnt volumes to be verified
+        Return:
+            A list of the volumes that failed verification
+        """
+        md5_codes = self.fetch_md5_codes(folder_url, file_list)
+        failed = [f for f in file_list if f not in md5_codes]
+        md5_list = [(f, md5_codes[f]) for f in file_list if f in md5_codes]
+        return failed + self.check_md5_batch(md5_list)
+
     # Check the correctness of the downloaded file
-    def checksum(self, md5_file, file_name):
-        """Check the correctness of the downloaded file"""
+    def checksum(self, md5_file, file_name, md5_real=None):
+        """Check the correctness of the downloaded file
+
+        md5_real is the md5 code computed while downloading the file;
+        if it is given the file is not read again.
+        """
         try:
-            with open(md5_file, 'r') as f:
-                md5_file_contents = f.read()
-            md5_str = md5_file_contents.split(' ')[0]
-            os.remove(md5_file)
+            md5_str = self.read_md5_code(md5_file)
         except Exception as e:
             logging.exception('Could not read MD5 file {}. \
             \nTry to download the file again'.format(file_name))
             return False
-        if not self.check_md5(file_name, md5_str):
+        if not self.check_md5(file_name, md5_str, md5_real):
             logging.error('Failed in checksum. Download the file again.')
             return False
         return True
+
+    def read_md5_code(self, md5_file):
+        """Read the md5 code from a NCBI md5 file, then delete the file"""
+        with open(md5_file, 'r') as f:
+            md5_file_contents = f.read()
+        md5_str = md5_file_contents.split(' ')[0]
+        os.remove(md5_file)
+        return md5_str
@@ -1,7 +1,11 @@
 import os
+import time
+import shutil
+import tarfile
 import logging.config
-import requests
-from brdm.BaseRefData import BaseRefData
+from hashlib import md5
+from brdm.BaseRefData import BaseRefData, HashingReader, extract_tar
+from brdm.SessionPool import SessionPool
 from brdm.RefDataInterface import RefDataInterface
 
 
@@ -14,6 +18,7 @@ class NcbiData(BaseRefData, RefDataInterface):
         self.ncbi_user = self.config['ncbi']['user']
         self.ncbi_passw = self.config['ncbi']['password']
         self.chunk_size = self.config['ncbi']['chunk_size']
+        self.read_segment_config(self.config['ncbi'])
         try:
             self.destination_dir = os.path.join(
                                     super(NcbiData, self).destination_dir,
@@ -62,16 +67,26 @@ class NcbiData(BaseRefData, RefDataInterface):
         logging.info('Restoringing all of NCBI data ... Nothing to do.')
         pass
 
-    # Login to NCBI
+    # Login to NCBI; the session is shared by all NCBI data sources
     def https_connect(self):
-        """Login to NCBI"""
+        """Login to NCBI
+
+        Return:
+            The pooled session of the NCBI host and whether the login
+            succeeded; the login is done only once per process
+        """
         logging.info('Connecting to NCBI https: {}'.format(self.login_url))
+        session_requests = self.get_session(self.login_url)
+        connected = SessionPool.authenticate(self.login_url, self.login)
+        return session_requests, connected
+
+    def login(self, session_requests):
+        """Post the NCBI account to login_url"""
         login_data = {
                 'username': self.ncbi_user,
                 'password': self.ncbi_passw
                 }
         retry_num = self.connection_retry_num
-        session_requests = requests.Session()
         connected = False
         while not connected and retry_num != 0:
             try:
@@ -82,34 +97,177 @@ class NcbiData(BaseRefData, RefDataInterface):
                               \nRetrying...".format(self.login_url, e))
                 time.sleep(self.sleep_time)
                 retry_num -= 1
-        return session_requests, connected
+        return connected
 
-    # Download a file
-    def download_a_file(self, file_name, file_address, session_requests):
+    # Download a file; resume from a partial download if there is one
+    def download_a_file(self, file_name, file_address, session_requests,
+                        compute_md5=False):
         """Download a file by requests
 
+        The file is written to file_name.part and renamed to file_name
+        once it is complete. A .part file left by a failed attempt or by
+        an earlier run is resumed with a Range request; if the server
+        does not honour the range the download starts from byte zero.
+        A new download of a large file is fetched in segments if
+        download_segments is more than 1; md5 and README files never are.
         Args:
             file_name (string): the name of the file downloaded
             file_address (string): the link to the file needed to be download
             session_requests (object): requests session
+            compute_md5 (bool): hash the file while it is written
         Return:
-            True if the file is downloaded successfully; otherwise False
+            False if the download failed; otherwise the md5 code of the
+            file if compute_md5 is set, True if not
         """
-        chunkSize = self.chunk_size
-        totalSize = 0
+        part_name = file_name + '.part'
+        md5_hash = md5() if compute_md5 else None
         try:
-            res = session_requests.get(file_address, stream=True)
-            with open(file_name, 'wb') as output:
-                chunknumber = 0
-                for chunk in res.iter_content(chunk_size=chunkSize,
-                                              decode_unicode=False):
-                    if chunk:
-                        totalSize = totalSize + chunkSize
-                        chunknumber += 1
-                        output.write(chunk)
+            offset = 0
+            if os.path.isfile(part_name):
+                offset = os.path.getsize(part_name)
+            res = None
+            if offset == 0 and self.segments_wanted(file_name):
+                res = self.download_segmented(file_address, part_name,
+                                              session_requests, md5_hash)
+            if res is not None:
+                totalSize = os.path.getsize(part_name)
+            else:
+                res, totalSize = self.stream_from(
+                                    file_address, part_name,
+                                    session_requests, offset, md5_hash)
+                if totalSize is None:
+                    logging.error('Incomplete download of {}'
+                                  .format(file_name))
+                    return False
+            os.replace(part_name, file_name)
             os.chmod(file_name, self.file_mode)
+            self.record_download(file_address, res, totalSize)
         except Exception as e:
             logging.exception('Failed to download file {}.{}'
                               .format(file_name, e))
             return False
+        if md5_hash is not None:
+            return md5_hash.hexdigest()
         return True
+
+    # Extract a tarball as it arrives instead of writing it to disk first
+    def download_and_extract(self, file_name, file_address, session_requests,
+                             staging_dir):
+        """Download a tar.gz file and extract it on the fly
+
+        The response is read once: every byte goes both into the md5
+        code and into a streaming tar reader extracting into staging_dir;
+        extract_tar refuses members that would leave it. The archive
+        itself is never written. The caller moves the extracted files
+        into place with move_extracted once the md5 code is checked, or
+        removes staging_dir if it does not match.
+        Args:
+            file_name (string): the name of the archive
+            file_address (string): the link to the file needed to be download
+            session_requests (object): requests session
+            staging_dir (string): the folder to extract into; emptied first
+        Return:
+            False if the download or the extraction failed; otherwise the
+            md5 code of the archive
+        """
+        md5_hash = md5()
+        try:
+            if os.path.exists(staging_dir):
+                shutil.rmtree(staging_dir)
+            os.makedirs(staging_dir, mode=self.folder_mode)
+            res, offset = self.request_from(file_address, session_requests, 0)
+            reader = HashingReader(res.raw, md5_hash)
+            with tarfile.open(fileobj=reader, mode='r|gz') as tar:
+                extract_tar(tar, staging_dir)
+            reader.drain()
+            expected = res.headers.get('Content-Length')
+            if expected is not None and reader.size != int(expected):
+                raise IOError('received {} of {} bytes'
+                              .format(reader.size, expected))
+            self.record_download(file_address, res, reader.size)
+        except Exception as e:
+            logging.exception('Failed to download and extract {}: {}'
+                              .format(file_name, e))
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            return False
+        return md5_hash.hexdigest()
+
+    def stream_from(self, file_address, part_name, session_requests, offset,
+                    md5_hash=None):
+        """Write a file into part_name from a byte offset on
+
+        Args:
+            file_address (string): the link to the file needed to be download
+            part_name (string): the partial file to be completed
+            session_requests (object): requests session
+            offset (int): the size of part_name
+            md5_hash (object): a hashlib md5 object updated with the file
+        Return:
+            The response and the size of part_name; the size is None if
+            fewer bytes than announced were received
+        """
+        res, offset = self.request_from(file_address, session_requests,
+                                        offset)
+        if md5_hash is not None and offset:
+            # Only the resumed prefix is read back
+            self.hash_file(part_name, md5_hash)
+        if res.status_code == 416:
+            # part_name already holds the whole file
+            res.close()
+            return res, offset
+        totalSize = offset
+        with open(part_name, 'ab' if offset else 'wb') as output:
+            for chunk in res.iter_content(chunk_size=self.chunk_size,
+                                          decode_unicode=False):
+                if chunk:
+                    totalSize = totalSize + len(chunk)
+                    output.write(chunk)
+                    if md5_hash is not None:
+                        md5_hash.update(chunk)
+        expected = res.headers.get('Content-Length')
+        if expected is not None and totalSize - offset != int(expected):
+            logging.error('Received {} of {} bytes from {}'
+                          .format(totalSize - offset, expected,
+                                  file_address))
+            return res, None
+        return res, totalSize
+
+    def request_from(self, file_address, session_requests, offset):
+        """Request a file starting at a byte offset
+
+        Args:
+            file_address (string): the link to the file needed to be download
+            session_requests (object): requests session
+            offset (int): the number of bytes already downloaded
+        Return:
+            The streamed response and the offset its content starts at;
+            the offset is 0 if the server sent the whole file. If offset
+            is already the size of the file, the 416 response is
+            returned with offset and there is nothing left to read.
+        """
+        # Ask for the bytes as stored so that ranges and lengths
+        # refer to the file itself
+        headers = {'Accept-Encoding': 'identity'}
+        if offset > 0:
+            res = session_requests.get(
+                    file_address, stream=True,
+                    headers=dict(headers,
+                                 Range='bytes={}-'.format(offset)))
+            content_range = res.headers.get('Content-Range', '')
+            if res.status_code == 206 and \
+                    content_range.startswith('bytes {}-'.format(offset)):
+                return res, offset
+            if res.status_code == 200:
+                logging.info('Range not supported, restart {}'
+                             .format(file_address))
+                return res, 0
+            # A range starting at the end of the file is not satisfiable
+            if res.status_code == 416 and \
+                    content_range == 'bytes */{}'.format(offset):
+                logging.info('{} was already complete'.format(file_address))
+                return res, offset
+            res.close()
+        res = session_requests.get(file_address, stream=True,
+                                   headers=headers)
+        res.raise_for_status()
+        return res, 0
@@ -3,10 +3,11 @@ import shutil
 import tempfile
 import logging
 import time
+from hashlib import md5
 from Bio import Entrez
 from urllib.error import HTTPError
-from distutils.dir_util import copy_tree
 from brdm.NcbiData import NcbiData
+from brdm.TaxonomyIndex import TaxonomyIndex
 from brdm.RefDataInterface import RefDataInterface
 
 
@@ -24,6 +25,13 @@ class NcbiSubsetData(NcbiData, RefDataInterface):
         self.ext_accID = self.config['ncbi']['subsets']['ext_accID']
         self.ext_sequence = self.config['ncbi']['subsets']['ext_sequence']
         self.ext_taxonomy = self.config['ncbi']['subsets']['ext_taxonomy']
+        # Build an index of taxonomy_file in the backup folder if there
+        # is none next to it, for the next runs
+        self.taxonomy_cache = \
+            self.config['ncbi']['subsets'].get('taxonomy_cache', False)
+        # The taxonomy loaded by this run and the file it was loaded from
+        self.taxonomy = None
+        self.taxonomy_key = None
         try:
             self.destination_dir = os.path.join(
                         super(NcbiSubsetData, self).destination_dir,
@@ -77,21 +85,9 @@ class NcbiSubsetData(NcbiData, RefDataInterface):
         if not retrieve_success:
             logging.error('Failed: accID to fasta and taxonomy')
             return False
-        # Delete old files from the destination folder
-        # Copy new files from intermediate folder to destination folder
-        clean_ok = self.clean_destination_dir(self.destination_dir)
-        if not clean_ok:
-            return False
-        try:
-            copy_tree(temp_dir, self.destination_dir)
-            shutil.rmtree(temp_dir)
-        except Exception as e:
-            logging.error('Failed to move files from temp_dir to \
-            \ndestination folder, error{}'.format(e))
-            return False
-        # Format subsets
-        format_success = self.format(self.destination_dir)
-        if not format_success:
+        # Put the new files in place of the old ones and format subsets
+        promote_ok = self.promote(temp_dir, self.format)
+        if not promote_ok:
             logging.error('Failed: format subsets')
             return False
         return True
@@ -406,14 +402,86 @@ class NcbiSubsetData(NcbiData, RefDataInterface):
                 return False
         return True
 
+    # All the subsets of a run share the taxonomy; it is loaded again
+    # only if the file changed, e.g. by a taxonomy update
+    def get_taxonomy_provider(self):
+        """The lineages of the local taxonomy database by taxid
+
+        Return:
+            A TaxonomyIndex, or a dictionary if there is no index
+        """
+        stat = os.stat(self.path_to_taxonomy)
+        key = (self.path_to_taxonomy, stat.st_mtime, stat.st_size)
+        if key != self.taxonomy_key:
+            if isinstance(self.taxonomy, TaxonomyIndex):
+                self.taxonomy.close()
+            self.taxonomy = self.load_taxonomy(self.path_to_taxonomy, key)
+            self.taxonomy_key = key
+        return self.taxonomy
+
+    # Use the index written next to rankedlineage.txt by the taxonomy
+    # update; the text file is loaded only if the index is missing or
+    # was built from another version of the text file and
+    # taxonomy_cache is off
+    def load_taxonomy(self, filename, key):
+        """Load the local taxonomy database
+
+        Args:
+            filename (string): the rankedlineage.txt file
+            key (tuple): the path, modification time and size of filename
+        Return:
+            A TaxonomyIndex, or a dictionary if there is no index
+        """
+        index = self.open_index(os.path.splitext(filename)[0] + '.idx',
+                                filename)
+        if index is not None:
+            return index
+        if not self.taxonomy_cache:
+            logging.info('No taxonomy index of {}; loading it'
+                         .format(filename))
+            return self.parse_ranks(filename)
+        cache_file = os.path.join(
+            self.backup_dir, '.taxonomy_{}.idx'
+            .format(md5(repr(key).encode('utf-8')).hexdigest()))
+        index = self.open_index(cache_file, filename)
+        if index is not None:
+            return index
+        logging.info('Indexing {} into {}'.format(filename, cache_file))
+        for f in os.listdir(self.backup_dir):
+            if f.startswith('.taxonomy_') and f.endswith('.idx'):
+                os.remove(os.path.join(self.backup_dir, f))
+        TaxonomyIndex.build(filename, cache_file)
+        return TaxonomyIndex(cache_file)
+
+    def open_index(self, index_file, filename):
+        """The index of filename in index_file
+
+        Return:
+            A TaxonomyIndex; None if index_file is missing, is not an
+            index or was built from another version of filename
+        """
+        if not os.path.isfile(index_file):
+            return None
+        try:
+            index = TaxonomyIndex(index_file)
+        except ValueError:
+            logging.info('{} is not a taxonomy index'.format(index_file))
+            return None
+        if index.describes(filename):
+            return index
+        logging.info('{} was built from another version of {}'
+                     .format(index_file, filename))
+        index.close()
+        return None
+
     # load the rankslineage.txt
     def parse_ranks(self, filename):
         """Load local taxonomy database for get_taxonomy method"""
         taxid_to_names = dict()
         try:
             with open(filename) as fp:
-                content = fp.readlines()
-                for line in content[1:]:
+                next(fp, None)
+                for line in fp:
                     line = line[:-1]
                     x = line.split('\t')
                     tax_id, tax_name, level_8 = x
@@ -430,7 +498,7 @@ class NcbiSubsetData(NcbiData, RefDataInterface):
         sequence_file = open(sequence_file_name, 'w')
         try:
             taxon_file = open(taxon_file_name, 'w')
-            taxid_to_rank = self.parse_ranks(self.path_to_taxonomy)
+            taxid_to_rank = self.get_taxonomy_provider()
         except Exception as e:
             logging.error('Failed to load taxonomy file: {}'.format(e))
             return False
@@ -1,11 +1,13 @@
 import os
 import shutil
+import sqlite3
 import tempfile
 import logging
 import time
 import requests
-from distutils.dir_util import copy_tree
+from brdm.BaseRefData import CHUNK_SIZE
 from brdm.NcbiData import NcbiData
+from brdm.TaxonomyIndex import TaxonomyIndex
 from brdm.RefDataInterface import RefDataInterface
 
 
@@ -19,6 +21,12 @@ class NcbiTaxonomyData(NcbiData, RefDataInterface):
         self.download_file = self.config['ncbi']['taxonomy']['download_file']
         self.taxonomy_file = self.config['ncbi']['taxonomy']['taxonomy_file']
         self.info_file_name = self.config['ncbi']['taxonomy']['info_file_name']
+        self.read_segment_config(self.config['ncbi']['taxonomy'])
+        self.stream_extract = \
+            self.config['ncbi']['taxonomy'].get('stream_extract', False)
+        # Also load the ranked lineages into an SQLite database
+        self.build_sqlite = \
+            self.config['ncbi']['taxonomy'].get('build_sqlite', False)
         # Create destination directory and backup directory
         try:
             self.destination_dir = os.path.join(
@@ -43,6 +51,15 @@ class NcbiTaxonomyData(NcbiData, RefDataInterface):
         then format and backup the taxonomy information.
         """
         logging.info('Executing NCBI taxonomy update')
+        if self.conditional_update:
+            self.get_download_cache()
+            session_requests, connected = self.https_connect()
+            unchanged = self.inputs_unchanged(self.get_input_urls(),
+                                              session_requests)
+            session_requests.close()
+            if unchanged:
+                logging.info('NCBI taxonomy unchanged since the last update')
+                return True
         # Download files into the intermediate folder
         temp_dir = self.create_tmp_dir(self.destination_dir)
         if not temp_dir:
@@ -63,20 +80,21 @@ class NcbiTaxonomyData(NcbiData, RefDataInterface):
         if not backup_success:
             logging.error('Backup of taxonomy data did not succeed.')
             return False
-        # Delete old files from the destination folder
-        # Copy new files from intermediate folder to destination folder
-        clean_ok = self.clean_destination_dir(self.destination_dir)
-        if not clean_ok:
-            return False
-        try:
-            copy_tree(temp_dir, self.destination_dir)
-            shutil.rmtree(temp_dir)
-        except Exception as e:
-            logging.error('Failed to move files from temp_dir to \
-            \n destination folder, error{}'.format(e))
+        # Put the new files in place of the old ones
+        promote_ok = self.promote(temp_dir)
+        if not promote_ok:
             return False
+        if self.conditional_update:
+            self.get_download_cache().save()
         return True
 
+    def get_input_urls(self):
+        """The links to all the files downloaded by an update"""
+        file_url = os.path.join(self.login_url, self.download_folder)
+        return [os.path.join(file_url, self.info_file_name),
+                os.path.join(file_url, self.download_file + '.md5'),
+                os.path.join(file_url, self.download_file)]
+
     # Download taxonomy database
     def download(self, test=False):
         """Download the most recent taxonomy database"""
@@ -86,6 +104,7 @@ class NcbiTaxonomyData(NcbiData, RefDataInterface):
         files_download_failed = []
         max_download_attempts = self.download_retry_num
         file_name = self.download_file
+        staging_dir = '.' + file_name + '.extract'
         readme_success = False
         download_success = test
         unzip_success = False
@@ -111,11 +130,19 @@ class NcbiTaxonomyData(NcbiData, RefDataInterface):
                     # download taxdump zipped file
                     file_name_taxon = self.download_file
                     file_url_taxon = os.path.join(file_url, file_name_taxon)
-                    taxon_success = self.download_a_file(
-                            file_name_taxon, file_url_taxon, session_requests)
+                    if self.stream_extract:
+                        taxon_md5 = self.download_and_extract(
+                            file_name_taxon, file_url_taxon, session_requests,
+                            staging_dir)
+                    else:
+                        taxon_md5 = self.download_a_file(
+                            file_name_taxon, file_url_taxon, session_requests,
+                            compute_md5=True)
                     # check md5
-                    download_success = self.checksum(
-                                    file_name_md5, file_name_taxon)
+                    download_success = taxon_md5 and self.checksum(
+                                    file_name_md5, file_name_taxon, taxon_md5)
+                    if not download_success and self.stream_extract:
+                        shutil.rmtree(staging_dir, ignore_errors=True)
                 if download_success and readme_success:
                     completed = True
                 session_requests.close()
@@ -125,7 +152,10 @@ class NcbiTaxonomyData(NcbiData, RefDataInterface):
                 time.sleep(self.sleep_time)
 
         if completed and not test:
-            unzip_success = self.unzip_file(file_name_taxon)
+            if self.stream_extract:
+                unzip_success = self.move_extracted(staging_dir, '.')
+            else:
+                unzip_success = self.unzip_file(file_name_taxon)
         if not unzip_success and not test:
             files_download_failed.append(file_name)
             logging.error('Failed to download {} after {} attempts'
@@ -145,8 +175,12 @@ class NcbiTaxonomyData(NcbiData, RefDataInterface):
             execution_time=(time.time() - download_start_time))
         return True
 
-    def checksum(self, md5_file, file_name):
-        """Check the correctness of the downloaded file"""
+    def checksum(self, md5_file, file_name, md5_real=None):
+        """Check the correctness of the downloaded file
+
+        md5_real is the md5 code computed while downloading the file;
+        if it is given the file is not read again.
+        """
         try:
             with open(md5_file, 'r') as f:
                 md5_file_contents = f.read()
@@ -156,7 +190,7 @@ class NcbiTaxonomyData(NcbiData, RefDataInterface):
             logging.exception('Could not read MD5 file {}. \
             \nTry to download the file again'.format(file_name))
             return False
-        if not self.check_md5(file_name, md5_str):
+        if not self.check_md5(file_name, md5_str, md5_real):
             logging.warning('Failed in checking MD5. Download file again.')
             return False
         return True
@@ -167,24 +201,21 @@ class NcbiTaxonomyData(NcbiData, RefDataInterface):
         dmp_file = filename+'.dmp'
         taxonomy_file = filename+'.txt'
         try:
-            taxonomy = open(taxonomy_file, 'w')
-            taxonomy.write(
-                'taxon_id\ttaxon_name\td__domain; k__kingdom; p__phylum; '
-                + 'c__class; o__order; f__family; g__genus; s__species\n')
-            with open(dmp_file) as fp:
-                content = fp.readlines()
-                for line in content:
-                    line = line[:-3]
-                    x = line.split('\t|\t')
-                    tax_id, tax_name, species, genus, family, order, \
-                        taxon_class, phylum, kingdom, superkingdom = x
-                    taxonomy.write(tax_id + '\t' + tax_name + '\td__'
-                                   + superkingdom + '; k__' + kingdom
-                                   + '; p__' + phylum + '; c__'
-                                   + taxon_class + '; o__' + order + '; f__'
-                                   + family + '; g__' + genus + '; s__'
-                                   + species + '\n')
-            taxonomy.close()
+            start_time = time.time()
+            rows = self.write_taxonomy(dmp_file, taxonomy_file)
+            seconds = max(time.time() - start_time, 1e-6)
+            logging.info('Formatted {} taxa in {:.1f}s, {:.0f} rows/sec'
+                         .format(rows, seconds, rows / seconds))
+            # The binary index lets subsets look up lineages without
+            # loading the taxonomy file
+            TaxonomyIndex.build(taxonomy_file, filename + '.idx')
+            if self.build_sqlite:
+                start_time = time.time()
+                rows = self.write_taxonomy_sqlite(dmp_file,
+                                                  filename + '.sqlite')
+                logging.info('Loaded {} taxa into {}.sqlite in {:.1f}s'
+                             .format(rows, filename,
+                                     time.time() - start_time))
         except Exception as e:
             logging.exception('Failed to format taxonomy file')
             return False
@@ -192,11 +223,14 @@ class NcbiTaxonomyData(NcbiData, RefDataInterface):
         app_readme_file = self.config['readme_file']
         ncbi_readme_file = self.info_file_name
         taxonomy_file = self.taxonomy_file + '.txt'
+        taxonomy_index = self.taxonomy_file + '.idx'
+        taxonomy_db = self.taxonomy_file + '.sqlite'
         try:
             only_files = [f for f in os.listdir('.') if os.path.isfile(f)]
             for f in only_files:
                 if not f == app_readme_file and not f == ncbi_readme_file \
-                      and not f == taxonomy_file:
+                      and not f == taxonomy_file and not f == taxonomy_index \
+                      and not f == taxonomy_db:
                     os.remove(f)
                 else:
                     os.chmod(f, self.file_mode)
@@ -205,8 +239,111 @@ class NcbiTaxonomyData(NcbiData, RefDataInterface):
             return False
         return True
 
+    @staticmethod
+    def write_taxonomy(dmp_file, taxonomy_file):
+        """Write rankedlineage.dmp as the ranked lineages of every taxon
+
+        The dump is read as bytes, CHUNK_SIZE of lines at a time, and
+        every batch of lines is formatted and written at once; there is
+        no decoding and memory does not grow with the dump.
+        Args:
+            dmp_file (string): rankedlineage.dmp from the NCBI taxdump
+            taxonomy_file (string): the taxonomy file written
+        Return:
+            The number of taxa written
+        """
+        line_format = b'%s\t%s\td__%s; k__%s; p__%s; c__%s; o__%s; ' \
+            + b'f__%s; g__%s; s__%s\n'
+        rows = 0
+        with open(dmp_file, 'rb') as fp, \
+                open(taxonomy_file, 'wb') as taxonomy:
+            taxonomy.write(
+                b'taxon_id\ttaxon_name\td__domain; k__kingdom; p__phylum; '
+                + b'c__class; o__order; f__family; g__genus; s__species\n')
+            while True:
+                lines = fp.readlines(CHUNK_SIZE)
+                if not lines:
+                    break
+                output = []
+                for line in lines:
+                    # tax_id, tax_name, species, genus, family, order,
+                    # class, phylum, kingdom and superkingdom
+                    x = line[:-3].split(b'\t|\t')
+                    if len(x) != 10:
+                        raise ValueError('Expected 10 fields in line {} of '
+                                         '{}'.format(rows + 1, dmp_file))
+                    output.append(line_format % (x[0], x[1], x[9], x[8],
+                                                 x[7], x[6], x[5], x[4],
+                                                 x[3], x[2]))
+                    rows += 1
+                taxonomy.write(b''.join(output))
+        return rows
+
+    @staticmethod
+    def write_taxonomy_sqlite(dmp_file, db_file):
+        """Load rankedlineage.dmp into an SQLite database
+
+        The table taxonomy has the taxid as primary key, the name of the
+        taxon, its ranks from species to superkingdom and the lineage as
+        written to the taxonomy file; names are indexed. The rows are
+        streamed into executemany in a single transaction, the index is
+        created after the load and the database is renamed into place
+        once complete; on error the partial database is removed.
+        Args:
+            dmp_file (string): rankedlineage.dmp from the NCBI taxdump
+            db_file (string): the database written
+        Return:
+            The number of taxa loaded
+        """
+        def rows(fp):
+            for line in fp:
+                x = line[:-3].split('\t|\t')
+                if len(x) != 10:
+                    raise ValueError('Expected 10 fields in {}: {}'
+                                     .format(dmp_file, line))
+                yield (int(x[0]), x[1], x[2], x[3], x[4], x[5], x[6],
+                       x[7], x[8], x[9],
+                       'd__{9}; k__{8}; p__{7}; c__{6}; o__{5}; f__{4}; '
+                       'g__{3}; s__{2}'.format(*x))
+
+        tmp_file = db_file + '.tmp'
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        try:
+            connection = sqlite3.connect(tmp_file)
+            try:
+                connection.execute('PRAGMA journal_mode = OFF')
+                connection.execute('PRAGMA synchronous = OFF')
+                with connection, open(dmp_file) as fp:
+                    connection.execute(
+                        'CREATE TABLE taxonomy ('
+                        'taxid INTEGER PRIMARY KEY, name TEXT, '
+                        'species TEXT, genus TEXT, family TEXT, '
+                        '"order" TEXT, class TEXT, phylum TEXT, '
+                        'kingdom TEXT, superkingdom TEXT, lineage TEXT)')
+                    connection.executemany(
+                        'INSERT INTO taxonomy VALUES '
+                        '(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows(fp))
+                    connection.execute(
+                        'CREATE INDEX taxonomy_name ON taxonomy (name)')
+                count = connection.execute(
+                            'SELECT COUNT(*) FROM taxonomy').fetchone()[0]
+            finally:
+                connection.close()
+            os.replace(tmp_file, db_file)
+        except Exception:
+            # No partial database is left behind
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            raise
+        return count
+
     def backup(self):
-        """Backup the taxonomy information"""
+        """Backup the taxonomy information
+
+        All the files left by format_taxonomy are copied: the taxonomy
+        file, its index and, with build_sqlite, its SQLite database.
+        """
         logging.info('Executing NCBI taxonomy backup')
         backup_folder = self.create_backup_dir()
         if not backup_folder:
@@ -214,8 +351,10 @@ class NcbiTaxonomyData(NcbiData, RefDataInterface):
             return False
         try:
             src_files = [f for f in os.listdir('.') if os.path.isfile(f)]
+            # copy2 keeps the modification times, which the index
+            # records for rankedlineage.txt
             for filename in src_files:
-                shutil.copy(filename, backup_folder)
+                shutil.copy2(filename, backup_folder)
         except Exception as e:
             logging.exception('Failed in NCBI taxonomy Backup: {}'.format(e))
             return False
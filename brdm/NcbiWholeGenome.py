@@ -1,14 +1,28 @@
 import os
+import gzip
 import shutil
+import subprocess
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import tempfile
 import logging
 import time
-from distutils.dir_util import copy_tree
 import requests
 from hashlib import md5
+from brdm.BaseRefData import CHUNK_SIZE
+from brdm.AssemblySummary import AssemblySummary
+from brdm.BgzfFasta import BgzfFasta
+from brdm.DownloadScheduler import DownloadScheduler
+from brdm.Md5Cache import Md5Cache
 from brdm.NcbiData import NcbiData
 from brdm.RefDataInterface import RefDataInterface
 
+# Lists the genomes of every blast batch of a set, in its Blast folder
+BATCH_MANIFEST = 'batches.txt'
+# Lists the genomes of a set with their md5 codes, from NCBI and of the
+# stored files
+GENOME_MANIFEST = 'genome_md5.txt'
+
 
 class NcbiWholeGenome(NcbiData, RefDataInterface):
 
@@ -24,6 +38,51 @@ class NcbiWholeGenome(NcbiData, RefDataInterface):
         self.assembly_level = \
             self.config['ncbi']['whole_genome']['assembly_level']
         self.species = self.config['ncbi']['whole_genome']['species']
+        # Filters on the columns of the assembly summary, on top of
+        # assembly_level
+        self.assembly_filters = self.config['ncbi']['whole_genome'].get(
+                                    'assembly_filters') or {}
+        self.download_backend = self.config['ncbi']['whole_genome'].get(
+                                    'download_backend', 'requests')
+        self.async_max_requests = self.config['ncbi']['whole_genome'].get(
+                                    'async_max_requests', 200)
+        self.async_max_per_host = self.config['ncbi']['whole_genome'].get(
+                                    'async_max_per_host', 50)
+        # Threads writing, checking and storing the genomes of the
+        # asyncio backend, off its event loop
+        self.async_io_workers = self.config['ncbi']['whole_genome'].get(
+                                    'async_io_workers', 4)
+        # fna: genomes are unzipped; gz: they are kept as downloaded;
+        # bgzf: they are block compressed with .fai and .gzi indexes
+        self.genome_format = self.config['ncbi']['whole_genome'].get(
+                                    'genome_format', 'fna')
+        # Download only the assemblies added or replaced since the last
+        # update; the others are carried forward
+        self.incremental = self.config['ncbi']['whole_genome'].get(
+                                    'incremental', False)
+        # Genomes per blast sub-database; 0 builds a single database
+        self.blast_batch_size = self.config['ncbi']['whole_genome'].get(
+                                    'blast_batch_size', 0)
+        # Genomes of all the sets downloaded at once by the requests
+        # backend, in total and per host; 1 downloads them one by one
+        self.download_workers = self.config['ncbi']['whole_genome'].get(
+                                    'download_workers', 1)
+        self.max_per_host = self.config['ncbi']['whole_genome'].get(
+                                    'max_per_host', self.download_workers)
+        # The largest genomes are started first; sizes are read from the
+        # genome_size column of the assembly summary, and from HEAD
+        # requests for the others if head_sizes is set
+        self.head_sizes = self.config['ncbi']['whole_genome'].get(
+                                    'head_sizes', False)
+        self.assembly_sizes = {}
+        # Parsed md5 files of the assembly folders, in the backup folder
+        self.md5_cache = None
+        self.md5_cache_file = self.config['ncbi']['whole_genome'].get(
+                                    'md5_cache_file', '.md5_cache.sqlite')
+        self.md5_cache_size = self.config['ncbi']['whole_genome'].get(
+                                    'md5_cache_size', 4096)
+        self.md5_workers = self.config['ncbi']['whole_genome'].get(
+                                    'md5_workers', 8)
         try:
             self.destination_dir = os.path.join(
                     super(NcbiWholeGenome, self).destination_dir,
@@ -49,7 +108,9 @@ class NcbiWholeGenome(NcbiData, RefDataInterface):
             logging.error('Failed to create the temp_dir {}, error: {}'
                           .format(temp_dir, e))
             return False
+        self.open_download_state(temp_dir)
         success = self.download(download_file_max=file_number)
+        self.close_md5_cache()
         if not success:
             logging.error('Download failed. Update will not proceed.')
             return False
@@ -66,25 +127,24 @@ class NcbiWholeGenome(NcbiData, RefDataInterface):
         if not backup_success:
             logging.error('Failed to backup; The update will not continue.')
             return False
-        # Delete old files from the destination folder
-        # Copy new files from intermediate folder to destination folder
-        clean_ok = self.clean_destination_dir(self.destination_dir)
-        if not clean_ok:
-            return False
+        self.close_download_state()
+        # Put the new files in place of the old ones and format them
+        promote_ok = self.promote(temp_dir, self.prepare_genomes)
+        if promote_ok:
+            self.finish_download_state()
+        return promote_ok
+
+    def prepare_genomes(self, dest_folder):
+        """Set the mode of the set folders and format the genomes"""
         try:
-            copy_tree(temp_dir, self.destination_dir)
-            shutil.rmtree(temp_dir)
-            for f in os.listdir('.'):
-                if os.path.isdir(f):
-                    os.chmod(f, self.folder_mode)
+            for a_set in self.species:
+                set_folder = os.path.join(dest_folder, a_set)
+                if os.path.isdir(set_folder):
+                    os.chmod(set_folder, self.folder_mode)
         except Exception as e:
-            logging.error('Failed to move files to destination folder: {}'
-                          .format(e))
+            logging.error('Failed to change folder mode: {}'.format(e))
             return False
-        format_ok = self.format(self.destination_dir)
-        if not format_ok:
-            return False
-        return True
+        return self.format(dest_folder)
 
     # Download taxonomy database
     def download(self, download_file_max=3):
@@ -114,12 +174,23 @@ class NcbiWholeGenome(NcbiData, RefDataInterface):
             logging.error('Failed to download readme after all attempts')
             return False
         downloaded_file = []
+        readme_sections = []
+        comment = 'This folder contains whole genome sequences that '\
+            + 'downloaded from NCBI.'
+        state = self.download_state
+        # Sets whose genomes are left to download_genomes_scheduled
+        scheduled = OrderedDict()
         for a_set in self.species:
             folder_name = a_set
+            # Genomes unzipped by an interrupted run of this update
+            resumed = {}
+            if state is not None:
+                resumed = state.completed(a_set, extracted=True)
             try:
-                if os.path.exists(folder_name):
+                if os.path.exists(folder_name) and not resumed:
                     shutil.rmtree(folder_name)
-                os.makedirs(folder_name, mode=self.folder_mode)
+                if not os.path.exists(folder_name):
+                    os.makedirs(folder_name, mode=self.folder_mode)
                 os.chdir(folder_name)
             except Exception as e:
                 logging.error('Failed to create a folder {} : {}'
@@ -148,8 +219,31 @@ class NcbiWholeGenome(NcbiData, RefDataInterface):
                               .format(a_set, e))
                 return False
 
+            if self.incremental:
+                diff = self.diff_assembly_summary(a_set)
+                if diff is None:
+                    return False
+                file_list, carried, changes = diff
+                if self.blast_batch_size > 0 and \
+                        not self.link_blast_batches(a_set):
+                    return False
+                downloaded_file.extend(
+                    [a_set + '\t' + a_file.replace('ftp://', 'https://')
+                     for a_file in carried])
+                comment += ' Incremental update of {}: {} added, {} '\
+                    'replaced, {} withdrawn, {} unchanged.'\
+                    .format(a_set, len(changes['added']),
+                            len(changes['replaced']),
+                            len(changes['withdrawn']), len(carried))
+                readme_sections.append((
+                    'Assembly changes in {} since the last update'
+                    .format(a_set),
+                    ['{} {}'.format(change, accession)
+                     for change in ('added', 'replaced', 'withdrawn')
+                     for accession in changes[change]]))
+
             attempt = 0
-            if len(file_list) == 0:
+            if len(file_list) == 0 and not self.incremental:
                 logging.error('Failed to get the file list to download')
                 return False
             download_file_number = len(file_list)
@@ -159,45 +253,86 @@ class NcbiWholeGenome(NcbiData, RefDataInterface):
             downloaded = 0
             file_list_downloaded = []
             file_list_failed = []
-            completed = False
-            while attempt < max_download_attempts and not completed:
-                attempt += 1
-                try:
-                    session_requests, connected = self.https_connect()
-                    logging.info('total file number in set {} is {}'
-                                 .format(a_set, len(file_list)))
-                    for a_file in file_list:
-                        if a_file not in file_list_downloaded:
-                            # download a genome zipped file
-                            file_name = a_file.split('/')[-1]
-                            file_url = a_file.replace('ftp://', 'https://')
-                            seq_file = self.download_a_file(
-                                        file_name, file_url, session_requests)
-                            md5_name = self.config['ncbi']['whole_genome'
-                                                           ]['md5_file_name']
-                            md5_url = file_url.replace(file_name, md5_name)
-                            md5_file = self.download_a_file(
-                                        md5_name, md5_url, session_requests)
-                            md5_code = self.read_md5(md5_name, file_name)
-                            a_file_success = self.check_md5(
-                                                    file_name, md5_code)
-                            if a_file_success:
-                                unzip_success = self.unzip_file(file_name)
-                            if unzip_success:
-                                downloaded += 1
-                                downloaded_file.append(a_set+'\t'+file_url)
-                                file_list_downloaded.append(a_file)
-                            if downloaded == download_file_number:
-                                completed = True
-                                break
-                    session_requests.close()
-                except Exception as e:
-                    logging.error('Failed to download {} on attempt {}: {}'
-                                  .format(a_set, attempt, e))
-                    time.sleep(self.sleep_time)
+            if state is not None:
+                state.plan(a_set, [(a_file.replace('ftp://', 'https://'),
+                                    a_file.split('/')[-1])
+                                   for a_file in file_list])
+                file_list_downloaded = self.resumed_genomes(
+                                file_list, resumed, download_file_number)
+                downloaded = len(file_list_downloaded)
+                downloaded_file.extend(
+                    [a_set + '\t' + a_file.replace('ftp://', 'https://')
+                     for a_file in file_list_downloaded])
+            completed = downloaded == download_file_number
+            if self.download_backend == 'asyncio' and not completed:
+                skipped = set(file_list_downloaded)
+                file_urls = self.download_genomes_async(
+                                [f for f in file_list if f not in skipped],
+                                download_file_number - downloaded)
+                downloaded += len(file_urls)
+                downloaded_file.extend([a_set + '\t' + file_url
+                                        for file_url in file_urls])
+                completed = downloaded == download_file_number
+            elif self.download_workers > 1 and not completed:
+                scheduled[a_set] = (
+                    os.getcwd(),
+                    [f for f in file_list if f not in file_list_downloaded],
+                    download_file_number - downloaded)
+                os.chdir('..')
+                continue
+            elif self.download_backend != 'asyncio':
+                self.prefetch_md5(
+                    [f for f in file_list if f not in file_list_downloaded]
+                    [:download_file_number - downloaded])
+                while attempt < max_download_attempts and not completed:
+                    attempt += 1
+                    try:
+                        session_requests, connected = self.https_connect()
+                        logging.info('total file number in set {} is {}'
+                                     .format(a_set, len(file_list)))
+                        for a_file in file_list:
+                            if a_file not in file_list_downloaded:
+                                # download a genome zipped file
+                                file_name = a_file.split('/')[-1]
+                                file_url = a_file.replace('ftp://',
+                                                          'https://')
+                                seq_md5 = self.download_a_file(
+                                            file_name, file_url,
+                                            session_requests,
+                                            compute_md5=True)
+                                seq_size = os.path.getsize(file_name) \
+                                    if seq_md5 else 0
+                                a_file_success = seq_md5 and \
+                                    self.check_genome(file_name, file_url,
+                                                      seq_md5,
+                                                      session_requests)
+                                unzip_success = False
+                                if a_file_success:
+                                    unzip_success = \
+                                        self.store_genome(file_name)
+                                if state is not None:
+                                    state.record(file_url, seq_size, seq_md5,
+                                                 a_file_success,
+                                                 unzip_success)
+                                if unzip_success:
+                                    downloaded += 1
+                                    downloaded_file.append(a_set+'\t'+file_url)
+                                    file_list_downloaded.append(a_file)
+                                if downloaded == download_file_number:
+                                    completed = True
+                                    break
+                        session_requests.close()
+                    except Exception as e:
+                        logging.error('Failed to download {} on attempt {}: {}'
+                                      .format(a_set, attempt, e))
+                        time.sleep(self.sleep_time)
 
             if completed:
                 try:
+                    self.write_genome_manifest(
+                        a_set, '.', [line.split('\t', 1)[1]
+                                     for line in downloaded_file
+                                     if line.split('\t', 1)[0] == a_set])
                     only_files = \
                         [f for f in os.listdir('.') if os.path.isfile(f)]
                     for f in only_files:
@@ -212,31 +347,616 @@ class NcbiWholeGenome(NcbiData, RefDataInterface):
                              .format(a_set))
                 return False
 
+        if scheduled:
+            file_urls = self.download_genomes_scheduled(scheduled)
+            for a_set, (set_folder, file_list, wanted) in scheduled.items():
+                downloaded_file.extend([a_set + '\t' + file_url
+                                        for file_url in file_urls[a_set]])
+                if len(file_urls[a_set]) < wanted:
+                    logging.info('Failed to download {} after all attempts'
+                                 .format(a_set))
+                    return False
+                try:
+                    self.write_genome_manifest(
+                        a_set, set_folder,
+                        [line.split('\t', 1)[1] for line in downloaded_file
+                         if line.split('\t', 1)[0] == a_set])
+                    for f in os.listdir(set_folder):
+                        f = os.path.join(set_folder, f)
+                        if os.path.isfile(f):
+                            os.chmod(f, self.file_mode)
+                except Exception as e:
+                    logging.error('Failed to change file mode')
+                    return False
+
         files_download_failed = []
         # Write the README+ file
-        comment = 'This folder contains whole genome sequences that '\
-            + 'downloaded from NCBI.'
         self.write_readme(download_url='{}/{}/'
                           .format(self.login_url, self.download_folder),
                           downloaded_files=downloaded_file,
                           download_failed_files=files_download_failed,
                           comment=comment,
-                          execution_time=(time.time() - download_start_time))
+                          execution_time=(time.time() - download_start_time),
+                          sections=readme_sections)
+        return True
+
+    # The md5 file of an assembly folder lists all its files; it is
+    # parsed once and kept in the md5 cache for the next updates
+    def get_md5_cache(self):
+        """The md5 cache of the whole genomes, opened on first use"""
+        if self.md5_cache is None:
+            self.md5_cache = Md5Cache(
+                os.path.join(self.backup_dir, self.md5_cache_file),
+                self.md5_cache_size)
+        return self.md5_cache
+
+    def close_md5_cache(self):
+        """Close the md5 cache if it is open"""
+        if self.md5_cache is not None:
+            self.md5_cache.close()
+            self.md5_cache = None
+
+    def fetch_md5_map(self, folder_url, session_requests=None):
+        """Fetch the md5 file of an assembly folder into the md5 cache
+
+        Return:
+            A dictionary of file name to md5 code; None on failure
+        """
+        md5_name = self.config['ncbi']['whole_genome']['md5_file_name']
+        md5_url = '{}/{}'.format(folder_url, md5_name)
+        if session_requests is None:
+            session_requests = self.get_session(md5_url)
+        try:
+            res = session_requests.get(md5_url)
+            res.raise_for_status()
+            checksums = Md5Cache.parse(res.text)
+        except Exception as e:
+            logging.error('Failed to fetch {}: {}'.format(md5_url, e))
+            return None
+        self.get_md5_cache().put(folder_url, checksums)
+        return checksums
+
+    def prefetch_md5(self, file_links):
+        """Fetch the md5 files of the genomes not cached yet, concurrently
+
+        Args:
+            file_links (list): links to genome files
+        """
+        folder_urls = self.get_md5_cache().missing(
+                        [a_file.replace('ftp://', 'https://').rsplit('/', 1)[0]
+                         for a_file in file_links])
+        if not folder_urls:
+            return
+        logging.info('Fetching {} md5 files'.format(len(folder_urls)))
+        DownloadScheduler(self.md5_workers).run(
+            [(None, folder_url, self.fetch_md5_map, (folder_url,))
+             for folder_url in folder_urls])
+
+    def genome_md5(self, file_url, session_requests=None):
+        """The md5 code of a genome; None if it cannot be found"""
+        folder_url, file_name = file_url.rsplit('/', 1)
+        checksums = self.get_md5_cache().get(folder_url)
+        if checksums is None:
+            checksums = self.fetch_md5_map(folder_url, session_requests)
+        if checksums is None:
+            return None
+        return checksums.get(file_name)
+
+    def check_genome(self, file_path, file_url, seq_md5,
+                     session_requests=None):
+        """Check a downloaded genome against the md5 code of NCBI
+
+        If the codes do not match, the md5 file of the folder is fetched
+        again on the next attempt.
+        """
+        md5_code = self.genome_md5(file_url, session_requests)
+        if self.check_md5(file_path, md5_code, seq_md5):
+            return True
+        logging.error('Failed md5 check of {}'.format(file_path))
+        self.get_md5_cache().discard(file_url.rsplit('/', 1)[0])
+        return False
+
+    def get_async_downloader(self):
+        """The asyncio backend, logged in with the NCBI account"""
+        from brdm.AsyncDownloader import AsyncDownloader
+        login_data = {
+                'username': self.ncbi_user,
+                'password': self.ncbi_passw
+                }
+        return AsyncDownloader(self.chunk_size, self.file_mode,
+                               max_requests=self.async_max_requests,
+                               max_per_host=self.async_max_per_host,
+                               login_url=self.login_url,
+                               login_data=login_data,
+                               io_workers=self.async_io_workers)
+
+    # Download, check and unzip a batch of genomes on the asyncio backend
+    def fetch_genomes_async(self, downloader, genomes):
+        """Download genomes concurrently and check them
+
+        The md5 files not in the md5 cache are fetched in memory first.
+        Args:
+            downloader (object): an AsyncDownloader
+            genomes (list): (path to the file, link to the file) pairs
+        Return:
+            The links of the genomes downloaded, checked and unzipped
+        """
+        md5_cache = self.get_md5_cache()
+        md5_name = self.config['ncbi']['whole_genome']['md5_file_name']
+        folder_urls = md5_cache.missing(
+                        [file_url.rsplit('/', 1)[0]
+                         for file_path, file_url in genomes])
+        md5_texts = downloader.fetch_texts(
+                        ['{}/{}'.format(folder_url, md5_name)
+                         for folder_url in folder_urls])
+        for folder_url, md5_text in zip(folder_urls, md5_texts):
+            if md5_text is not None:
+                md5_cache.put(folder_url, Md5Cache.parse(md5_text))
+        stored = downloader.download_files(genomes, compute_md5=True,
+                                           check=self.check_and_store)
+        return [file_url for (file_path, file_url), success
+                in zip(genomes, stored) if success]
+
+    # Runs on an io thread of the asyncio backend, off the event loop
+    def check_and_store(self, file_path, file_url, seq_md5):
+        """Check and store a genome downloaded by the asyncio backend
+
+        Args:
+            file_path (string): the path to the file downloaded
+            file_url (string): the link to the file
+            seq_md5 (string): the md5 code computed while downloading;
+                False if the download failed
+        Return:
+            True if the genome is checked and stored; otherwise False
+        """
+        if not seq_md5:
+            return False
+        seq_size = os.path.getsize(file_path)
+        a_file_success = self.check_genome(file_path, file_url, seq_md5)
+        unzip_success = False
+        if a_file_success:
+            unzip_success = self.store_genome(file_path)
+        if self.download_state is not None:
+            self.download_state.record(file_url, seq_size, seq_md5,
+                                       a_file_success, unzip_success)
+        return unzip_success
+
+    def store_genome(self, file_name):
+        """Keep a checked genome file in the configured genome_format"""
+        if self.genome_format == 'fna':
+            return self.unzip_file(file_name)
+        try:
+            stored_files = [file_name]
+            if self.genome_format == 'bgzf':
+                BgzfFasta.convert(file_name, file_name)
+                stored_files += [file_name + '.fai', file_name + '.gzi']
+            for f in stored_files:
+                os.chmod(f, self.file_mode)
+        except Exception as e:
+            logging.error('Failed to store genome {}: {}'
+                          .format(file_name, e))
+            return False
         return True
 
-    def read_md5(self, md5_file, file_name):
-        """Read md5 code from md5 file"""
+    def stored_genome_name(self, file_name):
+        """The name a downloaded genome file is kept under"""
+        if self.genome_format == 'fna':
+            return file_name[:-len('.gz')]
+        return file_name
+
+    def resumed_genomes(self, file_list, resumed, download_file_number):
+        """Genomes of file_list already unzipped in the current folder
+
+        Args:
+            file_list (list): the links parsed from the assembly summary
+            resumed (dict): links of the genomes unzipped by an earlier
+                run of the update, from the download state
+            download_file_number (int): the number of genomes wanted
+        Return:
+            Up to download_file_number entries of file_list to skip
+        """
+        result = []
+        for a_file in file_list:
+            if len(result) == download_file_number:
+                break
+            file_url = a_file.replace('ftp://', 'https://')
+            stored_name = self.stored_genome_name(a_file.split('/')[-1])
+            if file_url in resumed and os.path.isfile(stored_name):
+                result.append(a_file)
+        if result:
+            logging.info('Resuming with {} genomes already downloaded'
+                         .format(len(result)))
+        return result
+
+    def download_genomes_async(self, file_list, download_file_number):
+        """Download genomes of a set into the current folder concurrently
+
+        As with the requests backend, a genome that fails is passed over
+        for the next ones of the list and retried on the next attempt.
+        Args:
+            file_list (list): the links parsed from the assembly summary
+            download_file_number (int): the number of genomes wanted
+        Return:
+            The https links of the genomes downloaded
+        """
+        downloader = self.get_async_downloader()
+        downloaded = []
+        done = set()
+        attempt = 0
+        try:
+            while attempt < self.download_retry_num \
+                    and len(downloaded) < download_file_number:
+                attempt += 1
+                tried = set()
+                while len(downloaded) < download_file_number:
+                    wanted = download_file_number - len(downloaded)
+                    batch = []
+                    for a_file in file_list:
+                        if a_file not in done and a_file not in tried:
+                            batch.append(a_file)
+                            if len(batch) == wanted:
+                                break
+                    if not batch:
+                        break
+                    tried.update(batch)
+                    genomes = [(a_file.split('/')[-1],
+                                a_file.replace('ftp://', 'https://'))
+                               for a_file in batch]
+                    succeeded = set(self.fetch_genomes_async(downloader,
+                                                             genomes))
+                    for a_file, (file_name, file_url) in zip(batch, genomes):
+                        if file_url in succeeded:
+                            done.add(a_file)
+                            downloaded.append(file_url)
+                if len(downloaded) < download_file_number:
+                    logging.error('Downloaded {} of {} genomes on attempt {}'
+                                  .format(len(downloaded),
+                                          download_file_number, attempt))
+                    time.sleep(self.sleep_time)
+        except Exception as e:
+            logging.exception('Failed to download genomes: {}'.format(e))
+        finally:
+            downloader.close()
+        return downloaded
+
+    # The genomes of all the sets share one scheduler; every worker
+    # writes to absolute paths instead of changing the current folder
+    def download_genomes_scheduled(self, scheduled):
+        """Download the genomes of many sets concurrently
+
+        As with the sequential download, a genome that fails is passed
+        over for the next ones of its set and retried on the next
+        attempt. The largest genomes are started first, by the sizes of
+        the assembly summary or, with head_sizes, of HEAD requests.
+        Args:
+            scheduled (dict): set to (set folder, links parsed from the
+                assembly summary, number of genomes wanted)
+        Return:
+            A dictionary of set to the https links of its genomes
+            downloaded
+        """
+        scheduler = DownloadScheduler(self.download_workers,
+                                      self.max_per_host)
+        downloaded = dict((a_set, []) for a_set in scheduled)
+        done = set()
+        attempt = 0
+        while attempt < self.download_retry_num and \
+                any(len(downloaded[a_set]) < scheduled[a_set][2]
+                    for a_set in scheduled):
+            attempt += 1
+            tried = set()
+            while True:
+                batch = []
+                for a_set, (set_folder, file_list, wanted) in \
+                        scheduled.items():
+                    missing = wanted - len(downloaded[a_set])
+                    for a_file in file_list:
+                        if missing == 0:
+                            break
+                        if a_file not in done and a_file not in tried:
+                            batch.append((a_set, set_folder, a_file))
+                            missing -= 1
+                if not batch:
+                    break
+                tried.update(a_file for a_set, set_folder, a_file in batch)
+                file_urls = [a_file.replace('ftp://', 'https://')
+                             for a_set, set_folder, a_file in batch]
+                self.prefetch_md5(file_urls)
+                sizes = [self.assembly_sizes.get(a_file)
+                         for a_set, set_folder, a_file in batch]
+                if self.head_sizes:
+                    unknown = [i for i, size in enumerate(sizes)
+                               if size is None]
+                    head_sizes = scheduler.run(
+                                    [(None, file_urls[i], self.genome_size,
+                                      (file_urls[i],)) for i in unknown])
+                    for i, size in zip(unknown, head_sizes):
+                        sizes[i] = size
+                results = scheduler.run(
+                            [(size, file_url, self.fetch_genome, job)
+                             for job, file_url, size in
+                             zip(batch, file_urls, sizes)])
+                for (a_set, set_folder, a_file), file_url, result in \
+                        zip(batch, file_urls, results):
+                    if result:
+                        done.add(a_file)
+                        downloaded[a_set].append(file_url)
+            short = sum(max(scheduled[a_set][2] - len(downloaded[a_set]), 0)
+                        for a_set in scheduled)
+            if short:
+                logging.error('{} genomes missing after attempt {}'
+                              .format(short, attempt))
+                time.sleep(self.sleep_time)
+        return downloaded
+
+    def genome_size(self, file_url):
+        """The size of a genome file from a HEAD request; None if unknown"""
+        try:
+            res = self.get_session(file_url).head(file_url,
+                                                  allow_redirects=True)
+            res.raise_for_status()
+            return int(res.headers['Content-Length'])
+        except Exception as e:
+            logging.warning('Failed to get the size of {}: {}'
+                            .format(file_url, e))
+            return None
+
+    def fetch_genome(self, a_set, set_folder, a_file):
+        """Download, check and store a genome into its set folder
+
+        Return:
+            True if the genome is stored; otherwise False
+        """
+        file_name = a_file.split('/')[-1]
+        file_path = os.path.join(set_folder, file_name)
+        file_url = a_file.replace('ftp://', 'https://')
+        session_requests, connected = self.https_connect()
+        seq_md5 = self.download_a_file(file_path, file_url,
+                                       session_requests, compute_md5=True)
+        if not seq_md5:
+            return False
+        seq_size = os.path.getsize(file_path)
+        a_file_success = self.check_genome(file_path, file_url, seq_md5,
+                                           session_requests)
+        store_success = False
+        if a_file_success:
+            store_success = self.store_genome(file_path)
+        if self.download_state is not None:
+            self.download_state.record(file_url, seq_size, seq_md5,
+                                       a_file_success, store_success)
+        return store_success
+
+    def genome_link(self, ftp_path):
+        """The link to the genome file of an assembly folder"""
+        return '{}/{}_genomic.fna.gz'.format(ftp_path, ftp_path.split('/')[-1])
+
+    def read_assemblies(self, assembly_file):
+        """The assemblies of an assembly summary to download
+
+        Only the assemblies at assembly_level that pass assembly_filters
+        and have an ftp_path are kept.
+        Return:
+            A generator of dictionaries of column name to value
+        """
+        filters = dict(self.assembly_filters)
+        filters['assembly_level'] = [self.assembly_level]
+        for entry in AssemblySummary(filters).read(assembly_file):
+            if entry['ftp_path'] != 'na':
+                genome_size = entry.get('genome_size', '')
+                if genome_size.isdigit():
+                    self.assembly_sizes[self.genome_link(
+                        entry['ftp_path'])] = int(genome_size)
+                yield entry
+
+    def read_assembly_entries(self, assembly_file):
+        """Read the assemblies to download of an assembly summary
+
+        Return:
+            An ordered dictionary of assembly_accession to its ftp_path
+            and seq_rel_date
+        """
+        entries = OrderedDict()
+        for entry in self.read_assemblies(assembly_file):
+            entries[entry['assembly_accession']] = (entry['ftp_path'],
+                                                    entry['seq_rel_date'])
+        return entries
+
+    # Compare the new assembly summary of a set with the one in use
+    def diff_assembly_summary(self, a_set):
+        """Find the assemblies of a set that changed since the last update
+
+        Assemblies are matched by assembly_accession; one whose ftp_path
+        or seq_rel_date differs is replaced. The genomes of unchanged
+        assemblies are hard linked from the data in use into the current
+        folder, the folder of the set in the intermediate folder.
+        Args:
+            a_set (string): the species set
+        Return:
+            The links of the genomes to download, the links of the
+            genomes carried forward, and the accessions added, replaced
+            and withdrawn in a dictionary; None on failure
+        """
+        live_set = os.path.join(self.live_dir(), a_set)
+        live_summary = os.path.join(live_set, self.download_file)
+        changes = {'added': [], 'replaced': [], 'withdrawn': []}
+        to_download = []
+        carried = []
         try:
-            with open(md5_file, 'r') as f:
-                md5_file_contents = f.readlines()
-                for line in md5_file_contents:
-                    line_items = line.split('  ')
-                    if file_name in line_items[1]:
-                        md5_code = line_items[0]
-            os.remove(md5_file)
+            old = OrderedDict()
+            if os.path.isfile(live_summary):
+                old = self.read_assembly_entries(live_summary)
+            new = self.read_assembly_entries(self.download_file)
+            for accession, entry in new.items():
+                file_link = self.genome_link(entry[0])
+                if accession not in old:
+                    changes['added'].append(accession)
+                    to_download.append(file_link)
+                elif old[accession] != entry:
+                    changes['replaced'].append(accession)
+                    to_download.append(file_link)
+                elif self.link_genome(live_set, file_link):
+                    carried.append(file_link)
+                else:
+                    # Not in the data in use, e.g. a limited download
+                    to_download.append(file_link)
+            changes['withdrawn'] = [a for a in old if a not in new]
         except Exception as e:
-            logging.exception('Failed to get md5_code {}.'.format(file_name))
-        return md5_code
+            logging.exception('Failed to compare the assembly summaries of '
+                              '{}: {}'.format(a_set, e))
+            return None
+        logging.info('{}: {} added, {} replaced, {} withdrawn, {} unchanged'
+                     .format(a_set, len(changes['added']),
+                             len(changes['replaced']),
+                             len(changes['withdrawn']), len(carried)))
+        return to_download, carried, changes
+
+    def link_genome(self, live_set, file_link, target_folder='.'):
+        """Hard link a genome in use, and its indexes, into target_folder
+
+        Return:
+            True if the genome is linked; False if it is not in use
+        """
+        stored_name = self.stored_genome_name(file_link.split('/')[-1])
+        if not os.path.isfile(os.path.join(live_set, stored_name)):
+            return False
+        for f in [stored_name, stored_name + '.fai', stored_name + '.gzi']:
+            source = os.path.join(live_set, f)
+            target = os.path.join(target_folder, f)
+            if os.path.isfile(source) and not os.path.exists(target):
+                os.link(source, target)
+        return True
+
+    # The manifest lets restore reuse the genomes of the data in use
+    def write_genome_manifest(self, a_set, set_folder, file_urls):
+        """List the genomes of a set with their md5 codes
+
+        Every line holds the name a genome is stored under, the md5 code
+        from NCBI it was checked against, the md5 code of the stored
+        file, and the size and modification time of the stored file. The
+        md5 codes from NCBI come from the md5 cache, from the manifest in
+        use for genomes carried forward, or else from the md5 file of
+        the assembly folder. The stored files are hashed unless they are
+        kept as downloaded or carried forward unchanged.
+        Args:
+            a_set (string): the species set
+            set_folder (string): the folder of the set
+            file_urls (list): the links of the genomes of the set
+        """
+        previous = self.read_genome_manifest(
+                        os.path.join(self.live_dir(), a_set))
+        md5_cache = self.get_md5_cache()
+        entries = []
+        unknown = []
+        for file_url in file_urls:
+            folder_url, file_name = file_url.rsplit('/', 1)
+            stored_name = self.stored_genome_name(file_name)
+            stored_file = os.path.join(set_folder, stored_name)
+            if not os.path.isfile(stored_file):
+                continue
+            old_entry = previous.get(stored_name)
+            checksums = md5_cache.get(folder_url) or {}
+            md5_code = checksums.get(file_name)
+            if md5_code is None and old_entry is not None:
+                md5_code = old_entry[0]
+            if md5_code is None:
+                md5_code = (self.fetch_md5_map(folder_url) or {}).get(
+                                file_name)
+            if md5_code is None:
+                unknown.append(stored_name)
+                continue
+            signature = self.genome_signature(stored_file)
+            stored_md5 = None
+            if self.genome_format == 'gz':
+                stored_md5 = md5_code
+            elif old_entry is not None and old_entry[2:] == signature:
+                stored_md5 = old_entry[1]
+            entries.append([stored_name, md5_code, stored_md5, signature])
+        to_hash = [entry for entry in entries if entry[2] is None]
+        with ThreadPoolExecutor(
+                max_workers=self.checksum_workers) as executor:
+            stored_md5s = executor.map(
+                lambda entry: self.hash_file(
+                    os.path.join(set_folder, entry[0])).hexdigest(),
+                to_hash)
+            for entry, stored_md5 in zip(to_hash, stored_md5s):
+                entry[2] = stored_md5
+        if unknown:
+            logging.warning('{}: {} genomes left out of the manifest, their'
+                            ' md5 code is unknown: {}'
+                            .format(a_set, len(unknown), ', '.join(unknown)))
+        manifest = os.path.join(set_folder, GENOME_MANIFEST)
+        with open(manifest + '.tmp', 'w') as f:
+            for stored_name, md5_code, stored_md5, signature in entries:
+                f.write('{}\t{}\t{}\t{}\t{}\n'.format(
+                    stored_name, md5_code, stored_md5, *signature))
+        os.replace(manifest + '.tmp', manifest)
+
+    def read_genome_manifest(self, set_folder):
+        """Read the genome manifest of a set folder
+
+        Return:
+            A dictionary of stored name to (md5 code from NCBI, md5 code
+            of the stored file, size, modification time); empty if there
+            is no manifest
+        """
+        genomes = {}
+        manifest = os.path.join(set_folder, GENOME_MANIFEST)
+        if not os.path.isfile(manifest):
+            return genomes
+        with open(manifest, 'r') as f:
+            for line in f:
+                items = line.rstrip('\n').split('\t')
+                if len(items) == 5:
+                    genomes[items[0]] = (items[1], items[2], int(items[3]),
+                                         int(items[4]))
+        return genomes
+
+    def reuse_genomes(self, a_set, set_folder, file_urls):
+        """Hard link the genomes of a set still in use into set_folder
+
+        A genome in use is reused if all of these hold:
+            it is listed in the manifest under the same name;
+            the stored file was not changed since the manifest was
+                written (same size and modification time);
+            the md5 code from NCBI in the md5 cache matches the one of
+                the manifest or, when the cache does not know it, the
+                stored file matches its own md5 code in the manifest.
+        The stored files are hashed in parallel by check_md5_batch.
+        Return:
+            The links of the genomes that could not be reused
+        """
+        live_set = os.path.join(self.live_dir(), a_set)
+        manifest = self.read_genome_manifest(live_set)
+        md5_cache = self.get_md5_cache()
+        reusable = set()
+        to_hash = []
+        for file_url in file_urls:
+            folder_url, file_name = file_url.rsplit('/', 1)
+            stored_file = os.path.join(live_set,
+                                       self.stored_genome_name(file_name))
+            entry = manifest.get(self.stored_genome_name(file_name))
+            if entry is None or not os.path.isfile(stored_file) or \
+                    self.genome_signature(stored_file) != entry[2:]:
+                continue
+            checksums = md5_cache.get(folder_url) or {}
+            if file_name in checksums:
+                if checksums[file_name] != entry[0]:
+                    continue
+            else:
+                to_hash.append((stored_file, entry[1]))
+            reusable.add(stored_file)
+        reusable.difference_update(self.check_md5_batch(to_hash))
+        missing = []
+        for file_url in file_urls:
+            stored_file = os.path.join(
+                live_set, self.stored_genome_name(file_url.split('/')[-1]))
+            if stored_file not in reusable or \
+                    not self.link_genome(live_set, file_url, set_folder):
+                missing.append(file_url)
+        logging.info('{}: {} genomes reused, {} to download'
+                     .format(a_set, len(file_urls) - len(missing),
+                             len(missing)))
+        return missing
 
     def parse_assembly_summary(self, assembly_file):
         """
@@ -244,19 +964,11 @@ class NcbiWholeGenome(NcbiData, RefDataInterface):
         """
         file_list = list()
         try:
-            with open(assembly_file, 'r') as fp:
-                content = fp.readlines()
-                for line in content[3:]:
-                    line_items = line.split('\t')
-                    if line_items[11] == self.assembly_level:
-                        dir_name = line_items[19]
-                        dir_list = dir_name.split('/')
-                        full_file_name = '{}/{}_genomic.fna.gz'\
-                            .format(dir_name, dir_list[-1])
-                        file_list.append(full_file_name)
+            for entry in self.read_assemblies(assembly_file):
+                file_list.append(self.genome_link(entry['ftp_path']))
         except Exception as e:
-            logging.exception('Failed to download file {}.'
-                              .format(file_name))
+            logging.exception('Failed to parse {}: {}'
+                              .format(assembly_file, e))
             file_list = list()
             return file_list
         return file_list
@@ -319,9 +1031,13 @@ class NcbiWholeGenome(NcbiData, RefDataInterface):
                     \nwrong line number to get file links')
                     return False
                 for line in content[6:]:
+                    # The list ends at the next section title
+                    if line.rstrip().endswith(':'):
+                        break
                     required_files.append(line)
             restore_download_ok = self.restore_download(
                                     required_files, restore_destination)
+            self.close_md5_cache()
             if not restore_download_ok:
                 return False
             format_ok = self.format(restore_destination)
@@ -333,63 +1049,101 @@ class NcbiWholeGenome(NcbiData, RefDataInterface):
             return False
         return True
 
+    # Genomes still in use are linked; only the others are downloaded
     def restore_download(self, file_list, restore_destination):
-        downloaded = 0
-        file_list_downloaded = []
-        completed = False
-        attempt = 0
-        max_download_attempts = self.download_retry_num
-        while attempt < max_download_attempts and not completed:
-            attempt += 1
-            try:
-                session_requests, connected = self.https_connect()
-                for a_file in file_list:
-                    if a_file not in file_list_downloaded:
-                        subdir, link = a_file.split('\t')
-                        # download a genome zipped file
-                        file_name = link.split('/')[-1].strip('\n')
-                        file_url = link.strip('\n')
-                        path_to_subdir = os.path.join(
-                                        restore_destination, subdir)
-                        if not os.path.isdir(path_to_subdir):
-                            os.makedirs(path_to_subdir, mode=self.folder_mode)
-                        os.chdir(path_to_subdir)
-                        seq_file = self.download_a_file(
-                                    file_name, file_url, session_requests)
-                        md5_name = self.config['ncbi']['whole_genome'
-                                                       ]['md5_file_name']
-                        # md5_name = 'md5checksums.txt'
-                        md5_url = file_url.replace(file_name, md5_name)
-                        md5_file = self.download_a_file(
-                                    md5_name, md5_url, session_requests)
-                        md5_code = self.read_md5(md5_name, file_name)
-                        a_file_success = self.check_md5(file_name, md5_code)
-                        unzip_success = False
-                        if a_file_success:
-                            unzip_success = self.unzip_file(file_name)
-                        if unzip_success:
-                            downloaded += 1
-                        if downloaded == len(file_list):
-                            completed = True
-                            break
-                        os.chdir('..')
-                session_requests.close()
-            except Exception as e:
-                logging.error('Failed to download all files on attempt {}: {}'
-                              .format(attempt, e))
-                time.sleep(self.sleep_time)
-
-        if completed:
-            try:
-                for root, dirs, files in os.walk(restore_destination):
-                    for f in files:
-                        os.chmod(os.path.join(root, f), self.file_mode)
-            except Exception as e:
-                logging.error('Failed to change file mode {}'.format(e))
-                return False
+        """Restore the genomes listed in README+
 
+        The genomes of the data in use listed with the same md5 code in
+        their genome manifest are hard linked; the others are downloaded
+        concurrently, download_workers at once.
+        Args:
+            file_list (list): lines of set and link separated by a tab
+            restore_destination (string): the folder of the restored sets
+        Return:
+            True if all the genomes are restored; otherwise False
+        """
+        sets = OrderedDict()
+        for a_file in file_list:
+            subdir, link = a_file.split('\t')
+            sets.setdefault(subdir, []).append(link.strip('\n'))
+        scheduled = OrderedDict()
+        try:
+            for a_set, file_urls in sets.items():
+                set_folder = os.path.join(restore_destination, a_set)
+                if not os.path.isdir(set_folder):
+                    os.makedirs(set_folder, mode=self.folder_mode)
+                missing = self.reuse_genomes(a_set, set_folder, file_urls)
+                if missing:
+                    scheduled[a_set] = (set_folder, missing, len(missing))
+        except Exception as e:
+            logging.exception('Failed to reuse genomes: {}'.format(e))
+            return False
+        if self.download_backend == 'asyncio':
+            completed = self.restore_download_async(
+                            [a_set + '\t' + file_url
+                             for a_set in scheduled
+                             for file_url in scheduled[a_set][1]],
+                            restore_destination)
+        else:
+            downloaded = self.download_genomes_scheduled(scheduled)
+            completed = all(len(downloaded[a_set]) == scheduled[a_set][2]
+                            for a_set in scheduled)
+        if not completed:
+            logging.error('Failed to download all the genomes to restore')
+            return False
+        try:
+            for a_set, file_urls in sets.items():
+                self.write_genome_manifest(
+                    a_set, os.path.join(restore_destination, a_set),
+                    file_urls)
+            for root, dirs, files in os.walk(restore_destination):
+                for f in files:
+                    os.chmod(os.path.join(root, f), self.file_mode)
+        except Exception as e:
+            logging.error('Failed to change file mode {}'.format(e))
+            return False
         return True
 
+    def restore_download_async(self, file_list, restore_destination):
+        """Download the genomes listed in README+ on the asyncio backend
+
+        Args:
+            file_list (list): lines of set and link separated by a tab
+            restore_destination (string): the folder of the restored sets
+        Return:
+            True if all the genomes are downloaded; otherwise False
+        """
+        genomes = []
+        for a_file in file_list:
+            subdir, link = a_file.split('\t')
+            file_url = link.strip('\n')
+            path_to_subdir = os.path.join(restore_destination, subdir)
+            if not os.path.isdir(path_to_subdir):
+                os.makedirs(path_to_subdir, mode=self.folder_mode)
+            genomes.append((os.path.join(path_to_subdir,
+                                         file_url.split('/')[-1]),
+                            file_url))
+        downloader = self.get_async_downloader()
+        attempt = 0
+        try:
+            while attempt < self.download_retry_num and genomes:
+                attempt += 1
+                succeeded = set(self.fetch_genomes_async(downloader,
+                                                         genomes))
+                genomes = [(file_path, file_url)
+                           for file_path, file_url in genomes
+                           if file_url not in succeeded]
+                if genomes:
+                    logging.error('{} genomes failed on attempt {}'
+                                  .format(len(genomes), attempt))
+                    time.sleep(self.sleep_time)
+        except Exception as e:
+            logging.exception('Failed to restore genomes: {}'.format(e))
+            return False
+        finally:
+            downloader.close()
+        return not genomes
+
     def format(self, dest_folder):
         for a_set in self.species:
             try:
@@ -401,16 +1155,24 @@ class NcbiWholeGenome(NcbiData, RefDataInterface):
                                   .format(a_set))
                     return False
                 blast_folder = os.path.join(folder_name, 'Blast')
-                if os.path.exists(blast_folder):
+                if os.path.exists(blast_folder) and self.blast_batch_size < 1:
                     shutil.rmtree(blast_folder)
-                os.makedirs(blast_folder, mode=self.folder_mode)
-                command1 = 'cat *.fna > Blast/all_sequence.fasta'
-                os.system(command1)
+                if not os.path.exists(blast_folder):
+                    os.makedirs(blast_folder, mode=self.folder_mode)
+                sequence_files = sorted(
+                    f for f in os.listdir(folder_name)
+                    if f.endswith('.fna') or f.endswith('.fna.gz'))
+                if self.blast_batch_size > 0:
+                    success = self.make_blastdb_batches(
+                                    sequence_files, blast_folder, a_set)
+                else:
+                    blastdb_name = os.path.join(blast_folder,
+                                                a_set + '_blastdb')
+                    success = self.make_blastdb(sequence_files,
+                                                blastdb_name, a_set)
+                if not success:
+                    return False
                 os.chdir(blast_folder)
-                command2 = 'makeblastdb -in all_sequence.fasta'\
-                    + ' -dbtype nucl -out ' + a_set + '_blastdb'
-                os.system(command2)
-                os.system('rm all_sequence.fasta')
                 for f in os.listdir('.'):
                     if os.path.isfile(f):
                         os.chmod(f, self.file_mode)
@@ -418,3 +1180,176 @@ class NcbiWholeGenome(NcbiData, RefDataInterface):
                 logging.error('failed to get blast format: {}'.format(e))
                 return False
         return True
+
+    # The sequences are piped into makeblastdb; no concatenated copy
+    # is written and zipped genomes are decompressed on the fly
+    def make_blastdb(self, sequence_files, blastdb_name, title):
+        """Build a blast database from genome files
+
+        Args:
+            sequence_files (list): .fna or .fna.gz files of the current
+                folder
+            blastdb_name (string): the path of the blast database
+            title (string): the title of the blast database
+        Return:
+            True if makeblastdb succeeded; otherwise False
+        """
+        command = ['makeblastdb', '-in', '-', '-dbtype', 'nucl',
+                   '-title', title, '-out', blastdb_name]
+        try:
+            process = subprocess.Popen(command, stdin=subprocess.PIPE)
+            try:
+                for f in sequence_files:
+                    if f.endswith('.gz'):
+                        sequence = gzip.open(f, 'rb')
+                    else:
+                        sequence = open(f, 'rb')
+                    with sequence:
+                        shutil.copyfileobj(sequence, process.stdin,
+                                           CHUNK_SIZE)
+            finally:
+                process.stdin.close()
+                return_code = process.wait()
+        except Exception as e:
+            logging.error('Failed to run makeblastdb for {}: {}'
+                          .format(blastdb_name, e))
+            return False
+        if return_code != 0:
+            logging.error('makeblastdb failed for {} with code {}'
+                          .format(blastdb_name, return_code))
+            return False
+        return True
+
+    # Only the batches whose genomes changed are formatted again; the
+    # others were hard linked from the data in use by link_blast_batches
+    def make_blastdb_batches(self, sequence_files, blast_folder, a_set):
+        """Build the blast database of a set as batches under an alias
+
+        Every batch is a blast database of up to blast_batch_size
+        genomes. A batch is rebuilt when one of its genomes was removed
+        or replaced; new genomes go into new batches. The batches are
+        listed in BATCH_MANIFEST and combined by blastdb_aliastool into
+        <set>_blastdb.
+        Args:
+            sequence_files (list): .fna or .fna.gz files of the current
+                folder
+            blast_folder (string): the Blast folder of the set
+            a_set (string): the species set
+        Return:
+            True if all the batches and the alias were built; otherwise
+            False
+        """
+        manifest = os.path.join(blast_folder, BATCH_MANIFEST)
+        current = dict((f, self.genome_signature(f)) for f in sequence_files)
+        batches = OrderedDict()
+        rebuilt = []
+        assigned = set()
+        for batch, files in self.read_batch_manifest(manifest).items():
+            remaining = [f for f, signature in files
+                         if current.get(f) == signature and f not in assigned]
+            assigned.update(remaining)
+            if len(remaining) == len(files) and \
+                    self.blastdb_files(blast_folder, batch):
+                batches[batch] = remaining
+                continue
+            if remaining:
+                batches[batch] = remaining
+                rebuilt.append(batch)
+        number = max([int(b.rsplit('_', 1)[-1]) for b in batches] + [0])
+        new_files = [f for f in sequence_files if f not in assigned]
+        for i in range(0, len(new_files), self.blast_batch_size):
+            number += 1
+            batch = '{}_batch_{:04d}'.format(a_set, number)
+            batches[batch] = new_files[i:i + self.blast_batch_size]
+            rebuilt.append(batch)
+        if not batches:
+            logging.error('No genome to format in {}'.format(a_set))
+            return False
+        alias_name = a_set + '_blastdb'
+        # Files are unlinked, not overwritten, as they may be hard links
+        # to the data in use
+        keep = set([BATCH_MANIFEST])
+        for batch in batches:
+            if batch not in rebuilt:
+                keep.update(self.blastdb_files(blast_folder, batch))
+        for f in os.listdir(blast_folder):
+            if f not in keep:
+                os.remove(os.path.join(blast_folder, f))
+        logging.info('{}: {} blast batches, {} to build'
+                     .format(a_set, len(batches), len(rebuilt)))
+        for batch in rebuilt:
+            if not self.make_blastdb(batches[batch],
+                                     os.path.join(blast_folder, batch),
+                                     batch):
+                return False
+        tmp_manifest = manifest + '.tmp'
+        with open(tmp_manifest, 'w') as f:
+            for batch, files in batches.items():
+                for a_file in files:
+                    f.write('{}\t{}\t{}\t{}\n'.format(
+                        batch, a_file, *current[a_file]))
+        os.replace(tmp_manifest, manifest)
+        command = ['blastdb_aliastool', '-dblist', ' '.join(batches),
+                   '-dbtype', 'nucl', '-title', a_set, '-out', alias_name]
+        try:
+            return_code = subprocess.call(command, cwd=blast_folder)
+        except Exception as e:
+            logging.error('Failed to run blastdb_aliastool for {}: {}'
+                          .format(a_set, e))
+            return False
+        if return_code != 0:
+            logging.error('blastdb_aliastool failed for {} with code {}'
+                          .format(a_set, return_code))
+            return False
+        return True
+
+    def genome_signature(self, file_name):
+        """The size and modification time of a genome file"""
+        stat = os.stat(file_name)
+        return (stat.st_size, int(stat.st_mtime))
+
+    def read_batch_manifest(self, manifest):
+        """Read the genomes of every batch
+
+        Return:
+            An ordered dictionary of batch to a list of (file name,
+            signature); empty if there is no manifest
+        """
+        batches = OrderedDict()
+        if not os.path.isfile(manifest):
+            return batches
+        with open(manifest, 'r') as f:
+            for line in f:
+                items = line.rstrip('\n').split('\t')
+                if len(items) != 4:
+                    continue
+                batches.setdefault(items[0], []).append(
+                    (items[1], (int(items[2]), int(items[3]))))
+        return batches
+
+    def blastdb_files(self, blast_folder, batch):
+        """The files of a blast database, volumes included"""
+        return [f for f in os.listdir(blast_folder)
+                if f.startswith(batch + '.')]
+
+    def link_blast_batches(self, a_set):
+        """Hard link the blast batches in use into the current folder
+
+        format then rebuilds only the batches whose genomes changed.
+        """
+        live_blast = os.path.join(self.live_dir(), a_set, 'Blast')
+        if not os.path.isdir(live_blast):
+            return True
+        try:
+            if not os.path.exists('Blast'):
+                os.makedirs('Blast', mode=self.folder_mode)
+            for f in os.listdir(live_blast):
+                source = os.path.join(live_blast, f)
+                target = os.path.join('Blast', f)
+                if os.path.isfile(source) and not os.path.exists(target):
+                    os.link(source, target)
+        except Exception as e:
+            logging.error('Failed to link the blast batches of {}: {}'
+                          .format(a_set, e))
+            return False
+        return True
@@ -0,0 +1,122 @@
+import logging
+import threading
+import requests
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+
+
+class PooledSession(requests.Session):
+    """A requests session shared by the whole process
+
+    Data sources call close() when they are done with a session; the
+    connections are kept open for the next user instead.
+    """
+
+    def close(self):
+        """Keep the pooled connections open"""
+        pass
+
+    def shutdown(self):
+        """Close all the connections of the session"""
+        super(PooledSession, self).close()
+
+
+class SessionPool():
+    """Process-wide sessions, one per host, each with its connection pool
+
+    Every download_a_file implementation takes its session from here so
+    that TLS connections are kept alive and reused between files, retry
+    rounds and data sources, and a host is logged in to only once.
+    """
+
+    sessions = {}
+    authenticated = set()
+    lock = threading.Lock()
+    login_lock = threading.Lock()
+
+    @staticmethod
+    def host_key(url):
+        """scheme://host of a url"""
+        parts = urlsplit(url)
+        return '{}://{}'.format(parts.scheme, parts.netloc)
+
+    @classmethod
+    def get_session(cls, url, pool_size=10):
+        """Get the session for the host of url
+
+        Args:
+            url (string): a link on the host
+            pool_size (int): the maximum number of connections kept open
+                to the host; used when the session is created
+        Return:
+            The shared session of the host
+        """
+        host = cls.host_key(url)
+        with cls.lock:
+            session = cls.sessions.get(host)
+            if session is None:
+                session = PooledSession()
+                adapter = HTTPAdapter(pool_connections=4,
+                                      pool_maxsize=pool_size)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                if url.startswith('ftp://'):
+                    import requests_ftp
+                    session.mount('ftp://', requests_ftp.FTPAdapter())
+                cls.sessions[host] = session
+                logging.info('New connection pool of {} for {}'
+                             .format(pool_size, host))
+        return session
+
+    @classmethod
+    def authenticate(cls, url, login):
+        """Log in to the host of url once for the whole process
+
+        Args:
+            url (string): a link on the host
+            login (function): called with the session of the host;
+                returns True if the login succeeded
+        Return:
+            True if the host is authenticated; otherwise False
+        """
+        host = cls.host_key(url)
+        with cls.login_lock:
+            if host not in cls.authenticated:
+                if login(cls.get_session(url)):
+                    cls.authenticated.add(host)
+            return host in cls.authenticated
+
+    @classmethod
+    def stats(cls):
+        """Requests sent and connections opened per pooled host
+
+        Return:
+            A dictionary of host to (number of requests, number of
+            connections)
+        """
+        result = {}
+        with cls.lock:
+            sessions = list(cls.sessions.values())
+        for session in sessions:
+            adapters = set(session.adapters.values())
+            for adapter in adapters:
+                poolmanager = getattr(adapter, 'poolmanager', None)
+                if poolmanager is None:
+                    continue
+                for key in poolmanager.pools.keys():
+                    pool = poolmanager.pools.get(key)
+                    if pool is None:
+                        continue
+                    host = '{}://{}'.format(pool.scheme, pool.host)
+                    requests_num, connections = result.get(host, (0, 0))
+                    result[host] = (requests_num + pool.num_requests,
+                                    connections + pool.num_connections)
+        return result
+
+    @classmethod
+    def log_stats(cls):
+        """Log how often pooled connections were reused"""
+        for host, (requests_num, connections) in sorted(cls.stats().items()):
+            reused = requests_num - connections
+            logging.info('{}: {} requests over {} connections, {} reused'
+                         .format(host, requests_num, connections, reused))
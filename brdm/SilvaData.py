@@ -2,8 +2,7 @@ import os
 import shutil
 import logging
 import time
-import requests
-from distutils.dir_util import copy_tree
+from hashlib import md5
 from brdm.BaseRefData import BaseRefData
 from brdm.RefDataInterface import RefDataInterface
 
@@ -19,6 +18,7 @@ class SilvaData(BaseRefData, RefDataInterface):
         self.Qiime1_file = self.config['silva']['Qiime1_file']
         self.format_file = self.config['silva']['format_file']
         self.redundant_folder = self.config['silva']['redundant_folder']
+        self.read_segment_config(self.config['silva'])
         try:
             self.destination_dir = os.path.join(
                             super(SilvaData, self).destination_dir,
@@ -38,6 +38,14 @@ class SilvaData(BaseRefData, RefDataInterface):
     def update(self):
         """Update silva database"""
         logging.info('Executing silva update')
+        if self.conditional_update:
+            self.get_download_cache()
+            session_requests = self.get_session(self.download_url)
+            unchanged = self.inputs_unchanged(self.get_input_urls(),
+                                              session_requests)
+            if unchanged:
+                logging.info('Silva data unchanged since the last update')
+                return True
         # Download files into the intermediate folder
         temp_dir = self.create_tmp_dir(self.destination_dir)
         if not temp_dir:
@@ -57,23 +65,25 @@ class SilvaData(BaseRefData, RefDataInterface):
         if not backup_success:
             logging.error('Failed to backup readme files. Quit the process.')
             return False
-        # Delete old files from the destination folder
-        # Copy new files from intermediate folder to destination folder
-        clean_ok = self.clean_destination_dir(self.destination_dir)
-        if not clean_ok:
-            return False
-        try:
-            copy_tree(temp_dir, self.destination_dir)
-            shutil.rmtree(temp_dir)
-        except Exception as e:
-            logging.error('Failed to move files to destination:{}'.format(e))
-            return False
-        format_ok = self.format()
-        if not format_ok:
+        # Put the new files in place of the old ones and format them
+        promote_ok = self.promote(temp_dir, self.format)
+        if not promote_ok:
             logging.error('Failed to format data')
             return False
+        if self.conditional_update:
+            self.get_download_cache().save()
         return True
 
+    def get_input_urls(self):
+        """The links to all the files downloaded by an update"""
+        urls = [os.path.join(self.download_url, self.info_file_name)]
+        for file_name in self.download_file:
+            file_url = os.path.join(self.download_url, file_name)
+            urls.append(file_url)
+            urls.append(file_url + '.md5')
+        urls.extend(self.Qiime1_file)
+        return urls
+
     def download(self, test=False):
         """Download all the files"""
         logging.info('Executing greengene download')
@@ -108,12 +118,14 @@ class SilvaData(BaseRefData, RefDataInterface):
                 attempt += 1
                 try:
                     file_url = os.path.join(self.download_url, file_name)
-                    file_success = self.download_a_file(file_name, file_url)
+                    file_md5 = self.download_a_file(file_name, file_url,
+                                                    compute_md5=True)
                     md5_url = file_url+'.md5'
                     md5_name = file_name+'.md5'
                     md5_success = self.download_a_file(md5_name, md5_url)
-                    if file_success and md5_success:
-                        checksum_success = self.checksum(md5_name, file_name)
+                    if file_md5 and md5_success:
+                        checksum_success = self.checksum(md5_name, file_name,
+                                                         file_md5)
                     if checksum_success:
                         completed = self.unzip_file(file_name)
                 except Exception as e:
@@ -157,7 +169,12 @@ class SilvaData(BaseRefData, RefDataInterface):
                           )
         return True
 
-    def checksum(self, md5_file, file_name):
+    def checksum(self, md5_file, file_name, md5_real=None):
+        """Check the downloaded file against its md5 file
+
+        md5_real is the md5 code computed while downloading the file;
+        if it is given the file is not read again.
+        """
         try:
             with open(file_name+'.md5', 'r') as f:
                 md5_file_contents = f.read()
@@ -166,23 +183,40 @@ class SilvaData(BaseRefData, RefDataInterface):
         except Exception as e:
             logging.exception('Could not read Md5 code {}.'.format(md5_file))
             return False
-        if not self.check_md5(file_name, md5_str):
+        if not self.check_md5(file_name, md5_str, md5_real):
             logging.warning('MD5 check did not pass.')
             return False
         return True
 
     # Download a file with provided file name and file address(link)
-    def download_a_file(self, file_name, file_address):
-        """Download a specific file"""
-        session_requests = requests.Session()
+    def download_a_file(self, file_name, file_address, compute_md5=False):
+        """Download a specific file
+
+        Large files are fetched in segments if download_segments is more
+        than 1; md5 and README files never are. Return False if the
+        download failed; otherwise the md5 code of the file if
+        compute_md5 is set, True if not.
+        """
+        session_requests = self.get_session(file_address)
+        md5_hash = md5() if compute_md5 else None
         try:
-            res = session_requests.get(file_address, stream=True)
-            with open(file_name, 'wb') as output:
-                shutil.copyfileobj(res.raw, output)
-            session_requests.close()
+            res = None
+            if self.segments_wanted(file_name):
+                part_name = file_name + '.part'
+                res = self.download_segmented(file_address, part_name,
+                                              session_requests, md5_hash)
+            if res is not None:
+                os.replace(part_name, file_name)
+            else:
+                res = session_requests.get(file_address, stream=True)
+                with open(file_name, 'wb') as output:
+                    self.write_stream(res.raw, output, md5_hash)
+            self.record_download(file_address, res)
         except Exception as e:
             logging.exception('Failed to download {}.'.format(file_name))
             return False
+        if md5_hash is not None:
+            return md5_hash.hexdigest()
         return True
 
     # backup readme and readme+ file
@@ -224,7 +258,7 @@ class SilvaData(BaseRefData, RefDataInterface):
         logging.info('Restoring Silva data ... Nothing to do.')
         pass
 
-    def get_format_file_list(self):
+    def get_format_file_list(self, data_dir):
         """The list of files in configuration that requires formatting"""
         sequence_file = []
         taxon_file = []
@@ -236,9 +270,9 @@ class SilvaData(BaseRefData, RefDataInterface):
                 f3 = a_file.split('|')[2].strip()
                 if f1 and f2 and f3:
                     sequence_file.append(
-                        os.path.join(self.destination_dir, f1))
+                        os.path.join(data_dir, f1))
                     taxon_file.append(
-                        os.path.join(self.destination_dir, f2))
+                        os.path.join(data_dir, f2))
                     output_file.append(f3)
                 else:
                     logging.error('The format file is not valid {}'
@@ -250,27 +284,38 @@ class SilvaData(BaseRefData, RefDataInterface):
 
         return sequence_file, taxon_file, output_file
 
-    def format(self):
-        """Format data for specific bioinformatic tools"""
-        sequence_file, taxon_file, output_file = self.get_format_file_list()
-        qiime1 = self.to_qiime1_format(sequence_file, taxon_file, output_file)
+    def format(self, data_dir=None):
+        """Format data for specific bioinformatic tools
+
+        Args:
+            data_dir (string): the folder of the data; the destination
+                folder if not given
+        """
+        if data_dir is None:
+            data_dir = self.destination_dir
+        sequence_file, taxon_file, output_file = \
+            self.get_format_file_list(data_dir)
+        qiime1 = self.to_qiime1_format(data_dir, sequence_file, taxon_file,
+                                       output_file)
         if not qiime1:
             logging.error('Failed to get qiime1 format.')
             return False
-        mothur = self.to_mothur_format(sequence_file, taxon_file, output_file)
+        mothur = self.to_mothur_format(data_dir, sequence_file, taxon_file,
+                                       output_file)
         if not mothur:
             logging.error('Failed to get mothur format.')
             return False
-        blast = self.to_blast_format(sequence_file, output_file)
+        blast = self.to_blast_format(data_dir, sequence_file, output_file)
         if not blast:
             logging.error('Failed to get blast format.')
             return False
         return True
 
-    def to_qiime1_format(self, sequence_file, taxon_file, output_file):
+    def to_qiime1_format(self, data_dir, sequence_file, taxon_file,
+                         output_file):
         """Format the data for Qiime1 tool"""
         try:
-            qiime1_folder = os.path.join(self.destination_dir, 'Qiime1')
+            qiime1_folder = os.path.join(data_dir, 'Qiime1')
             if os.path.exists(qiime1_folder):
                 shutil.rmtree(qiime1_folder)
             os.makedirs(qiime1_folder, mode=self.folder_mode)
@@ -293,10 +338,11 @@ class SilvaData(BaseRefData, RefDataInterface):
             return False
         return True
 
-    def to_mothur_format(self, sequence_file, taxon_file, output_file):
+    def to_mothur_format(self, data_dir, sequence_file, taxon_file,
+                         output_file):
         """Format the data for mothur tool"""
         try:
-            mothur_folder = os.path.join(self.destination_dir, 'Mothur')
+            mothur_folder = os.path.join(data_dir, 'Mothur')
             if os.path.exists(mothur_folder):
                 shutil.rmtree(mothur_folder)
             os.makedirs(mothur_folder, mode=self.folder_mode)
@@ -340,16 +386,16 @@ class SilvaData(BaseRefData, RefDataInterface):
             return False
         return True
 
-    def to_blast_format(self, sequence_file, output_file):
+    def to_blast_format(self, data_dir, sequence_file, output_file):
         """Format the data for blast tool"""
         try:
-            blast_folder = os.path.join(self.destination_dir, 'Blast')
+            blast_folder = os.path.join(data_dir, 'Blast')
             if os.path.exists(blast_folder):
                 shutil.rmtree(blast_folder)
             os.makedirs(blast_folder, mode=self.folder_mode)
             os.chdir(blast_folder)
-            for f in os.listdir(self.destination_dir):
-                sequence_input = os.path.join(self.destination_dir, f)
+            for f in os.listdir(data_dir):
+                sequence_input = os.path.join(data_dir, f)
                 if os.path.isfile(sequence_input) and f.endswith('.fasta'):
                     print(f)
                     blastdb_name = os.path.join(blast_folder, f[:-6])
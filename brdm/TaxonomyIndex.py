@@ -0,0 +1,166 @@
+import os
+import sys
+import mmap
+import struct
+from array import array
+
+# magic, number of taxids, number of distinct lineages, size and
+# modification time (in seconds) of the rankedlineage.txt indexed
+HEADER = struct.Struct('<8sQQQQ')
+MAGIC = b'BRDMTAX2'
+TAXID = struct.Struct('<I')
+OFFSET = struct.Struct('<Q')
+
+
+class TaxonomyIndex():
+    """Look up lineages by taxid in a memory-mapped binary index
+
+    The index is built from the rankedlineage.txt written by
+    NcbiTaxonomyData.format_taxonomy. After the header it holds, all
+    little-endian:
+        the taxids, sorted, as 32-bit integers
+        for every taxid, the number of its lineage, as 32-bit integers
+        the offsets of the lineages in the string table, as 64-bit
+            integers, one more than the number of lineages
+        the string table: every distinct lineage once, in UTF-8
+    Opening the index maps the file without reading it; a lookup is a
+    binary search over the mapped taxids, so the memory used is shared
+    between processes and does not depend on the size of the taxonomy.
+    The header records the size and modification time of the text file
+    indexed, so that a stale index is recognized whatever its own
+    modification time, see describes.
+    """
+
+    def __init__(self, index_file):
+        """Map an index file"""
+        self.index_file = index_file
+        with open(index_file, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.data) < HEADER.size or \
+                self.data[:len(MAGIC)] != MAGIC:
+            self.data.close()
+            raise ValueError('{} is not a taxonomy index'.format(index_file))
+        magic, self.count, self.lineages, self.source_size, \
+            self.source_mtime = HEADER.unpack_from(self.data, 0)
+        taxid_start = HEADER.size
+        lineage_start = taxid_start + TAXID.size * self.count
+        offset_start = lineage_start + TAXID.size * self.count
+        self.string_start = offset_start + OFFSET.size * (self.lineages + 1)
+        # Typed views of the mapped arrays, read without unpacking
+        self.view = memoryview(self.data)
+        self.taxids = self.typed(taxid_start, lineage_start, 'I')
+        self.lineage_ids = self.typed(lineage_start, offset_start, 'I')
+        self.offsets = self.typed(offset_start, self.string_start, 'Q')
+
+    def typed(self, start, end, typecode):
+        """The bytes start to end of the index as integers of typecode"""
+        if sys.byteorder == 'little':
+            return self.view[start:end].cast(typecode)
+        values = array(typecode, self.view[start:end])
+        values.byteswap()
+        return values
+
+    @staticmethod
+    def signature(taxonomy_file):
+        """The size and modification time recorded for a text file"""
+        stat = os.stat(taxonomy_file)
+        return (stat.st_size, int(stat.st_mtime))
+
+    def describes(self, taxonomy_file):
+        """Whether the index was built from taxonomy_file as it is now"""
+        return self.signature(taxonomy_file) == \
+            (self.source_size, self.source_mtime)
+
+    @staticmethod
+    def build(taxonomy_file, index_file):
+        """Build the index of a rankedlineage.txt file
+
+        Every line after the header holds a taxid, a name and a lineage
+        separated by tabs. The index is written to a temporary file and
+        renamed, so readers never see a partial index.
+        Return:
+            The number of taxids indexed
+        """
+        source_size, source_mtime = TaxonomyIndex.signature(taxonomy_file)
+        taxids = array('I')
+        lineage_ids = array('I')
+        interned = {}
+        with open(taxonomy_file, 'r') as fp:
+            next(fp, None)
+            for line in fp:
+                items = line.rstrip('\n').split('\t')
+                if len(items) != 3:
+                    continue
+                lineage = interned.setdefault(items[2], len(interned))
+                taxids.append(int(items[0]))
+                lineage_ids.append(lineage)
+        order = sorted(range(len(taxids)), key=taxids.__getitem__)
+        sorted_taxids = array('I', (taxids[i] for i in order))
+        sorted_ids = array('I', (lineage_ids[i] for i in order))
+        del taxids, lineage_ids, order
+        strings = [None] * len(interned)
+        for lineage, lineage_id in interned.items():
+            strings[lineage_id] = lineage.encode('utf-8')
+        del interned
+        offsets = array('Q', [0])
+        for string in strings:
+            offsets.append(offsets[-1] + len(string))
+        if sys.byteorder == 'big':
+            for values in (sorted_taxids, sorted_ids, offsets):
+                values.byteswap()
+        tmp_file = index_file + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, len(sorted_taxids), len(strings),
+                                source_size, source_mtime))
+            sorted_taxids.tofile(f)
+            sorted_ids.tofile(f)
+            offsets.tofile(f)
+            for string in strings:
+                f.write(string)
+        os.replace(tmp_file, index_file)
+        return len(sorted_taxids)
+
+    def position(self, taxid):
+        """The position of taxid among the sorted taxids; None if absent"""
+        taxids = self.taxids
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            value = taxids[middle]
+            if value < taxid:
+                low = middle + 1
+            elif value > taxid:
+                high = middle
+            else:
+                return middle
+        return None
+
+    def get(self, taxid, default=None):
+        """The lineage of taxid; default if it is not in the index"""
+        position = self.position(int(taxid))
+        if position is None:
+            return default
+        lineage = self.lineage_ids[position]
+        start = self.string_start + self.offsets[lineage]
+        end = self.string_start + self.offsets[lineage + 1]
+        return self.data[start:end].decode('utf-8')
+
+    def __contains__(self, taxid):
+        return self.position(int(taxid)) is not None
+
+    def __getitem__(self, taxid):
+        lineage = self.get(taxid)
+        if lineage is None:
+            raise KeyError(taxid)
+        return lineage
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        """Unmap the index"""
+        for values in (self.taxids, self.lineage_ids, self.offsets):
+            if isinstance(values, memoryview):
+                values.release()
+        self.view.release()
+        self.data.close()
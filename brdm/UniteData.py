@@ -3,8 +3,7 @@ import shutil
 import tempfile
 import logging
 import time
-import requests
-import requests_ftp
+from hashlib import md5
 from distutils.dir_util import copy_tree
 from brdm.BaseRefData import BaseRefData
 from brdm.RefDataInterface import RefDataInterface
@@ -36,6 +35,14 @@ class UniteData(BaseRefData, RefDataInterface):
 
     def update(self):
         logging.info('Executing unite update')
+        if self.conditional_update:
+            self.get_download_cache()
+            session_requests = self.get_session(self.download_url)
+            unchanged = self.inputs_unchanged(self.get_input_urls(),
+                                              session_requests)
+            if unchanged:
+                logging.info('Unite data unchanged since the last update')
+                return True
         # Download files into the intermediate folder
         temp_dir = self.create_tmp_dir(self.destination_dir)
         if not temp_dir:
@@ -71,8 +78,16 @@ class UniteData(BaseRefData, RefDataInterface):
             logging.error('Failed to move files from temp_dir to \
             \ndestination folder, error{}'.format(e))
             return False
+        if self.conditional_update:
+            self.get_download_cache().save()
         return True
 
+    def get_input_urls(self):
+        """The links to all the files downloaded by an update"""
+        return [os.path.join(self.download_url,
+                             a_file.split('|')[1].strip())
+                for a_file in self.download_file]
+
     def download(self):
         logging.info('Executing unite download')
         download_start_time = time.time()
@@ -116,17 +131,25 @@ class UniteData(BaseRefData, RefDataInterface):
         return True
 
     # Download a file with provided file name and file address(link)
-    def download_a_file(self, file_name, file_address):
-        session_requests = requests.Session()
+    def download_a_file(self, file_name, file_address, compute_md5=False):
+        """Download a specific file
+
+        Return False if the download failed; otherwise the md5 code of
+        the file if compute_md5 is set, True if not.
+        """
+        session_requests = self.get_session(file_address)
+        md5_hash = md5() if compute_md5 else None
         try:
             res = session_requests.get(
                         file_address, stream=True)
             with open(file_name, 'wb') as output:
-                shutil.copyfileobj(res.raw, output)
-            session_requests.close()
+                self.write_stream(res.raw, output, md5_hash)
+            self.record_download(file_address, res)
         except Exception as e:
             logging.exception('Failed to download {}.'.format(file_name))
             return False
+        if md5_hash is not None:
+            return md5_hash.hexdigest()
         return True
 
     def post_process_data(self):
@@ -8,6 +8,14 @@ from brdm.NcbiWholeGenome import NcbiWholeGenome
 from brdm.GreenGeneData import GreenGeneData
 from brdm.UniteData import UniteData
 from brdm.SilvaData import SilvaData
+from brdm.SessionPool import SessionPool
+
+# Data sources kept as generations with atomic_swap, by --rollback name
+ROLLBACK_SOURCES = {'ncbi-blast': NcbiBlastData,
+                    'ncbi-taxonomy': NcbiTaxonomyData,
+                    'ncbi-subsets': NcbiSubsetData,
+                    'ncbi-wholegenomes': NcbiWholeGenome,
+                    'silva-data': SilvaData}
 
 
 def parse_input_args(argv):
@@ -102,6 +110,13 @@ def parse_input_args(argv):
     parser.add_argument('--update-silva-data', help='Update silva data',
                         dest='silva_data_update', action='store_true',
                         required=False)
+    # Make the previous generation of a data source current again; only
+    # for data updated with atomic_swap: True
+    parser.add_argument('--rollback',
+                        help='Make the previous generation of a data'
+                        ' source current again (requires atomic_swap).',
+                        dest='rollback', choices=sorted(ROLLBACK_SOURCES),
+                        required=False)
     args = parser.parse_args(argv)
     # Count number of actions
     actions = []
@@ -127,6 +142,8 @@ def parse_input_args(argv):
         actions.append('--update-unite-data')
     if args.silva_data_update:
         actions.append('--update-silva_data')
+    if args.rollback:
+        actions.append('--rollback')
     if len(actions) == 0:
         parser.error('No action requested. Please add one of the required \
                      \nactions (e.g. --update-ncbi-subsets)')
@@ -272,9 +289,20 @@ def execute_script(input_args):
                                     silvadata.destination_dir)
                   )
 
+    if parsed_args.rollback:
+        print('Rolling back {}'.format(parsed_args.rollback))
+        ref_data = ROLLBACK_SOURCES[parsed_args.rollback](config_file)
+        success = ref_data.rollback_generation()
+        if success:
+            print('{} was rolled back successfully.'
+                  '\nThe current data are: {}'
+                  .format(parsed_args.rollback,
+                          ref_data.current_generation()))
+
 
 def main():
     execute_script(sys.argv[1:])
+    SessionPool.log_stats()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,83 @@
+"""Benchmark NcbiTaxonomyData.write_taxonomy on a synthetic dump
+
+Writes a rankedlineage.dmp of random taxa, formats it with the former
+readlines() implementation and with write_taxonomy, checks that both
+outputs are byte-identical and prints the time and rows/sec of each.
+Usage: python -m tests.BenchFormatTaxonomy [number of rows]
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import filecmp
+import tempfile
+from brdm.NcbiTaxonomyData import NcbiTaxonomyData
+
+
+def write_dump(dmp_file, rows):
+    """Write a rankedlineage.dmp with rows taxa"""
+    random.seed(12865)
+    names = ['Bacteria', 'Proteobacteria', 'Escherichia', 'Homo sapiens',
+             'Enterobacterales', 'Metazoa', 'Chordata', '']
+    with open(dmp_file, 'w') as f:
+        for taxid in range(1, rows + 1):
+            fields = [str(taxid), 'taxon {}'.format(taxid)] \
+                + [random.choice(names) for i in range(8)]
+            f.write('\t|\t'.join(fields) + '\t|\n')
+
+
+def format_readlines(dmp_file, taxonomy_file):
+    """The implementation of format_taxonomy before write_taxonomy"""
+    taxonomy = open(taxonomy_file, 'w')
+    taxonomy.write(
+        'taxon_id\ttaxon_name\td__domain; k__kingdom; p__phylum; '
+        + 'c__class; o__order; f__family; g__genus; s__species\n')
+    with open(dmp_file) as fp:
+        content = fp.readlines()
+        for line in content:
+            line = line[:-3]
+            x = line.split('\t|\t')
+            tax_id, tax_name, species, genus, family, order, \
+                taxon_class, phylum, kingdom, superkingdom = x
+            taxonomy.write(tax_id + '\t' + tax_name + '\td__'
+                           + superkingdom + '; k__' + kingdom
+                           + '; p__' + phylum + '; c__'
+                           + taxon_class + '; o__' + order + '; f__'
+                           + family + '; g__' + genus + '; s__'
+                           + species + '\n')
+    taxonomy.close()
+
+
+def timed(function, *args):
+    start_time = time.time()
+    function(*args)
+    return time.time() - start_time
+
+
+def main(rows):
+    folder = tempfile.mkdtemp()
+    try:
+        dmp_file = os.path.join(folder, 'rankedlineage.dmp')
+        old_file = os.path.join(folder, 'readlines.txt')
+        new_file = os.path.join(folder, 'streaming.txt')
+        write_dump(dmp_file, rows)
+        old_time = timed(format_readlines, dmp_file, old_file)
+        new_time = timed(NcbiTaxonomyData.write_taxonomy, dmp_file,
+                         new_file)
+        if not filecmp.cmp(old_file, new_file, shallow=False):
+            print('The outputs differ')
+            return 1
+        for label, seconds in (('readlines', old_time),
+                               ('write_taxonomy', new_time)):
+            print('{:15}{:8.2f}s {:12.0f} rows/sec'
+                  .format(label, seconds, rows / seconds))
+        print('Speedup {:.2f}x, outputs identical'
+              .format(old_time / new_time))
+    finally:
+        shutil.rmtree(folder)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000000))
@@ -0,0 +1,41 @@
+import os
+import yaml
+
+
+def write_config(folder, **settings):
+    """Write the config.yaml of a test fixture into folder
+
+    The config holds the settings every data source needs, with its data
+    and backup folders in folder. Keyword arguments add top level
+    settings or override the defaults.
+    Return:
+        The path to the config file
+    """
+    config = {'download_retry_num': 1,
+              'connection_retry_num': 1,
+              'sleep_time': 0,
+              'folder_mode': '0775',
+              'file_mode': '0664',
+              'logging': {'version': 1},
+              'root_folder': os.path.join(folder, 'data'),
+              'backup_folder': os.path.join(folder, 'backup')}
+    config.update(settings)
+    config_file = os.path.join(folder, 'config.yaml')
+    with open(config_file, 'w') as f:
+        yaml.dump(config, f)
+    return config_file
+
+
+def ncbi_section(**sections):
+    """The ncbi section of a test config, without login
+
+    Keyword arguments add the sections of the NCBI data sources, such as
+    whole_genome or subsets.
+    """
+    section = {'login_url': None,
+               'user': None,
+               'password': None,
+               'chunk_size': 1024,
+               'destination_folder': 'ncbi/'}
+    section.update(sections)
+    return section
@@ -0,0 +1,66 @@
+import os
+import shutil
+import tempfile
+import unittest
+from brdm.AssemblySummary import AssemblySummary, DEFAULT_COLUMNS
+
+
+class TestAssemblySummary(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.folder = tempfile.mkdtemp()
+        self.summary = os.path.join(self.folder, 'assembly_summary.txt')
+        columns = DEFAULT_COLUMNS + ['genome_size']
+        rows = [('GCF_1', 'reference genome', '562', 'Complete Genome',
+                 '2014/05/01', '5000000'),
+                ('GCF_2', 'na', '562', 'Complete Genome',
+                 '2018/01/02', '12000000'),
+                ('GCF_3', 'representative genome', '1280', 'Contig',
+                 '2019/03/04', '2800000')]
+        with open(self.summary, 'w') as f:
+            f.write('#   See ftp://ftp.ncbi.nlm.nih.gov/genomes/README\n')
+            f.write('# ' + '\t'.join(columns) + '\n')
+            for accession, category, taxid, level, date, size in rows:
+                items = dict((c, 'na') for c in columns)
+                items.update({'assembly_accession': accession,
+                              'refseq_category': category,
+                              'taxid': taxid, 'assembly_level': level,
+                              'seq_rel_date': date, 'genome_size': size,
+                              'ftp_path': 'https://ftp/' + accession})
+                f.write('\t'.join(items[c] for c in columns) + '\n')
+
+    @classmethod
+    def tearDownClass(self):
+        shutil.rmtree(self.folder)
+
+    def accessions(self, filters):
+        return [entry['assembly_accession'] for entry in
+                AssemblySummary(filters).read(self.summary)]
+
+    def test_1_values(self):
+        print('Check filters on lists of values...')
+        self.assertEqual(self.accessions(None), ['GCF_1', 'GCF_2', 'GCF_3'])
+        self.assertEqual(self.accessions({'taxid': [562],
+                                          'assembly_level':
+                                          'Complete Genome'}),
+                         ['GCF_1', 'GCF_2'])
+
+    def test_2_ranges(self):
+        print('Check filters on ranges of dates and sizes...')
+        self.assertEqual(self.accessions(
+                            {'seq_rel_date': {'min': '2015/01/01'}}),
+                         ['GCF_2', 'GCF_3'])
+        self.assertEqual(self.accessions({'genome_size': {'max': 1e7}}),
+                         ['GCF_1', 'GCF_3'])
+
+    def test_3_unknown_column(self):
+        print('Check a filter on an unknown column is refused...')
+        with self.assertRaises(ValueError):
+            self.accessions({'gc_percent': {'max': 50}})
+        with self.assertRaises(ValueError):
+            AssemblySummary({'taxid': {'above': 1}})
+
+
+if __name__ == '__main__':
+    unittest.main()
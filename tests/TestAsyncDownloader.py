@@ -0,0 +1,105 @@
+import os
+import asyncio
+import shutil
+import tempfile
+import threading
+import unittest
+from hashlib import md5
+from aiohttp import web
+from brdm.AsyncDownloader import AsyncDownloader
+
+
+class TestAsyncDownloader(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.folder = tempfile.mkdtemp()
+        self.files = dict(('genome_{}.fna.gz'.format(i),
+                           os.urandom(1000 * (i + 1)))
+                          for i in range(10))
+        self.running = 0
+        self.peak = 0
+        self.fixture = AsyncDownloader(256, 0o640, max_requests=2,
+                                       max_per_host=2, io_workers=2)
+        self.runner = self.fixture.run(self.start_server())
+        self.url = 'http://127.0.0.1:{}'.format(self.runner.addresses[0][1])
+
+    @classmethod
+    def tearDownClass(self):
+        self.fixture.run(self.runner.cleanup())
+        self.fixture.close()
+        shutil.rmtree(self.folder)
+
+    @classmethod
+    async def start_server(self):
+        app = web.Application()
+        app.router.add_get('/{name}', self.serve)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, '127.0.0.1', 0).start()
+        return runner
+
+    @classmethod
+    async def serve(self, request):
+        name = request.match_info['name']
+        if name not in self.files:
+            raise web.HTTPNotFound()
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        await asyncio.sleep(0.01)
+        self.running -= 1
+        return web.Response(body=self.files[name])
+
+    def file_list(self, names):
+        return [(os.path.join(self.folder, name),
+                 '{}/{}'.format(self.url, name)) for name in names]
+
+    def test_1_download(self):
+        print('Check files are downloaded and hashed, a few at a time...')
+        names = sorted(self.files)
+        results = self.fixture.download_files(self.file_list(names),
+                                              compute_md5=True)
+        self.assertEqual(results, [md5(self.files[name]).hexdigest()
+                                   for name in names])
+        self.assertLessEqual(self.peak, 2)
+        for name in names:
+            file_name = os.path.join(self.folder, name)
+            with open(file_name, 'rb') as f:
+                self.assertEqual(f.read(), self.files[name])
+            self.assertEqual(os.stat(file_name).st_mode & 0o777, 0o640)
+            self.assertFalse(os.path.exists(file_name + '.part'))
+
+    def test_2_check_off_the_loop(self):
+        print('Check downloaded files are checked on an io thread...')
+        threads = []
+
+        def check(file_name, file_address, result):
+            threads.append(threading.current_thread())
+            return os.path.basename(file_name) if result else False
+
+        names = ['genome_1.fna.gz', 'missing.fna.gz', 'genome_2.fna.gz']
+        results = self.fixture.download_files(self.file_list(names),
+                                              check=check)
+        self.assertEqual(results, ['genome_1.fna.gz', False,
+                                   'genome_2.fna.gz'])
+        self.assertEqual(len(threads), 3)
+        self.assertNotIn(threading.main_thread(), threads)
+
+    def test_3_failed_download(self):
+        print('Check a failed download leaves no file behind...')
+        file_list = self.file_list(['missing.fna.gz'])
+        self.assertEqual(self.fixture.download_files(file_list), [False])
+        self.assertFalse(os.path.exists(file_list[0][0]))
+        self.assertFalse(os.path.exists(file_list[0][0] + '.part'))
+
+    def test_4_fetch_texts(self):
+        print('Check text files are fetched into memory...')
+        self.files['md5checksums.txt'] = b'abc  ./genome_1.fna.gz\n'
+        texts = self.fixture.fetch_texts(
+                    ['{}/md5checksums.txt'.format(self.url),
+                     '{}/missing.txt'.format(self.url)])
+        self.assertEqual(texts, ['abc  ./genome_1.fna.gz\n', None])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import gzip
+import random
+import shutil
+import tempfile
+import unittest
+from brdm.BgzfFasta import BgzfFasta
+
+
+class TestBgzfFasta(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.folder = tempfile.mkdtemp()
+        self.fasta = os.path.join(self.folder, 'a_genomic.fna.gz')
+        rand = random.Random(1)
+        self.records = {}
+        content = []
+        for name in ['NC_000001.1', 'NC_000002.1', 'NC_000003.1']:
+            sequence = ''.join(rand.choice('ACGT')
+                               for i in range(rand.randint(50000, 150000)))
+            self.records[name] = sequence
+            content.append('>{} a genome\n'.format(name))
+            for i in range(0, len(sequence), 80):
+                content.append(sequence[i:i + 80] + '\n')
+        self.content = ''.join(content).encode()
+        with gzip.open(self.fasta, 'wb') as f:
+            f.write(self.content)
+
+    @classmethod
+    def tearDownClass(self):
+        shutil.rmtree(self.folder)
+
+    def test_1_convert(self):
+        print('Recompress a gzipped FASTA file into BGZF...')
+        records = BgzfFasta.convert(self.fasta, self.fasta)
+        self.assertEqual(records, 3)
+        with gzip.open(self.fasta, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+        with open(self.fasta, 'rb') as f:
+            self.assertEqual(f.read(16)[12:14], b'BC')
+
+    def test_2_fai(self):
+        print('Check the .fai index...')
+        with open(self.fasta + '.fai', 'r') as f:
+            lines = [line.split('\t') for line in f]
+        self.assertEqual([line[0] for line in lines], list(self.records))
+        for line in lines:
+            self.assertEqual(int(line[1]), len(self.records[line[0]]))
+            self.assertEqual(int(line[3]), 80)
+            self.assertEqual(int(line[4]), 81)
+
+    def test_3_random_access(self):
+        print('Read records through the .gzi index...')
+        for name, sequence in self.records.items():
+            self.assertEqual(BgzfFasta.fetch(self.fasta, name),
+                             sequence.encode())
+        self.assertEqual(BgzfFasta.read(self.fasta, 100000, 1000),
+                         self.content[100000:101000])
+
+    def test_4_truncated_source(self):
+        print('Check a failed conversion leaves no temporary file...')
+        source = os.path.join(self.folder, 'b_genomic.fna.gz')
+        with open(source, 'wb') as f:
+            f.write(gzip.compress(self.content)[:50000])
+        target = os.path.join(self.folder, 'b_genomic.fna.bgz')
+        with self.assertRaises(EOFError):
+            BgzfFasta.convert(source, target)
+        self.assertFalse(os.path.exists(target + '.bgzf'))
+        self.assertFalse(os.path.exists(target))
+
+
+if __name__ == '__main__':
+    unittest.main()
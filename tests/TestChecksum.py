@@ -0,0 +1,63 @@
+import os
+import shutil
+import tempfile
+import unittest
+from brdm.BaseRefData import BaseRefData
+from tests.ConfigFixture import write_config
+
+
+class TestChecksum(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.folder = tempfile.mkdtemp()
+        # A buffer smaller than the files, so they are hashed in chunks
+        config_file = write_config(self.folder, checksum_workers=3,
+                                   checksum_buffer_size=7)
+        self.fixture = BaseRefData(config_file)
+        # md5 codes of the files as given by md5sum
+        self.md5_codes = {'abc.txt': '900150983cd24fb0d6963f7d28e17f72',
+                          'empty.txt': 'd41d8cd98f00b204e9800998ecf8427e',
+                          'fox.txt': '9e107d9d372bb6826bd81d3542a419d6'}
+        contents = {'abc.txt': b'abc', 'empty.txt': b'',
+                    'fox.txt': b'The quick brown fox jumps over the '
+                               b'lazy dog'}
+        for name, content in contents.items():
+            with open(os.path.join(self.folder, name), 'wb') as f:
+                f.write(content)
+
+    @classmethod
+    def tearDownClass(self):
+        os.chdir(tempfile.gettempdir())
+        shutil.rmtree(self.folder)
+
+    def md5_list(self, md5_codes):
+        return [(os.path.join(self.folder, name), md5_code)
+                for name, md5_code in sorted(md5_codes.items())]
+
+    def test_1_check_md5(self):
+        print('Check a file is hashed in chunks against its md5 code...')
+        file_name = os.path.join(self.folder, 'fox.txt')
+        self.assertTrue(self.fixture.check_md5(file_name,
+                                               self.md5_codes['fox.txt']))
+        self.assertFalse(self.fixture.check_md5(file_name,
+                                                self.md5_codes['abc.txt']))
+        self.assertFalse(self.fixture.check_md5(file_name, None))
+
+    def test_2_batch_all_match(self):
+        print('Check a batch of matching files passes...')
+        self.assertEqual(
+            self.fixture.check_md5_batch(self.md5_list(self.md5_codes)), [])
+
+    def test_3_batch_failures(self):
+        print('Check the files failing a batch check are reported...')
+        md5_codes = dict(self.md5_codes)
+        md5_codes['abc.txt'] = self.md5_codes['fox.txt']
+        md5_codes['missing.txt'] = self.md5_codes['abc.txt']
+        failed = self.fixture.check_md5_batch(self.md5_list(md5_codes))
+        self.assertEqual(failed, [os.path.join(self.folder, 'abc.txt'),
+                                  os.path.join(self.folder, 'missing.txt')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from brdm.UniteData import UniteData
+from tests.ConfigFixture import write_config
+
+
+class FakeResponse():
+    """The parts of a requests response used by an update"""
+
+    def __init__(self, status_code, headers, content=b''):
+        self.status_code = status_code
+        self.headers = headers
+        self.raw = io.BytesIO(content)
+
+
+class FakeSession():
+    """A server answering conditional requests by the ETag of its file"""
+
+    def __init__(self, content, etag):
+        self.content = content
+        self.etag = etag
+        self.downloads = 0
+
+    def headers(self):
+        return {'ETag': self.etag, 'Content-Length': str(len(self.content))}
+
+    def head(self, url, headers=None, allow_redirects=False):
+        if headers.get('If-None-Match') == self.etag:
+            return FakeResponse(304, {'ETag': self.etag})
+        return FakeResponse(200, self.headers())
+
+    def get(self, url, stream=False):
+        self.downloads += 1
+        return FakeResponse(200, self.headers(), self.content)
+
+
+class TestConditionalUpdate(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.folder = tempfile.mkdtemp()
+        self.config_file = write_config(
+            self.folder, readme_file='README+', conditional_update=True,
+            unite={'download_url': 'https://files.plutof.ut.ee/public/',
+                   'download_file': ['| sh_general.fasta'],
+                   'developer_folder': [],
+                   'redundant_path': [],
+                   'destination_folder': 'unite/'})
+        self.session = FakeSession(b'>SH1\nACGT\n', '"v1"')
+
+    @classmethod
+    def tearDownClass(self):
+        os.chdir(tempfile.gettempdir())
+        shutil.rmtree(self.folder)
+
+    def update(self):
+        """Run the update of a new process"""
+        fixture = UniteData(self.config_file)
+        with mock.patch.object(fixture, 'get_session',
+                               return_value=self.session), \
+                mock.patch.object(fixture, 'to_blast_format',
+                                  return_value=True):
+            return fixture.update()
+
+    def test_1_first_update(self):
+        print('Check the first update records its downloads...')
+        self.assertTrue(self.update())
+        self.assertEqual(self.session.downloads, 1)
+        fixture = UniteData(self.config_file)
+        url = fixture.get_input_urls()[0]
+        self.assertIsNotNone(
+            fixture.get_download_cache().conditional_headers(url))
+
+    def test_2_unchanged(self):
+        print('Check an update of unchanged files downloads nothing...')
+        self.assertTrue(self.update())
+        self.assertEqual(self.session.downloads, 1)
+
+    def test_3_changed(self):
+        print('Check a changed file is downloaded again...')
+        self.session.etag = '"v2"'
+        self.assertTrue(self.update())
+        self.assertEqual(self.session.downloads, 2)
+        self.assertTrue(self.update())
+        self.assertEqual(self.session.downloads, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import os
+import shutil
+import tempfile
+import unittest
+from brdm.DownloadCache import DownloadCache
+
+
+class FakeResponse():
+
+    def __init__(self, status_code, headers):
+        self.status_code = status_code
+        self.headers = headers
+
+
+class TestDownloadCache(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.folder = tempfile.mkdtemp()
+        self.cache_file = os.path.join(self.folder, '.download_cache.json')
+        self.url = 'https://ftp.ncbi.nlm.nih.gov/pub/taxonomy/a.tar.gz'
+
+    @classmethod
+    def tearDownClass(self):
+        shutil.rmtree(self.folder)
+
+    def test_1_pending_not_saved(self):
+        print('Check pending entries are not used before save...')
+        cache = DownloadCache(self.cache_file)
+        cache.record(self.url, {'ETag': '"abc"', 'Content-Length': '10'})
+        self.assertIsNone(cache.conditional_headers(self.url))
+        self.assertFalse(os.path.isfile(self.cache_file))
+
+    def test_2_save_and_reload(self):
+        print('Check the cache file is reloaded...')
+        cache = DownloadCache(self.cache_file)
+        cache.record(self.url, {'ETag': '"abc"', 'Content-Length': '10'})
+        self.assertTrue(cache.save())
+        cache = DownloadCache(self.cache_file)
+        headers = cache.conditional_headers(self.url)
+        self.assertEqual(headers['If-None-Match'], '"abc"')
+
+    def test_3_is_unchanged(self):
+        print('Check responses to conditional requests...')
+        cache = DownloadCache(self.cache_file)
+        self.assertTrue(cache.is_unchanged(self.url, FakeResponse(304, {})))
+        self.assertTrue(cache.is_unchanged(
+            self.url, FakeResponse(200, {'ETag': '"abc"'})))
+        self.assertFalse(cache.is_unchanged(
+            self.url, FakeResponse(200, {'ETag': '"def"'})))
+        self.assertFalse(cache.is_unchanged(
+            'https://other/url', FakeResponse(304, {})))
+
+
+if __name__ == '__main__':
+    unittest.main()
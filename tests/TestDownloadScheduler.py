@@ -0,0 +1,63 @@
+import time
+import threading
+import unittest
+from brdm.DownloadScheduler import DownloadScheduler
+
+
+class TestDownloadScheduler(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.lock = threading.Lock()
+
+    def test_1_largest_first(self):
+        print('Check unknown sizes go first, then the largest...')
+        jobs = [(10, 'https://a/1', None, ()),
+                (None, 'https://a/2', None, ()),
+                (30, 'https://a/3', None, ())]
+        self.assertEqual(DownloadScheduler(2).order(jobs), [1, 2, 0])
+
+    def test_2_per_host_limit(self):
+        print('Check the transfers in flight per host are limited...')
+        running = {}
+        peak = {}
+
+        def transfer(host):
+            with self.lock:
+                running[host] = running.get(host, 0) + 1
+                peak[host] = max(peak.get(host, 0), running[host])
+            time.sleep(0.05)
+            with self.lock:
+                running[host] -= 1
+            return host
+
+        jobs = [(i, 'https://{}/{}'.format(host, i), transfer, (host,))
+                for i in range(6) for host in ('a', 'b')]
+        results = DownloadScheduler(4, max_per_host=2).run(jobs)
+        self.assertEqual(results, [job[3][0] for job in jobs])
+        self.assertEqual(peak, {'a': 2, 'b': 2})
+
+    def test_3_failed_transfer(self):
+        print('Check a failing transfer does not stop the others...')
+
+        def transfer(ok):
+            if not ok:
+                raise IOError('connection reset')
+            return ok
+
+        jobs = [(1, 'https://a/1', transfer, (True,)),
+                (2, 'https://a/2', transfer, (False,))]
+        self.assertEqual(DownloadScheduler(2).run(jobs), [True, False])
+
+    def test_4_many_jobs_one_host(self):
+        print('Check a long backlog on a saturated host is dispatched fast...')
+        jobs = [(i, 'https://ftp.ncbi.nlm.nih.gov/{}'.format(i), abs, (i,))
+                for i in range(20000)]
+        start_time = time.time()
+        results = DownloadScheduler(8, max_per_host=2).run(jobs)
+        self.assertEqual(results, list(range(20000)))
+        self.assertLess(time.time() - start_time, 30)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import os
+import shutil
+import tempfile
+import unittest
+from brdm.DownloadState import DownloadState
+
+
+class TestDownloadState(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.folder = tempfile.mkdtemp()
+        self.db_file = os.path.join(self.folder, '.download_state.sqlite')
+        self.url = 'https://ftp.ncbi.nlm.nih.gov/genomes/a_genomic.fna.gz'
+
+    @classmethod
+    def tearDownClass(self):
+        shutil.rmtree(self.folder)
+
+    def test_1_plan(self):
+        print('Check planned files are not completed...')
+        state = DownloadState(self.db_file)
+        state.plan('viral', [(self.url, 'a_genomic.fna.gz')])
+        self.assertEqual(state.progress(), (1, 0, 0))
+        self.assertEqual(state.completed(), {})
+        state.close()
+
+    def test_2_record_and_reopen(self):
+        print('Check the state survives a new connection...')
+        state = DownloadState(self.db_file)
+        state.record(self.url, 10, 'abc', verified=True)
+        state.close()
+        state = DownloadState(self.db_file)
+        state.plan('viral', [(self.url, 'a_genomic.fna.gz')])
+        self.assertEqual(state.completed('viral'), {self.url: 'abc'})
+        self.assertEqual(state.completed('viral', extracted=True), {})
+        state.close()
+
+    def test_3_remove(self):
+        print('Check the state file is removed...')
+        state = DownloadState(self.db_file)
+        self.assertTrue(state.remove())
+        self.assertFalse(os.path.isfile(self.db_file))
+
+
+if __name__ == '__main__':
+    unittest.main()
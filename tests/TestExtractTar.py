@@ -0,0 +1,83 @@
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+from brdm.BaseRefData import extract_tar
+
+
+class TestExtractTar(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, 'staging')
+
+    @classmethod
+    def tearDownClass(self):
+        shutil.rmtree(self.folder)
+
+    def setUp(self):
+        os.makedirs(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    @staticmethod
+    def archive(members):
+        """A tar.gz stream of (TarInfo, content) pairs"""
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode='w:gz') as tar:
+            for info, content in members:
+                info.size = len(content)
+                tar.addfile(info, io.BytesIO(content))
+        buffer.seek(0)
+        return buffer
+
+    def extract(self, members):
+        with tarfile.open(fileobj=self.archive(members), mode='r|gz') as tar:
+            return extract_tar(tar, self.path)
+
+    def test_1_extract(self):
+        print('Check files are extracted as new files...')
+        linked = os.path.join(self.folder, 'linked.txt')
+        with open(os.path.join(self.path, 'nt.00.nsq'), 'w') as f:
+            f.write('old')
+        os.link(os.path.join(self.path, 'nt.00.nsq'), linked)
+        directory = tarfile.TarInfo('taxdb')
+        directory.type = tarfile.DIRTYPE
+        members = self.extract([(tarfile.TarInfo('nt.00.nsq'), b'new'),
+                                (directory, b''),
+                                (tarfile.TarInfo('taxdb/taxdb.btd'), b'x')])
+        self.assertEqual([m.name for m in members],
+                         ['nt.00.nsq', 'taxdb', 'taxdb/taxdb.btd'])
+        with open(os.path.join(self.path, 'nt.00.nsq')) as f:
+            self.assertEqual(f.read(), 'new')
+        with open(linked) as f:
+            self.assertEqual(f.read(), 'old')
+        os.remove(linked)
+
+    def test_2_outside(self):
+        print('Check members leading out of the folder are refused...')
+        for name in ['../escaped.txt', os.path.join(self.folder,
+                                                     'escaped.txt')]:
+            with self.assertRaises(ValueError):
+                self.extract([(tarfile.TarInfo(name), b'x')])
+            self.assertFalse(os.path.exists(
+                os.path.join(self.folder, 'escaped.txt')))
+
+    def test_3_links(self):
+        print('Check links are refused...')
+        for link_type in [tarfile.SYMTYPE, tarfile.LNKTYPE]:
+            link = tarfile.TarInfo('nt.00.nsq')
+            link.type = link_type
+            link.linkname = os.path.join(self.folder, 'target.txt')
+            with self.assertRaises(ValueError):
+                self.extract([(link, b'')])
+            self.assertFalse(os.path.lexists(
+                os.path.join(self.path, 'nt.00.nsq')))
+
+
+if __name__ == '__main__':
+    unittest.main()
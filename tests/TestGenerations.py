@@ -0,0 +1,103 @@
+import os
+import shutil
+import tempfile
+import unittest
+from brdm.BaseRefData import BaseRefData
+from tests.ConfigFixture import write_config
+
+
+class TestGenerations(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.folder = tempfile.mkdtemp()
+        config_file = write_config(self.folder, atomic_swap=True,
+                                   keep_generations=2)
+        self.fixture = BaseRefData(config_file)
+
+    @classmethod
+    def tearDownClass(self):
+        os.chdir(tempfile.gettempdir())
+        shutil.rmtree(self.folder)
+
+    def new_data(self, content):
+        """An intermediate folder holding a data file"""
+        temp_dir = tempfile.mkdtemp(dir=self.folder)
+        with open(os.path.join(temp_dir, 'data.txt'), 'w') as f:
+            f.write(content)
+        return temp_dir
+
+    def live_content(self):
+        with open(os.path.join(self.fixture.live_dir(), 'data.txt')) as f:
+            return f.read()
+
+    def test_1_stage(self):
+        print('Check an intermediate folder is staged as a generation...')
+        temp_dir = self.new_data('staged')
+        generation_dir = self.fixture.stage_generation(temp_dir)
+        self.assertFalse(os.path.exists(temp_dir))
+        self.assertEqual(self.fixture.list_generations(), [generation_dir])
+        self.assertIsNone(self.fixture.current_generation())
+        self.assertEqual(self.fixture.live_dir(),
+                         self.fixture.destination_dir)
+
+    def test_2_activate(self):
+        print('Check the current symlink points to a generation...')
+        generation_dir = self.fixture.list_generations()[-1]
+        self.assertTrue(self.fixture.activate_generation(generation_dir))
+        self.assertEqual(self.fixture.current_generation(), generation_dir)
+        self.assertEqual(self.live_content(), 'staged')
+
+    def test_3_promote(self):
+        print('Check promoted data go live and a failed prepare does not...')
+        self.assertTrue(self.fixture.promote(self.new_data('first')))
+        self.assertEqual(self.live_content(), 'first')
+        current = self.fixture.current_generation()
+        temp_dir = self.new_data('broken')
+        self.assertFalse(self.fixture.promote(temp_dir, lambda f: False))
+        self.assertTrue(os.path.isdir(temp_dir))
+        self.assertEqual(self.fixture.current_generation(), current)
+        self.assertEqual(len(self.fixture.list_generations()), 2)
+        self.assertEqual(self.live_content(), 'first')
+
+    def test_4_prune(self):
+        print('Check only the keep_generations last generations are kept...')
+        first = self.fixture.current_generation()
+        self.assertTrue(self.fixture.promote(self.new_data('second')))
+        current = self.fixture.current_generation()
+        self.assertEqual(self.fixture.list_generations(), [first, current])
+        self.assertEqual(self.live_content(), 'second')
+
+    def test_5_rollback(self):
+        print('Check a rollback makes the previous generation current...')
+        first = self.fixture.list_generations()[0]
+        self.assertTrue(self.fixture.rollback_generation())
+        self.assertEqual(self.fixture.current_generation(), first)
+        self.assertEqual(self.live_content(), 'first')
+        self.assertFalse(self.fixture.rollback_generation())
+        self.assertEqual(self.fixture.current_generation(), first)
+
+    def test_6_download_state(self):
+        print('Check a failed promotion keeps the update to resume...')
+        temp_dir = self.fixture.create_tmp_dir(self.fixture.destination_dir)
+        self.fixture.open_download_state(temp_dir)
+        with open(os.path.join(temp_dir, 'data.txt'), 'w') as f:
+            f.write('resumed')
+        self.fixture.close_download_state()
+        self.assertFalse(self.fixture.promote(temp_dir, lambda f: False))
+        # The next run finds the state and keeps the downloaded files
+        self.assertEqual(
+            self.fixture.create_tmp_dir(self.fixture.destination_dir),
+            temp_dir)
+        self.assertTrue(os.path.isfile(os.path.join(temp_dir, 'data.txt')))
+        self.fixture.open_download_state(temp_dir)
+        self.fixture.close_download_state()
+        self.assertTrue(self.fixture.promote(temp_dir))
+        self.assertTrue(self.fixture.finish_download_state())
+        self.assertEqual(self.live_content(), 'resumed')
+        self.assertFalse(os.path.exists(os.path.join(
+            self.fixture.live_dir(), self.fixture.download_state_file)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+import os
+import shutil
+import tempfile
+import unittest
+from hashlib import md5
+from unittest import mock
+from brdm.NcbiWholeGenome import NcbiWholeGenome, GENOME_MANIFEST
+from tests.ConfigFixture import write_config, ncbi_section
+
+
+class TestGenomeManifest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.folder = tempfile.mkdtemp()
+        config_file = write_config(
+            self.folder, atomic_swap=True,
+            ncbi=ncbi_section(whole_genome={
+                'destination_folder': 'whole_genome/',
+                'download_folder': 'genomes/refseq',
+                'download_file': 'assembly_summary.txt',
+                'info_file_name': 'README.txt',
+                'md5_file_name': 'md5checksums.txt',
+                'assembly_level': ['Complete Genome'],
+                'species': ['viral'],
+                'genome_format': 'fna'}))
+        self.fixture = NcbiWholeGenome(config_file)
+        # The set in use, in the current generation
+        generation = os.path.join(self.fixture.destination_dir,
+                                  'generations', '1')
+        self.live_set = os.path.join(generation, 'viral')
+        os.makedirs(self.live_set)
+        self.fixture.activate_generation(generation)
+        self.urls = []
+        self.contents = {}
+        for name in ['GCF_1', 'GCF_2', 'GCF_3']:
+            self.urls.append('https://ftp.ncbi.nlm.nih.gov/genomes/all/'
+                             '{0}/{0}_genomic.fna.gz'.format(name))
+            self.contents[name] = '>{}\nACGT\n'.format(name).encode()
+            with open(os.path.join(self.live_set,
+                                   name + '_genomic.fna'), 'wb') as f:
+                f.write(self.contents[name])
+        md5_cache = self.fixture.get_md5_cache()
+        for url in self.urls[:2]:
+            folder_url, file_name = url.rsplit('/', 1)
+            md5_cache.put(folder_url, {file_name: 'ncbi_' + file_name})
+
+    @classmethod
+    def tearDownClass(self):
+        self.fixture.close_md5_cache()
+        os.chdir(tempfile.gettempdir())
+        shutil.rmtree(self.folder)
+
+    def new_set_folder(self):
+        return tempfile.mkdtemp(dir=self.folder)
+
+    def test_1_write_manifest(self):
+        print('Check the manifest lists both md5 codes of every genome...')
+        with mock.patch.object(self.fixture, 'fetch_md5_map',
+                               return_value=None) as fetch, \
+                self.assertLogs(level='WARNING') as logs:
+            self.fixture.write_genome_manifest('viral', self.live_set,
+                                               self.urls)
+        fetch.assert_called_once_with(self.urls[2].rsplit('/', 1)[0])
+        self.assertIn('GCF_3_genomic.fna', logs.output[0])
+        manifest = self.fixture.read_genome_manifest(self.live_set)
+        self.assertEqual(sorted(manifest),
+                         ['GCF_1_genomic.fna', 'GCF_2_genomic.fna'])
+        stored_file = os.path.join(self.live_set, 'GCF_1_genomic.fna')
+        self.assertEqual(manifest['GCF_1_genomic.fna'],
+                         ('ncbi_GCF_1_genomic.fna.gz',
+                          md5(self.contents['GCF_1']).hexdigest())
+                         + self.fixture.genome_signature(stored_file))
+
+    def test_2_fetch_unknown_md5(self):
+        print('Check an md5 code unknown to the cache is fetched...')
+        folder_url, file_name = self.urls[2].rsplit('/', 1)
+        with mock.patch.object(self.fixture, 'fetch_md5_map',
+                               return_value={file_name: 'ncbi_3'}):
+            self.fixture.write_genome_manifest('viral', self.live_set,
+                                               self.urls)
+        manifest = self.fixture.read_genome_manifest(self.live_set)
+        self.assertEqual(manifest['GCF_3_genomic.fna'][0], 'ncbi_3')
+
+    def test_3_reuse(self):
+        print('Check unchanged genomes are linked into the new set...')
+        set_folder = self.new_set_folder()
+        self.assertEqual(self.fixture.reuse_genomes('viral', set_folder,
+                                                    self.urls), [])
+        for name in self.contents:
+            stored_name = name + '_genomic.fna'
+            self.assertTrue(os.path.samefile(
+                os.path.join(set_folder, stored_name),
+                os.path.join(self.live_set, stored_name)))
+
+    def test_4_changed_on_ncbi(self):
+        print('Check a genome with a new md5 code on NCBI is not reused...')
+        folder_url, file_name = self.urls[0].rsplit('/', 1)
+        md5_cache = self.fixture.get_md5_cache()
+        md5_cache.put(folder_url, {file_name: 'republished'})
+        try:
+            self.assertEqual(self.fixture.reuse_genomes(
+                'viral', self.new_set_folder(), self.urls), self.urls[:1])
+        finally:
+            md5_cache.put(folder_url, {file_name: 'ncbi_' + file_name})
+
+    def test_5_changed_stored_file(self):
+        print('Check a stored file that was modified is not reused...')
+        # Same size and modification time: only hashing tells; GCF_3 is
+        # not in the md5 cache, so its stored file is hashed
+        stored_file = os.path.join(self.live_set, 'GCF_3_genomic.fna')
+        stat = os.stat(stored_file)
+        with open(stored_file, 'r+b') as f:
+            f.write(b'<')
+        os.utime(stored_file, (stat.st_atime, stat.st_mtime))
+        self.assertEqual(self.fixture.reuse_genomes(
+            'viral', self.new_set_folder(), self.urls), self.urls[2:])
+        # A new modification time is enough
+        stored_file = os.path.join(self.live_set, 'GCF_2_genomic.fna')
+        os.utime(stored_file, (stat.st_atime, stat.st_mtime + 10))
+        self.assertEqual(self.fixture.reuse_genomes(
+            'viral', self.new_set_folder(), self.urls), self.urls[1:])
+
+    def test_6_old_manifest(self):
+        print('Check genomes of a manifest without stored md5 are not '
+              'reused...')
+        manifest = os.path.join(self.live_set, GENOME_MANIFEST)
+        with open(manifest, 'w') as f:
+            f.write('GCF_1_genomic.fna\tncbi_GCF_1_genomic.fna.gz\t11\t0\n')
+        self.assertEqual(self.fixture.read_genome_manifest(self.live_set),
+                         {})
+        self.assertEqual(self.fixture.reuse_genomes(
+            'viral', self.new_set_folder(), self.urls), self.urls)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import os
+import shutil
+import tempfile
+import unittest
+from brdm.Md5Cache import Md5Cache
+
+
+class TestMd5Cache(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.folder = tempfile.mkdtemp()
+        self.cache_file = os.path.join(self.folder, '.md5_cache.sqlite')
+        self.folder_url = 'https://ftp.ncbi.nlm.nih.gov/genomes/all/GCF_1'
+        self.md5_text = 'abc  ./GCF_1_genomic.fna.gz\n' \
+            + 'def  ./GCF_1_cds_from_genomic.fna.gz\n'
+
+    @classmethod
+    def tearDownClass(self):
+        shutil.rmtree(self.folder)
+
+    def test_1_parse(self):
+        print('Check md5 files are parsed by file name...')
+        self.assertEqual(Md5Cache.parse(self.md5_text),
+                         {'GCF_1_genomic.fna.gz': 'abc',
+                          'GCF_1_cds_from_genomic.fna.gz': 'def'})
+
+    def test_2_put_and_reopen(self):
+        print('Check the md5 codes survive a new cache...')
+        cache = Md5Cache(self.cache_file, capacity=1)
+        self.assertEqual(cache.missing([self.folder_url]), [self.folder_url])
+        cache.put(self.folder_url, Md5Cache.parse(self.md5_text))
+        cache.put(self.folder_url + '0', {})
+        self.assertEqual(list(cache.recent), [self.folder_url + '0'])
+        cache.close()
+        cache = Md5Cache(self.cache_file)
+        self.assertEqual(cache.get(self.folder_url)['GCF_1_genomic.fna.gz'],
+                         'abc')
+        cache.close()
+
+    def test_3_discard(self):
+        print('Check a discarded folder is fetched again...')
+        cache = Md5Cache(self.cache_file)
+        cache.discard(self.folder_url)
+        self.assertIsNone(cache.get(self.folder_url))
+        self.assertEqual(cache.missing([self.folder_url, self.folder_url]),
+                         [self.folder_url])
+        cache.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
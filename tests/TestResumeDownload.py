@@ -0,0 +1,117 @@
+import os
+import re
+import shutil
+import tempfile
+import unittest
+from hashlib import md5
+from brdm.NcbiData import NcbiData
+from tests.ConfigFixture import write_config, ncbi_section
+
+
+class FakeResponse():
+    """The parts of a requests response used by a resumed download"""
+
+    def __init__(self, status_code, headers, content=b''):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    def iter_content(self, chunk_size=1, decode_unicode=False):
+        for start in range(0, len(self.content), 100):
+            yield self.content[start:start + 100]
+
+    def raise_for_status(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeSession():
+    """A server answering range requests like NCBI
+
+    Args:
+        content (bytes): the file served
+        ranges (bool): whether the server accepts ranges
+    """
+
+    def __init__(self, content, ranges=True):
+        self.content = content
+        self.ranges = ranges
+        self.requested = []
+
+    def get(self, url, stream=False, headers=None):
+        self.requested.append(headers.get('Range'))
+        size = len(self.content)
+        if not self.ranges or 'Range' not in headers:
+            return FakeResponse(200, {'Content-Length': str(size)},
+                                self.content)
+        start = int(re.match(r'bytes=(\d+)-', headers['Range']).group(1))
+        if start >= size:
+            error_page = b'<html>Requested Range Not Satisfiable</html>'
+            return FakeResponse(416, {'Content-Range': 'bytes */{}'
+                                      .format(size),
+                                      'Content-Length':
+                                      str(len(error_page))}, error_page)
+        return FakeResponse(206, {'Content-Range': 'bytes {}-{}/{}'
+                                  .format(start, size - 1, size),
+                                  'Content-Length': str(size - start)},
+                            self.content[start:])
+
+
+class TestResumeDownload(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.folder = tempfile.mkdtemp()
+        config_file = write_config(self.folder, ncbi=ncbi_section())
+        self.fixture = NcbiData(config_file)
+        self.content = os.urandom(1000)
+        self.file_name = os.path.join(self.folder, 'taxdump.tar.gz')
+        self.url = 'https://ftp.ncbi.nlm.nih.gov/pub/taxonomy/taxdump.tar.gz'
+
+    @classmethod
+    def tearDownClass(self):
+        os.chdir(tempfile.gettempdir())
+        shutil.rmtree(self.folder)
+
+    def tearDown(self):
+        if os.path.exists(self.file_name):
+            os.remove(self.file_name)
+
+    def write_part(self, size):
+        with open(self.file_name + '.part', 'wb') as f:
+            f.write(self.content[:size])
+
+    def download(self, session):
+        md5_code = self.fixture.download_a_file(self.file_name, self.url,
+                                                session, compute_md5=True)
+        self.assertEqual(md5_code, md5(self.content).hexdigest())
+        self.assertFalse(os.path.exists(self.file_name + '.part'))
+        with open(self.file_name, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+
+    def test_1_resume(self):
+        print('Check a partial download is completed from its size...')
+        self.write_part(400)
+        session = FakeSession(self.content)
+        self.download(session)
+        self.assertEqual(session.requested, ['bytes=400-'])
+
+    def test_2_already_complete(self):
+        print('Check a complete partial download is not fetched again...')
+        self.write_part(1000)
+        session = FakeSession(self.content)
+        self.download(session)
+        self.assertEqual(session.requested, ['bytes=1000-'])
+
+    def test_3_range_ignored(self):
+        print('Check a server ignoring ranges restarts the download...')
+        self.write_part(400)
+        session = FakeSession(self.content, ranges=False)
+        self.download(session)
+        self.assertEqual(session.requested, ['bytes=400-'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+import os
+import re
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+from hashlib import md5
+from brdm.BaseRefData import BaseRefData
+from tests.ConfigFixture import write_config
+
+
+class FakeResponse():
+    """The parts of a requests response used by a segmented download"""
+
+    def __init__(self, status_code, headers, content=b'', delay=0):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.delay = delay
+
+    def iter_content(self, chunk_size=1):
+        for start in range(0, len(self.content), 100):
+            time.sleep(self.delay)
+            yield self.content[start:start + 100]
+
+    def close(self):
+        pass
+
+
+class FakeSession():
+    """A session serving content, with or without range support
+
+    Args:
+        content (bytes): the file served
+        ranges (bool): whether the server accepts ranges
+        short (int): the start of a range served one byte short
+        ignore_range (bool): answer range requests with the whole file
+    """
+
+    def __init__(self, content, ranges=True, short=None,
+                 ignore_range=False):
+        self.content = content
+        self.ranges = ranges
+        self.short = short
+        self.ignore_range = ignore_range
+        self.requested = []
+        self.lock = threading.Lock()
+
+    def head(self, url, headers=None, allow_redirects=False):
+        headers = {'Content-Length': str(len(self.content))}
+        if self.ranges:
+            headers['Accept-Ranges'] = 'bytes'
+        return FakeResponse(200, headers)
+
+    def get(self, url, stream=False, headers=None):
+        if self.ignore_range:
+            return FakeResponse(200, {}, self.content)
+        start, end = map(int, re.match(r'bytes=(\d+)-(\d+)',
+                                       headers['Range']).groups())
+        with self.lock:
+            self.requested.append((start, end))
+        content = self.content[start:end + 1]
+        if start == self.short:
+            content = content[:-1]
+        # The first range is served slower, so the others arrive first
+        return FakeResponse(206, {'Content-Range': 'bytes {}-{}/{}'
+                                  .format(start, end, len(self.content))},
+                            content, 0.001 if start == 0 else 0)
+
+
+class TestSegmentedDownload(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.folder = tempfile.mkdtemp()
+        config_file = write_config(self.folder, download_segments=4,
+                                   min_segment_size=1000)
+        self.fixture = BaseRefData(config_file)
+        self.content = os.urandom(10000)
+        self.part_name = os.path.join(self.folder, 'nr.00.tar.gz.part')
+        self.url = 'https://ftp.ncbi.nlm.nih.gov/blast/db/nr.00.tar.gz'
+
+    @classmethod
+    def tearDownClass(self):
+        os.chdir(tempfile.gettempdir())
+        shutil.rmtree(self.folder)
+
+    def tearDown(self):
+        if os.path.exists(self.part_name):
+            os.remove(self.part_name)
+
+    def test_1_segments(self):
+        print('Check a file is split into ranges and hashed in order...')
+        session = FakeSession(self.content)
+        md5_hash = md5()
+        res = self.fixture.download_segmented(self.url, self.part_name,
+                                              session, md5_hash)
+        self.assertIsNotNone(res)
+        self.assertEqual(sorted(session.requested),
+                         [(0, 2499), (2500, 4999), (5000, 7499),
+                          (7500, 9999)])
+        with open(self.part_name, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertEqual(md5_hash.hexdigest(), md5(self.content).hexdigest())
+
+    def test_2_min_segment_size(self):
+        print('Check segments are at least min_segment_size bytes...')
+        session = FakeSession(self.content[:2500])
+        self.fixture.download_segmented(self.url, self.part_name, session)
+        self.assertEqual(sorted(session.requested), [(0, 1249), (1250, 2499)])
+        session = FakeSession(self.content[:1999])
+        self.assertIsNone(self.fixture.download_segmented(
+                            self.url, self.part_name, session))
+        self.assertEqual(session.requested, [])
+
+    def test_3_ranges_not_supported(self):
+        print('Check a server without ranges falls back to one stream...')
+        session = FakeSession(self.content, ranges=False)
+        self.assertIsNone(self.fixture.download_segmented(
+                            self.url, self.part_name, session))
+        self.assertEqual(session.requested, [])
+        self.assertFalse(os.path.exists(self.part_name))
+
+    def test_4_short_segment(self):
+        print('Check a short segment fails the download...')
+        session = FakeSession(self.content, short=5000)
+        with self.assertRaises(IOError):
+            self.fixture.download_segmented(self.url, self.part_name,
+                                            session, md5())
+        self.assertFalse(os.path.exists(self.part_name))
+
+    def test_5_range_ignored(self):
+        print('Check a range answered with the whole file is refused...')
+        session = FakeSession(self.content, ignore_range=True)
+        with self.assertRaises(IOError):
+            self.fixture.download_range(self.url, session, None, 0, 2499)
+
+    def test_6_small_files(self):
+        print('Check md5 and README files are not worth segments...')
+        self.assertTrue(self.fixture.segments_wanted('nr.00.tar.gz'))
+        for name in ['nr.00.tar.gz.md5', 'README', 'taxdump_readme.txt',
+                     '/data/silva/00README', 'md5checksums.txt']:
+            self.assertFalse(self.fixture.segments_wanted(name))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from brdm.NcbiSubsetData import NcbiSubsetData
+from brdm.TaxonomyIndex import TaxonomyIndex
+from tests.ConfigFixture import write_config, ncbi_section
+
+
+class TestTaxonomyCache(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.folder = tempfile.mkdtemp()
+        self.taxonomy_file = os.path.join(self.folder, 'rankedlineage.txt')
+        self.write_taxonomy(['562\tEscherichia coli\td__Bacteria'])
+        config_file = write_config(
+            self.folder,
+            ncbi=ncbi_section(subsets={
+                'destination_folder': 'subsets/',
+                'entrez_email': 'rdm@example.org',
+                'taxonomy_file': self.taxonomy_file,
+                'nt_file': os.path.join(self.folder, 'nt'),
+                'ext_accID': '.accID',
+                'ext_sequence': '.fasta',
+                'ext_taxonomy': '.taxon',
+                'batch_size': 4000,
+                'query_set': ['CO1p | COI']}))
+        self.fixture = NcbiSubsetData(config_file)
+
+    @classmethod
+    def tearDownClass(self):
+        if isinstance(self.fixture.taxonomy, TaxonomyIndex):
+            self.fixture.taxonomy.close()
+        os.chdir(tempfile.gettempdir())
+        shutil.rmtree(self.folder)
+
+    @classmethod
+    def write_taxonomy(self, lines):
+        with open(self.taxonomy_file, 'w') as f:
+            f.write('taxon_id\ttaxon_name\td__domain\n')
+            for line in lines:
+                f.write(line + '\n')
+
+    def set_mtime(self, delta):
+        """Move the modification time of the taxonomy file by delta"""
+        stat = os.stat(self.taxonomy_file)
+        os.utime(self.taxonomy_file, (stat.st_atime, stat.st_mtime + delta))
+
+    def cache_files(self):
+        return sorted(f for f in os.listdir(self.fixture.backup_dir)
+                      if f.startswith('.taxonomy_') and f.endswith('.idx'))
+
+    def test_1_one_load_for_all_subsets(self):
+        print('Check the subsets of a run share one load of the taxonomy...')
+        with mock.patch.object(self.fixture, 'load_taxonomy',
+                               wraps=self.fixture.load_taxonomy) as load:
+            first = self.fixture.get_taxonomy_provider()
+            second = self.fixture.get_taxonomy_provider()
+        self.assertEqual(load.call_count, 1)
+        self.assertIs(first, second)
+        self.assertEqual(first[562], 'd__Bacteria')
+
+    def test_2_reload_on_change(self):
+        print('Check a new modification time or size reloads the taxonomy...')
+        with mock.patch.object(self.fixture, 'load_taxonomy',
+                               wraps=self.fixture.load_taxonomy) as load:
+            self.set_mtime(10)
+            self.fixture.get_taxonomy_provider()
+            self.assertEqual(load.call_count, 1)
+            stat = os.stat(self.taxonomy_file)
+            self.write_taxonomy(['562\tEscherichia coli\td__Bacteria',
+                                 '2\tBacteria\td__Bacteria'])
+            os.utime(self.taxonomy_file, (stat.st_atime, stat.st_mtime))
+            taxonomy = self.fixture.get_taxonomy_provider()
+            self.assertEqual(load.call_count, 2)
+            self.fixture.get_taxonomy_provider()
+            self.assertEqual(load.call_count, 2)
+        self.assertEqual(taxonomy[2], 'd__Bacteria')
+
+    def test_3_persisted_cache(self):
+        print('Check the cached index is built once and reused...')
+        self.fixture.taxonomy_cache = True
+        self.fixture.taxonomy_key = None
+        taxonomy = self.fixture.get_taxonomy_provider()
+        self.assertIsInstance(taxonomy, TaxonomyIndex)
+        cache_files = self.cache_files()
+        self.assertEqual(len(cache_files), 1)
+        # A new run finds the index of the previous one
+        self.fixture.taxonomy_key = None
+        with mock.patch.object(TaxonomyIndex, 'build') as build:
+            taxonomy = self.fixture.get_taxonomy_provider()
+        build.assert_not_called()
+        self.assertEqual(taxonomy.index_file,
+                         os.path.join(self.fixture.backup_dir,
+                                      cache_files[0]))
+
+    def test_4_stale_cache_removed(self):
+        print('Check the index of an older taxonomy file is replaced...')
+        old_cache_files = self.cache_files()
+        self.set_mtime(10)
+        taxonomy = self.fixture.get_taxonomy_provider()
+        cache_files = self.cache_files()
+        self.assertEqual(len(cache_files), 1)
+        self.assertNotEqual(cache_files, old_cache_files)
+        self.assertTrue(taxonomy.describes(self.taxonomy_file))
+
+    def test_5_index_next_to_taxonomy(self):
+        print('Check the index of the taxonomy update is used if current...')
+        self.fixture.taxonomy_cache = False
+        index_file = os.path.join(self.folder, 'rankedlineage.idx')
+        TaxonomyIndex.build(self.taxonomy_file, index_file)
+        self.fixture.taxonomy_key = None
+        taxonomy = self.fixture.get_taxonomy_provider()
+        self.assertEqual(taxonomy.index_file, index_file)
+        # Built from another version of the text file: loaded instead
+        self.set_mtime(10)
+        self.assertIsInstance(self.fixture.get_taxonomy_provider(), dict)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import shutil
+import tempfile
+import unittest
+from brdm.TaxonomyIndex import TaxonomyIndex
+
+
+class TestTaxonomyIndex(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.folder = tempfile.mkdtemp()
+        self.taxonomy_file = os.path.join(self.folder, 'rankedlineage.txt')
+        self.index_file = os.path.join(self.folder, 'rankedlineage.idx')
+        self.lineage = 'd__Bacteria; k__; p__Proteobacteria; ' \
+            + 'c__Gammaproteobacteria; o__Enterobacterales; ' \
+            + 'f__Enterobacteriaceae; g__Escherichia; s__'
+        with open(self.taxonomy_file, 'w') as f:
+            f.write('taxon_id\ttaxon_name\td__domain; k__kingdom; '
+                    + 'p__phylum; c__class; o__order; f__family; '
+                    + 'g__genus; s__species\n')
+            f.write('562\tEscherichia coli\t' + self.lineage + '\n')
+            f.write('2\tBacteria\td__Bacteria; k__; p__; c__; o__; f__; '
+                    + 'g__; s__\n')
+            f.write('561\tEscherichia\t' + self.lineage + '\n')
+            f.write('9606\tHomo sapiens\td__Eukaryota; k__Metazoa; '
+                    + 'p__Chordata; c__Mammalia; o__Primates; '
+                    + 'f__Hominidae; g__Homo; s__Ä\n')
+
+    @classmethod
+    def tearDownClass(self):
+        shutil.rmtree(self.folder)
+
+    def test_1_build(self):
+        print('Check the index holds every taxid and distinct lineage...')
+        self.assertEqual(TaxonomyIndex.build(self.taxonomy_file,
+                                             self.index_file), 4)
+        index = TaxonomyIndex(self.index_file)
+        self.assertEqual(len(index), 4)
+        self.assertEqual(index.lineages, 3)
+        index.close()
+
+    def test_2_lookup(self):
+        print('Check lineages are found by taxid...')
+        index = TaxonomyIndex(self.index_file)
+        self.assertEqual(index[562], self.lineage)
+        self.assertEqual(index.get('561'), self.lineage)
+        self.assertTrue(index[9606].endswith('s__Ä'))
+        self.assertTrue(2 in index)
+        self.assertFalse(3 in index)
+        self.assertIsNone(index.get(10000))
+        with self.assertRaises(KeyError):
+            index[1]
+        index.close()
+
+    def test_3_not_an_index(self):
+        print('Check a file that is not an index is refused...')
+        with self.assertRaises(ValueError):
+            TaxonomyIndex(self.taxonomy_file)
+
+    def test_4_describes(self):
+        print('Check the index recognizes the version of the text file...')
+        index = TaxonomyIndex(self.index_file)
+        self.assertTrue(index.describes(self.taxonomy_file))
+        # A copy keeping the modification time, as backup and restore do
+        copy_folder = os.path.join(self.folder, 'restored')
+        os.mkdir(copy_folder)
+        for f in (self.taxonomy_file, self.index_file):
+            shutil.copy2(f, copy_folder)
+        self.assertTrue(index.describes(
+            os.path.join(copy_folder, 'rankedlineage.txt')))
+        stat = os.stat(self.taxonomy_file)
+        os.utime(self.taxonomy_file, (stat.st_atime, stat.st_mtime + 10))
+        self.assertFalse(index.describes(self.taxonomy_file))
+        index.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
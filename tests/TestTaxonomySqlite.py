@@ -0,0 +1,94 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from brdm.NcbiTaxonomyData import NcbiTaxonomyData
+
+
+class TestTaxonomySqlite(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.folder = tempfile.mkdtemp()
+        # rankedlineage.dmp: tax_id, tax_name, species, genus, family,
+        # order, class, phylum, kingdom and superkingdom
+        self.taxa = [
+            ['2', 'Bacteria', '', '', '', '', '', '', '', 'Bacteria'],
+            ['562', 'Escherichia coli', '', 'Escherichia',
+             'Enterobacteriaceae', 'Enterobacterales',
+             'Gammaproteobacteria', 'Proteobacteria', '', 'Bacteria'],
+            ['9606', 'Homo sapiens', '', 'Homo', 'Hominidae', 'Primates',
+             'Mammalia', 'Chordata', 'Metazoa', 'Eukaryota']]
+        self.dmp_file = os.path.join(self.folder, 'rankedlineage.dmp')
+        self.write_dmp(self.dmp_file, self.taxa)
+        self.db_file = os.path.join(self.folder, 'rankedlineage.sqlite')
+
+    @classmethod
+    def tearDownClass(self):
+        os.chdir(tempfile.gettempdir())
+        shutil.rmtree(self.folder)
+
+    @staticmethod
+    def write_dmp(dmp_file, taxa):
+        with open(dmp_file, 'w') as f:
+            for taxon in taxa:
+                f.write('\t|\t'.join(taxon) + '\t|\n')
+
+    def test_1_load(self):
+        print('Check every taxon is loaded with its taxid as key...')
+        rows = NcbiTaxonomyData.write_taxonomy_sqlite(self.dmp_file,
+                                                      self.db_file)
+        self.assertEqual(rows, len(self.taxa))
+        self.assertFalse(os.path.exists(self.db_file + '.tmp'))
+        connection = sqlite3.connect(self.db_file)
+        try:
+            self.assertEqual(connection.execute(
+                'SELECT COUNT(*) FROM taxonomy').fetchone()[0], 3)
+            columns = connection.execute(
+                'PRAGMA table_info(taxonomy)').fetchall()
+            # name and pk of each column
+            self.assertEqual([(c[1], c[5]) for c in columns if c[5]],
+                             [('taxid', 1)])
+            self.assertEqual(connection.execute(
+                'SELECT name FROM taxonomy WHERE taxid = 562').fetchone(),
+                ('Escherichia coli',))
+            with self.assertRaises(sqlite3.IntegrityError):
+                connection.execute('INSERT INTO taxonomy (taxid) '
+                                   'VALUES (562)')
+            indexes = connection.execute(
+                'PRAGMA index_list(taxonomy)').fetchall()
+            self.assertIn('taxonomy_name', [i[1] for i in indexes])
+            self.assertEqual(connection.execute(
+                'PRAGMA index_info(taxonomy_name)').fetchall()[0][2], 'name')
+        finally:
+            connection.close()
+
+    def test_2_lineage(self):
+        print('Check the lineages match the taxonomy file...')
+        taxonomy_file = os.path.join(self.folder, 'rankedlineage.txt')
+        NcbiTaxonomyData.write_taxonomy(self.dmp_file, taxonomy_file)
+        with open(taxonomy_file) as f:
+            next(f)
+            expected = dict(line.rstrip('\n').split('\t')[::2] for line in f)
+        connection = sqlite3.connect(self.db_file)
+        try:
+            lineages = dict(connection.execute(
+                'SELECT taxid, lineage FROM taxonomy'))
+        finally:
+            connection.close()
+        self.assertEqual({str(k): v for k, v in lineages.items()}, expected)
+
+    def test_3_malformed_line(self):
+        print('Check a malformed dump leaves no database behind...')
+        dmp_file = os.path.join(self.folder, 'malformed.dmp')
+        db_file = os.path.join(self.folder, 'malformed.sqlite')
+        self.write_dmp(dmp_file, self.taxa[:2] + [['9606', 'Homo sapiens']])
+        with self.assertRaises(ValueError):
+            NcbiTaxonomyData.write_taxonomy_sqlite(dmp_file, db_file)
+        self.assertFalse(os.path.exists(db_file))
+        self.assertFalse(os.path.exists(db_file + '.tmp'))
+
+
+if __name__ == '__main__':
+    unittest.main()